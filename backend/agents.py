@@ -1,112 +1,418 @@
 import os
+import copy
 import json
+import asyncio
 import logging
+from collections import Counter
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-import google.generativeai as genai
 from llama_cpp import Llama
 
+from backend.prompt_cache import PromptStateCache, make_key
+from backend.streaming import IncrementalJSONParser
+from backend.result_cache import MISS, ResultCache, cached_result
+from backend.gemini import GeminiGateway, GeminiTransport, HttpGeminiTransport
+from backend.retrieval import DocumentIndexStore
+from backend.analytics import analytics_digest
+from backend.analysis import merge_topics, split_document
+from backend.triage import AnswerTriage
+from backend.speculative import SPECULATIVE_MODES, CountingDraftModel, SpeculativeStats, make_drafter
+from backend.grammar import (
+    DEFAULT_MAX_FEEDBACK_CHARS, DEFAULT_MAX_ITEM_CHARS, DEFAULT_MAX_LIST_ITEMS,
+    evaluation_gbnf, evaluation_grammar
+)
+from backend.metrics import (
+    COMPLETION_TOKENS, MODEL_LOADS, PARSE_FALLBACKS, PROMPT_TOKENS, instrumented, phase
+)
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Evaluator prompt truncation limits (characters)
+MAX_QUESTION_CHARS = 800
+MAX_ANSWER_CHARS = 2500
+
+# Increased temperature to 0.4 to allow more variance in scoring
+EVALUATOR_SAMPLING = {
+    "temperature": 0.4,
+    "max_tokens": 512,
+    "top_p": 0.95,
+    "repeat_penalty": 1.1,
+}
+
+# Returned when the evaluator output cannot be parsed as JSON
+PARSE_FALLBACK_EVALUATION = {
+    "score_30": 15,
+    "key_coverage": 50,
+    "missing_concepts": ["Could not parse evaluation"],
+    "hallucinations": [],
+    "bias_check": False,
+    "feedback": "Error parsing model response."
+}
+
+# Returned when the document analysis is not valid JSON
+ANALYSIS_FALLBACK = {
+    "topics": ["General Concepts", "Core Principles", "Advanced Topics"],
+    "summary": "Course material analysis",
+    "suggested_difficulty": "Medium"
+}
+
+DIFFICULTY_GUIDELINES = {
+    "Easy": "Basic recall and understanding. Simple definitions or concepts.",
+    "Medium": "Application and analysis. Requires connecting concepts.",
+    "Hard": "Critical thinking and synthesis. Complex reasoning required."
+}
+
+# Returned when the dashboard generation fails
+DASHBOARD_FALLBACK = {
+    "strengths_summary": "Completed questions.",
+    "areas_for_improvement": "Continue practicing.",
+    "recommendations": ["Review course materials"]
+}
+
+GEMINI_MODEL_NAME = 'gemini-2.5-flash'
+
+# Improved system prompt to encourage score differentiation
+EVALUATOR_SYSTEM_PROMPT = """You are "Edu-Distill Student", a strict academic evaluator.
+Your task is to grade the student's answer based EXCLUSIVELY on the provided Context and Question.
+
+🚨 ZERO TOLERANCE POLICY (CRITICAL):
+- If the answer is gibberish (e.g., "uanamodmiop", "asdf"), random characters, or completely irrelevant to the topic: **SCORE MUST BE 0**.
+- Do not interpret nonsense. If it makes no sense, the score is 0.
+- If the student admits they don't know: **SCORE IS 0**.
+
+SCORING RUBRIC (0-30):
+- **0-5 (Fail):** Nonsense, random text, irrelevant, or factually dangerous/completely wrong answers.
+- **6-17 (Insufficient):** Vague, too short, uses keywords without understanding, or contains logical contradictions.
+- **18-23 (Pass):** Correct but basic. Hits the main points but lacks depth or nuance.
+- **24-30 (Excellent):** Detailed, precise, demonstrates mastery of the context.
+
+KEY COVERAGE LOGIC (CRITICAL):
+- Do NOT output static numbers like 83% repeatedly. Estimate purely based on facts found vs. missing.
+- **100%:** The answer contains ALL key facts from the context required by the question.
+- **50-80%:** The answer is correct but misses minor details or context.
+- **10-40%:** The answer misses major core concepts.
+- **0%:** The answer is wrong or irrelevant.
+- **CONSTRAINT:** If 'missing_concepts' list is NOT empty, 'key_coverage' MUST be less than 90.
+
+TRICK QUESTIONS & HALLUCINATIONS:
+- Watch out for "confident bullshit". If the answer sounds professional but is logically wrong (hallucination), penalize heavily.
+- Verify terms against the Context. If the student invents terms, list them in "hallucinations".
+
+Return ONLY a valid JSON with these fields:
+- "score_30": (int 0-30) The grade.
+- "key_coverage": (int 0-100) Percentage of key concepts covered.
+- "missing_concepts": (list[str]) Key concepts missing from the answer (in English).
+- "hallucinations": (list[str]) False/invented statements found in the answer.
+- "bias_check": (bool) True if language is inappropriate/biased.
+- "feedback": (str) Brief technical feedback for the professor."""
+
 class EduAgents:
     """Main agent orchestrator using Gemini API and local distilled model"""
     
-    def __init__(self):
-        """Initialize Gemini client and local model configuration"""
+    def __init__(
+        self,
+        gemini_transport: Optional[GeminiTransport] = None,
+        llama_factory: Optional[Callable[..., Llama]] = None,
+    ):
+        """
+        Initialize Gemini client and local model configuration.
+
+        `gemini_transport` replaces the HTTP transport (e.g. a
+        FakeGeminiTransport for load tests); no API key is needed then.
+        `llama_factory` replaces the `Llama` constructor of the evaluator
+        (e.g. backend.loadtest.FakeLlama); no model file is needed then.
+        """
         env_path = Path(__file__).parent.parent / ".env"
         load_dotenv(dotenv_path=env_path)
         
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError(
-                "GEMINI_API_KEY not found in .env file. "
-                "Please add your Gemini API key."
+        if gemini_transport is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError(
+                    "GEMINI_API_KEY not found in .env file. "
+                    "Please add your Gemini API key."
+                )
+            gemini_transport = HttpGeminiTransport(
+                api_key, max_connections=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
             )
         
-        genai.configure(api_key=api_key)
-        
-        # Initialize Gemini 2.5 models
-        self.teacher_model = genai.GenerativeModel('gemini-2.5-flash')  # Document analysis
-        self.conversation_model = genai.GenerativeModel('gemini-2.5-flash')  # Question generation
-        self.dashboard_model = genai.GenerativeModel('gemini-2.5-flash')  # Dashboard generation
+        # One shared gateway for the Gemini 2.5 agents (analysis, questions, dashboard)
+        self.gemini = GeminiGateway.from_env(gemini_transport)
         
         # Lazy loading for local evaluator model (GGUF format)
         self.evaluator_model = None
         self.model_path = Path(__file__).parent.parent / "models" / "qwen_evaluator_q4_k_m.gguf"
         self.model_loaded = False
+        self.llama_factory = llama_factory
         self.last_raw_response = None
         self.model_n_ctx = None
+        # One evaluator instance per context size, e.g. "4096,8192"
+        self.ctx_buckets = sorted(
+            int(n) for n in os.getenv("EVALUATOR_CTX_BUCKETS", "4096,8192").split(",") if n.strip()
+        )
+        self.evaluator_models: Dict[int, Llama] = {}
+        # Bounds of the schema grammar: list items, characters per item, feedback characters
+        self.grammar_bounds = (
+            int(os.getenv("EVALUATOR_MAX_LIST_ITEMS", str(DEFAULT_MAX_LIST_ITEMS))),
+            int(os.getenv("EVALUATOR_MAX_ITEM_CHARS", str(DEFAULT_MAX_ITEM_CHARS))),
+            int(os.getenv("EVALUATOR_MAX_FEEDBACK_CHARS", str(DEFAULT_MAX_FEEDBACK_CHARS))),
+        )
+        # llama.cpp load options; mlock pins the weights in RAM (needs RLIMIT_MEMLOCK)
+        self.llama_options = {
+            "n_gpu_layers": int(os.getenv("EVALUATOR_N_GPU_LAYERS", "-1")),
+            "n_threads": int(os.getenv("EVALUATOR_N_THREADS", "4")),
+            "use_mmap": os.getenv("EVALUATOR_USE_MMAP", "1") == "1",
+            "use_mlock": os.getenv("EVALUATOR_USE_MLOCK", "0") == "1",
+        }
+        self.warmup_tokens = int(os.getenv("EVALUATOR_WARMUP_TOKENS", "8"))
+        # Opt-in speculative decoding: prompt_lookup drafts n-grams copied from
+        # the prompt, draft_model runs a smaller GGUF with the same vocabulary
+        self.speculative_mode = os.getenv("EVALUATOR_SPECULATIVE", "off")
+        if self.speculative_mode not in SPECULATIVE_MODES:
+            raise ValueError(f"EVALUATOR_SPECULATIVE must be one of {SPECULATIVE_MODES}")
+        self.draft_tokens = int(os.getenv("EVALUATOR_DRAFT_TOKENS", "8"))
+        self.draft_ngram = int(os.getenv("EVALUATOR_DRAFT_NGRAM", "3"))
+        self.draft_model_path = Path(os.getenv("EVALUATOR_DRAFT_MODEL_PATH", ""))
+        self.draft_model: Optional[Llama] = None
+        self.speculative = (
+            SpeculativeStats(self.speculative_mode, self.draft_tokens) if self.speculative_mode != "off" else None
+        )
+        self.state_cache = PromptStateCache.from_env()
+        self.result_cache = ResultCache.from_env()
+        # Agents see the passages relevant to the topic/question, not a fixed slice
+        self.documents = DocumentIndexStore.from_env()
+        self.question_context_tokens = int(os.getenv("RETRIEVAL_QUESTION_TOKENS", "750"))
+        self.evaluator_context_tokens = int(os.getenv("RETRIEVAL_EVALUATOR_TOKENS", "2000"))
+        # The dashboard prompt carries a fixed-size digest, not the evaluations
+        self.dashboard_top_concepts = int(os.getenv("DASHBOARD_TOP_CONCEPTS", "5"))
+        self.dashboard_concept_chars = int(os.getenv("DASHBOARD_CONCEPT_CHARS", "60"))
+        # Long documents are analyzed in chunks, concurrently, then merged
+        self.analysis_chunk_chars = int(os.getenv("ANALYSIS_CHUNK_CHARS", "16000"))
+        self.analysis_parallelism = int(os.getenv("ANALYSIS_PARALLELISM", "4"))
+        self.analysis_merge_topics = int(os.getenv("ANALYSIS_MERGE_TOPICS", "40"))
+        # Empty, "I don't know" and gibberish answers get a 0 without the evaluator
+        self.triage = AnswerTriage.from_env()
 
-    def analyze_document(self, pdf_text: str) -> Dict:
+    def _cache_identity(self, agent: str) -> Dict:
+        """Model identity and generation settings that a cached result depends on."""
+        if agent == "evaluate_answer":
+            return {
+                "model": self._weights_fingerprint() if self.model_path.exists() else str(self.model_path),
+                "sampling": EVALUATOR_SAMPLING,
+                "system_prompt": make_key(EVALUATOR_SYSTEM_PROMPT),
+                "grammar": make_key(evaluation_gbnf(*self.grammar_bounds)),
+                "retrieval": dict(self.documents.settings(), tokens=self.evaluator_context_tokens),
+            }
+        if agent in ("generate_question", "generate_question_set"):
+            return {
+                "model": GEMINI_MODEL_NAME,
+                "retrieval": dict(self.documents.settings(), tokens=self.question_context_tokens),
+            }
+        if agent == "analyze_document":
+            return {
+                "model": GEMINI_MODEL_NAME,
+                "chunking": {"chars": self.analysis_chunk_chars, "merge_topics": self.analysis_merge_topics},
+            }
+        if agent == "generate_dashboard_feedback":
+            return {
+                "model": GEMINI_MODEL_NAME,
+                "digest": {"top_concepts": self.dashboard_top_concepts, "concept_chars": self.dashboard_concept_chars},
+            }
+        return {"model": GEMINI_MODEL_NAME}
+
+    def _evaluation_cache_key(self, context: str, question: str, student_answer: str) -> Optional[str]:
+        """Result-cache key shared by evaluate_answer, its streaming and batch variants."""
+        if self.result_cache is None or not self.result_cache.enabled_for("evaluate_answer"):
+            return None
+        return self.result_cache.make_key(
+            "evaluate_answer",
+            self._cache_identity("evaluate_answer"),
+            {"context": context, "question": question, "student_answer": student_answer},
+        )
+
+    def document_chunks(self, pdf_text: str) -> List[str]:
+        """The chunks a document is analyzed in (a single one for short documents)."""
+        return split_document(pdf_text, self.analysis_chunk_chars) or [pdf_text]
+
+    @instrumented("analyze_document")
+    @cached_result("analyze_document", skip=lambda result: result == ANALYSIS_FALLBACK, ignore=("chunks",))
+    async def analyze_document(self, pdf_text: str, chunks: Optional[List[str]] = None) -> Dict:
         """
         Agent 1: Document Analyzer (Gemini 2.5)
-        Extracts topics and suggests difficulty levels from PDF content
+        Extracts topics and suggests difficulty levels from PDF content,
+        covering the whole document (see analyze_document_chunks).
+        `chunks` are its precomputed document_chunks, if any.
+        """
+        if chunks is None:
+            chunks = self.document_chunks(pdf_text)
+        return await self.analyze_document_chunks(chunks)
+
+    async def analyze_document_chunks(self, chunks: List[str], on_chunk: Optional[Callable[[], None]] = None) -> Dict:
         """
+        Map-reduce analysis: every chunk is analyzed on its own, at most
+        `analysis_parallelism` at a time, then the partial topic lists are
+        merged. `on_chunk()` is called as each chunk finishes.
+        """
+        if len(chunks) == 1:
+            analysis = await self.analyze_document_chunk(chunks[0], 1, 1)
+            if on_chunk is not None:
+                on_chunk()
+            return analysis if analysis is not None else dict(ANALYSIS_FALLBACK)
+
+        semaphore = asyncio.Semaphore(self.analysis_parallelism)
+
+        async def analyze(index: int, chunk: str) -> Optional[Dict]:
+            async with semaphore:
+                partial = await self.analyze_document_chunk(chunk, index + 1, len(chunks))
+            if on_chunk is not None:
+                on_chunk()
+            return partial
+
+        tasks = [asyncio.ensure_future(analyze(index, chunk)) for index, chunk in enumerate(chunks)]
         try:
-            prompt = f"""You are an educational content analyzer. Analyze this course material and extract key topics.
+            partials = await asyncio.gather(*tasks)
+        finally:
+            # One failed chunk fails the analysis: the others are not waited for
+            for task in tasks:
+                task.cancel()
+        return await self.merge_document_analyses([partial for partial in partials if partial is not None])
+
+    @staticmethod
+    def _parse_json_reply(response_text: str):
+        text = response_text.strip()
+        if text.startswith("```json"):
+            text = text[7:]
+        if text.startswith("```"):
+            text = text[3:]
+        if text.endswith("```"):
+            text = text[:-3]
+        return json.loads(text.strip())
+
+    @instrumented("analyze_document_chunk")
+    @cached_result("analyze_document_chunk", skip=lambda result: result is None)
+    async def analyze_document_chunk(self, chunk: str, part: int, parts: int) -> Optional[Dict]:
+        """
+        Agent 1a: Document Analyzer, map step (Gemini 2.5)
+        Analyzes part `part` of `parts` of a document; a document in one part
+        gets the final analysis directly. Returns None when the reply is not
+        valid JSON.
+        """
+        if parts == 1:
+            task = """Analyze this course material and extract key topics.
 
 Course Material:
-{pdf_text[:5000]}  # Limit for efficiency
+{chunk}
 
 Return a JSON object with:
 1. "topics": Array of 3-5 main topics covered (as strings)
 2. "summary": Brief 1-sentence summary of the material
-3. "suggested_difficulty": Recommended difficulty level (Easy, Medium, or Hard)
+3. "suggested_difficulty": Recommended difficulty level (Easy, Medium, or Hard)"""
+        else:
+            task = f"""This is part {part} of {parts} of a course pack. Extract the topics of this part only.
 
-Return ONLY valid JSON, no markdown formatting."""
+Course Material (part {part} of {parts}):
+{{chunk}}
 
-            response = self.teacher_model.generate_content(prompt)
-            # Clean response if it contains markdown
-            text = response.text.strip()
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.startswith("```"):
-                text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-                
-            result = json.loads(text)
-            return result
-            
+Return a JSON object with:
+1. "topics": Array of up to 8 topics covered in this part (short noun phrases, as strings)
+2. "summary": Brief 1-sentence summary of this part
+3. "suggested_difficulty": Recommended difficulty level (Easy, Medium, or Hard)"""
+        prompt = f"""You are an educational content analyzer. {task.format(chunk=chunk)}
+
+Return ONLY valid JSON, no markdown formatting."""
+        try:
+            response_text = await self.gemini.generate(GEMINI_MODEL_NAME, prompt)
+            result = self._parse_json_reply(response_text)
+            return result if isinstance(result, dict) else None
         except json.JSONDecodeError:
-            return {
-                "topics": ["General Concepts", "Core Principles", "Advanced Topics"],
-                "summary": "Course material analysis",
-                "suggested_difficulty": "Medium"
-            }
+            logger.error(f"Error parsing analysis JSON of part {part}/{parts}")
+            return None
         except Exception as e:
             logger.error(f"Error analyzing document: {str(e)}")
             raise Exception(f"Error analyzing document: {str(e)}")
-    
-    def generate_question(
+
+    @instrumented("merge_document_analyses")
+    async def merge_document_analyses(self, partials: List[Dict]) -> Dict:
+        """
+        Agent 1b: Document Analyzer, reduce step (Gemini 2.5)
+        Merges the chunk analyses: topics are deduplicated locally, then
+        Gemini picks the main ones from the merged list and the chunk
+        summaries. Falls back to the most recurring topics.
+        """
+        if not partials:
+            return dict(ANALYSIS_FALLBACK)
+        topics = merge_topics([p.get("topics") or [] for p in partials if isinstance(p.get("topics"), list)],
+                              self.analysis_merge_topics)
+        summaries = [p["summary"].strip() for p in partials if isinstance(p.get("summary"), str) and p["summary"].strip()]
+        difficulties = Counter(p.get("suggested_difficulty") for p in partials
+                               if p.get("suggested_difficulty") in DIFFICULTY_GUIDELINES)
+        fallback = {
+            "topics": [topic for topic, _ in topics[:5]] or ANALYSIS_FALLBACK["topics"],
+            "summary": summaries[0] if summaries else ANALYSIS_FALLBACK["summary"],
+            "suggested_difficulty": difficulties.most_common(1)[0][0] if difficulties else ANALYSIS_FALLBACK["suggested_difficulty"],
+        }
+
+        candidates = "\n".join(f"- {topic} (in {count} of {len(partials)} parts)" for topic, count in topics)
+        part_summaries = "\n".join(f"{index}. {summary}" for index, summary in enumerate(summaries, 1))
+        prompt = f"""You are an educational content analyzer. A course pack was analyzed in {len(partials)} parts.
+
+Topics found, most recurring first:
+{candidates}
+
+Summary of each part:
+{part_summaries}
+
+Suggested difficulty per part: {dict(difficulties)}
+
+Return a JSON object for the whole course pack with:
+1. "topics": Array of 3-5 main topics covered (as strings), merging near-duplicates
+2. "summary": Brief 1-sentence summary of the material
+3. "suggested_difficulty": Recommended difficulty level (Easy, Medium, or Hard)
+
+Return ONLY valid JSON, no markdown formatting."""
+        try:
+            response_text = await self.gemini.generate(GEMINI_MODEL_NAME, prompt)
+            result = self._parse_json_reply(response_text)
+        except json.JSONDecodeError:
+            logger.error("Error parsing merged analysis JSON, keeping the most recurring topics")
+            return fallback
+        except Exception as e:
+            logger.error(f"Error merging document analysis: {str(e)}")
+            raise Exception(f"Error analyzing document: {str(e)}")
+        if not isinstance(result, dict) or not isinstance(result.get("topics"), list) or not result["topics"]:
+            return fallback
+        # Gemini may still repeat a topic under two spellings
+        result["topics"] = [topic for topic, _ in merge_topics([result["topics"]], len(result["topics"]))]
+        return dict(fallback, **result)
+
+    @instrumented("generate_question")
+    @cached_result("generate_question")
+    async def generate_question(
         self, 
         context: str, 
         topic: str, 
         difficulty: str,
-        question_number: int = 1
+        question_number: int = 1,
+        total_questions: int = 3
     ) -> str:
         """
         Agent 2: Question Generator (Gemini 2.5)
         Generates a single question based on context, topic, and difficulty
         """
         try:
-            difficulty_guidelines = {
-                "Easy": "Basic recall and understanding. Simple definitions or concepts.",
-                "Medium": "Application and analysis. Requires connecting concepts.",
-                "Hard": "Critical thinking and synthesis. Complex reasoning required."
-            }
-            
+            with phase("retrieval"):
+                passages = self.documents.passages(context, topic, self.question_context_tokens)
             prompt = f"""You are a university professor creating exam questions.
 
 Context from course material:
-{context[:3000]}
+{passages}
 
-Create question #{question_number} of 3 total questions.
+Create question #{question_number} of {total_questions} total questions.
 Topic: {topic}
-Difficulty: {difficulty} - {difficulty_guidelines.get(difficulty, '')}
+Difficulty: {difficulty} - {DIFFICULTY_GUIDELINES.get(difficulty, '')}
 
 Requirements:
 - Question should be clear and specific
@@ -117,229 +423,604 @@ Requirements:
 
 Return ONLY the question text, nothing else."""
 
-            response = self.conversation_model.generate_content(prompt)
-            return response.text.strip()
+            response_text = await self.gemini.generate(GEMINI_MODEL_NAME, prompt)
+            return response_text.strip()
             
         except Exception as e:
             logger.error(f"Error generating question: {str(e)}")
             raise Exception(f"Error generating question: {str(e)}")
 
+    @instrumented("generate_question_set")
+    @cached_result("generate_question_set", skip=lambda result: not result)
+    async def generate_question_set(self, context: str, topic: str, difficulty: str, count: int = 3) -> List[str]:
+        """
+        Agent 2b: Question Set Generator (Gemini 2.5)
+        Generates all `count` questions of a quiz in one call, distinct and in
+        the order they should be asked. Returns what could be parsed, which
+        may be fewer than `count` questions (or none).
+        """
+        try:
+            with phase("retrieval"):
+                passages = self.documents.passages(context, topic, self.question_context_tokens)
+            prompt = f"""You are a university professor creating exam questions.
+
+Context from course material:
+{passages}
+
+Create {count} exam questions.
+Topic: {topic}
+Difficulty: {difficulty} - {DIFFICULTY_GUIDELINES.get(difficulty, '')}
+
+Requirements:
+- Each question should be clear and specific
+- Each question covers a different aspect of the topic
+- Based ONLY on the provided context
+- Appropriate for {difficulty} difficulty level
+- Encourage detailed, thoughtful answers
+- Do NOT include the answers
+
+Return ONLY a JSON array of {count} question strings, nothing else."""
+
+            response_text = await self.gemini.generate(GEMINI_MODEL_NAME, prompt)
+            text = response_text.strip()
+            if text.startswith("```json"):
+                text = text[7:]
+            if text.startswith("```"):
+                text = text[3:]
+            if text.endswith("```"):
+                text = text[:-3]
+
+            questions = json.loads(text.strip())
+            if isinstance(questions, dict):
+                questions = questions.get("questions", [])
+            return [q.strip() for q in questions if isinstance(q, str) and q.strip()][:count]
+
+        except json.JSONDecodeError:
+            logger.error("Error parsing question set JSON")
+            return []
+        except Exception as e:
+            logger.error(f"Error generating question set: {str(e)}")
+            raise Exception(f"Error generating question set: {str(e)}")
+
+    def with_model(self, model_path: Path, max_ctx: Optional[int] = None) -> "EduAgents":
+        """
+        A copy of these agents that serves another evaluator GGUF.
+
+        The copy shares the Gemini gateway, the caches (their keys include the
+        weights fingerprint) and the document indexes, and loads its own
+        evaluator instances on first use. Context buckets above `max_ctx` are
+        dropped.
+        """
+        clone = copy.copy(self)
+        clone.model_path = Path(model_path)
+        clone.evaluator_models = {}
+        clone.evaluator_model = None
+        clone.model_loaded = False
+        clone.model_n_ctx = None
+        clone.draft_model = None
+        clone.last_raw_response = None
+        if max_ctx:
+            clone.ctx_buckets = [n_ctx for n_ctx in self.ctx_buckets if n_ctx <= max_ctx] or [max_ctx]
+        clone.speculative = (
+            SpeculativeStats(self.speculative_mode, self.draft_tokens) if self.speculative is not None else None
+        )
+        return clone
+
     def _unload_evaluator_model(self):
-        """Unload the evaluator model to free memory."""
-        if self.evaluator_model is not None:
+        """Unload every evaluator instance to free memory."""
+        if self.evaluator_models:
             try:
-                del self.evaluator_model
+                self.evaluator_models.clear()
                 self.evaluator_model = None
+                self.draft_model = None
                 self.model_loaded = False
                 self.model_n_ctx = None
                 logger.info("🔄 Evaluator model unloaded")
             except Exception as e:
                 logger.warning(f"⚠️ Error unloading model: {str(e)}")
     
-    def _load_evaluator_model(self, force_reload=False, n_ctx=4096):
-        """Lazy load the local Qwen evaluator model in GGUF format."""
-        needs_reload = (
-            self.evaluator_model is None or 
-            force_reload or 
-            (self.model_n_ctx is not None and self.model_n_ctx < n_ctx)
-        )
+    def _load_evaluator_model(self, force_reload=False):
+        """
+        Lazy load the local Qwen evaluator model in GGUF format.
+
+        One instance is created per context bucket. The weights are mmapped,
+        so the instances share the same pages and only the KV caches are
+        allocated per bucket; requests that need a bigger context are routed
+        to a bigger bucket instead of reloading the model.
+        """
+        if self.evaluator_models and not force_reload:
+            return
+
+        reload = bool(self.evaluator_models)
+        if reload:
+            self._unload_evaluator_model()
+        if self.llama_factory is None and not self.model_path.exists():
+            raise FileNotFoundError(
+                f"Evaluator model not found at {self.model_path}. "
+                "Please ensure the model file qwen_evaluator_q4_k_m.gguf is in the models/ directory."
+            )
         
-        if needs_reload:
-            if self.evaluator_model is not None:
-                self._unload_evaluator_model()
-            if not self.model_path.exists():
-                raise FileNotFoundError(
-                    f"Evaluator model not found at {self.model_path}. "
-                    "Please ensure the model file qwen_evaluator_q4_k_m.gguf is in the models/ directory."
-                )
-            
-            try:
-                logger.info(f"🔄 Loading local evaluator model from: {self.model_path}")
-                self.evaluator_model = Llama(
-                    model_path=str(self.model_path),
-                    n_gpu_layers=-1,
-                    n_ctx=n_ctx,
-                    n_threads=4,
-                    verbose=False
-                )
-                self.model_n_ctx = n_ctx
-                self.model_loaded = True
-                logger.info(f"✅ Evaluator model loaded with n_ctx={n_ctx}")
-            except Exception as e:
-                logger.error(f"❌ Error loading evaluator model: {str(e)}")
-                raise Exception(f"Error loading evaluator model: {str(e)}")
+        try:
+            logger.info(f"🔄 Loading local evaluator model from: {self.model_path}")
+            with phase("model_load"):
+                if self.speculative_mode == "draft_model":
+                    self._load_draft_model()
+                for n_ctx in self.ctx_buckets:
+                    drafter = self._make_drafter()
+                    self.evaluator_models[n_ctx] = (self.llama_factory or Llama)(
+                        model_path=str(self.model_path),
+                        n_ctx=n_ctx,
+                        verbose=False,
+                        draft_model=drafter,
+                        # Verifying a draft needs a logits row per position; rows
+                        # are only written (and paged in) for generated tokens
+                        logits_all=drafter is not None,
+                        **self.llama_options
+                    )
+            MODEL_LOADS.inc(reload=str(reload).lower())
+            self._use_bucket(self.ctx_buckets[0])
+            self.model_loaded = True
+            logger.info(f"✅ Evaluator model loaded with n_ctx buckets {self.ctx_buckets}")
+        except Exception as e:
+            self.evaluator_models.clear()
+            self.draft_model = None
+            logger.error(f"❌ Error loading evaluator model: {str(e)}")
+            raise Exception(f"Error loading evaluator model: {str(e)}")
 
-    def evaluate_answer(
-        self, 
-        context: str, 
-        question: str, 
-        student_answer: str,
-        _retry_count=0
-    ) -> Dict:
+    def _load_draft_model(self):
+        """Load the draft GGUF, sized for the largest bucket and shared by all of them."""
+        if not self.draft_model_path.is_file():
+            raise FileNotFoundError(f"Draft model not found at '{self.draft_model_path}' (EVALUATOR_DRAFT_MODEL_PATH)")
+        self.draft_model = Llama(
+            model_path=str(self.draft_model_path),
+            n_ctx=self.ctx_buckets[-1],
+            verbose=False,
+            **self.llama_options
+        )
+        logger.info(f"✏️ Draft model loaded from: {self.draft_model_path}")
+
+    def _make_drafter(self) -> Optional[CountingDraftModel]:
         """
-        Agent 3: Answer Evaluator (Distilled Student Model - Local)
-        Evaluate student answer using the local Qwen model.
+        Drafter for one evaluator instance, or None when speculative decoding
+        is off. llama.cpp samples every drafted position from the evaluator
+        and keeps the draft only up to the first mismatch, so the output
+        distribution does not change; only accepted tokens save time.
         """
-        try:
-            was_loading = not self.model_loaded
-            self._load_evaluator_model()
-            
-            if was_loading:
-                logger.info("🚀 Using LOCAL Qwen evaluator model")
+        if self.speculative is None:
+            return None
+        drafter = make_drafter(self.speculative_mode, self.draft_tokens, self.draft_ngram, self.draft_model)
+        return CountingDraftModel(drafter, self.speculative)
 
-            # Improved system prompt to encourage score differentiation
-            # Improved system prompt to encourage score differentiation
-            system_prompt = """You are "Edu-Distill Student", a strict academic evaluator.
-Your task is to grade the student's answer based EXCLUSIVELY on the provided Context and Question.
+    def _begin_completion(self):
+        """Reset the acceptance tracking of the active evaluator's drafter."""
+        drafter = self.evaluator_model.draft_model
+        if drafter is not None:
+            drafter.begin()
 
-🚨 ZERO TOLERANCE POLICY (CRITICAL):
-- If the answer is gibberish (e.g., "uanamodmiop", "asdf"), random characters, or completely irrelevant to the topic: **SCORE MUST BE 0**.
-- Do not interpret nonsense. If it makes no sense, the score is 0.
-- If the student admits they don't know: **SCORE IS 0**.
+    def _use_bucket(self, n_ctx: int):
+        """Make the instance for `n_ctx` the active evaluator (calls are serialized by the caller)."""
+        self.evaluator_model = self.evaluator_models[n_ctx]
+        self.model_n_ctx = n_ctx
 
-SCORING RUBRIC (0-30):
-- **0-5 (Fail):** Nonsense, random text, irrelevant, or factually dangerous/completely wrong answers.
-- **6-17 (Insufficient):** Vague, too short, uses keywords without understanding, or contains logical contradictions.
-- **18-23 (Pass):** Correct but basic. Hits the main points but lacks depth or nuance.
-- **24-30 (Excellent):** Detailed, precise, demonstrates mastery of the context.
+    def _route_to_bucket(self, n_prompt_tokens: int) -> int:
+        """
+        Activate the smallest bucket that fits the prompt plus generation.
 
-KEY COVERAGE LOGIC (CRITICAL):
-- Do NOT output static numbers like 83% repeatedly. Estimate purely based on facts found vs. missing.
-- **100%:** The answer contains ALL key facts from the context required by the question.
-- **50-80%:** The answer is correct but misses minor details or context.
-- **10-40%:** The answer misses major core concepts.
-- **0%:** The answer is wrong or irrelevant.
-- **CONSTRAINT:** If 'missing_concepts' list is NOT empty, 'key_coverage' MUST be less than 90.
+        Returns the number of prompt tokens that still fit, which is smaller
+        than `n_prompt_tokens` only when even the largest bucket overflows.
+        """
+        needed = n_prompt_tokens + EVALUATOR_SAMPLING["max_tokens"]
+        for n_ctx in self.ctx_buckets:
+            if needed <= n_ctx:
+                self._use_bucket(n_ctx)
+                return n_prompt_tokens
+        largest = self.ctx_buckets[-1]
+        self._use_bucket(largest)
+        logger.warning(f"Prompt needs {needed} tokens, trimming context to fit n_ctx={largest}")
+        return largest - EVALUATOR_SAMPLING["max_tokens"]
 
-TRICK QUESTIONS & HALLUCINATIONS:
-- Watch out for "confident bullshit". If the answer sounds professional but is logically wrong (hallucination), penalize heavily.
-- Verify terms against the Context. If the student invents terms, list them in "hallucinations".
+    @staticmethod
+    def _trim_context_tokens(segment_tokens: List[List[int]], budget: int) -> List[List[int]]:
+        """Drop the oldest context tokens (like the character truncation) until the prompt fits `budget`."""
+        overflow = sum(len(part) for part in segment_tokens) - budget
+        if overflow <= 0:
+            return segment_tokens
+        context = segment_tokens[1]
+        if overflow >= len(context):
+            raise ValueError("Question and answer alone exceed the largest evaluator context")
+        return [segment_tokens[0], context[overflow:]] + segment_tokens[2:]
 
-Return ONLY a valid JSON with these fields:
-- "score_30": (int 0-30) The grade.
-- "key_coverage": (int 0-100) Percentage of key concepts covered.
-- "missing_concepts": (list[str]) Key concepts missing from the answer (in English).
-- "hallucinations": (list[str]) False/invented statements found in the answer.
-- "bias_check": (bool) True if language is inappropriate/biased.
-- "feedback": (str) Brief technical feedback for the professor."""
+    def _evaluator_segments(self, context: str, question: str, student_answer: str) -> List[str]:
+        """
+        Build the evaluator prompt as ordered text segments:
+        [system, context, question, answer].
 
+        The model is a Qwen2.5 fine-tune, so the ChatML layout below is the
+        same one llama.cpp renders from the GGUF chat template. Each segment
+        only depends on the ones before it, so the system prompt, the
+        document context and the question can each be served from a cached
+        prefix.
+        """
+        # Only the passages relevant to the question. Retrieval ignores the
+        # answer so every answer to a question shares the context prefix.
+        with phase("retrieval"):
+            context = self.documents.passages(context, question, self.evaluator_context_tokens)
+        # Truncation logic for speed
+        if len(question) > MAX_QUESTION_CHARS:
+            question = question[:MAX_QUESTION_CHARS] + "..."
 
-            # Truncation logic for speed
-            max_question_chars = 800
-            max_answer_chars = 2500
-            max_context_chars = 10000
-            
-            if len(question) > max_question_chars:
-                question = question[:max_question_chars] + "..."
-            if len(student_answer) > max_answer_chars:
-                student_answer = student_answer[:max_answer_chars] + "..."
-            if len(context) > max_context_chars:
-                context = "..." + context[-max_context_chars:]
+        return [
+            f"<|im_start|>system\n{EVALUATOR_SYSTEM_PROMPT}<|im_end|>\n<|im_start|>user\n",
+            f"Context: {context}",
+            f"\n\nQuestion: {question}\n\nStudent Answer:",
+            self._answer_segment(student_answer),
+        ]
 
-            user_message = f"""Context: {context}
+    @staticmethod
+    def _answer_segment(student_answer: str) -> str:
+        if len(student_answer) > MAX_ANSWER_CHARS:
+            student_answer = student_answer[:MAX_ANSWER_CHARS] + "..."
+        return f" {student_answer}<|im_end|>\n<|im_start|>assistant\n"
 
-Question: {question}
+    def _tokenize_segments(self, segments: List[str]) -> List[List[int]]:
+        """Tokenize each segment on its own so shared prefixes stay token-identical."""
+        return [
+            self.evaluator_model.tokenize(segment.encode("utf-8"), add_bos=(i == 0), special=True)
+            for i, segment in enumerate(segments)
+        ]
 
-Student Answer: {student_answer}"""
+    def _cached_prefix_len(self, tokens: List[int]) -> int:
+        """Number of leading `tokens` already evaluated in the KV cache."""
+        model = self.evaluator_model
+        cached = 0
+        for a, b in zip(model.input_ids[:model.n_tokens], tokens):
+            if a != b:
+                break
+            cached += 1
+        return cached
 
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ]
-            
-            logger.info("🔄 Generating evaluation...")
+    def _prefill(self, tokens: List[int]) -> int:
+        """
+        Make sure `tokens` are in the evaluator KV cache.
 
-            # Increased temperature to 0.4 to allow more variance in scoring
-            response = self.evaluator_model.create_chat_completion(
-                messages=messages,
-                temperature=0.4,
-                max_tokens=512,
-                top_p=0.95,
-                repeat_penalty=1.1,
-                response_format={"type": "json_object"}
-            )
+        Returns how many of them were already there. llama.cpp compares the
+        next prompt against the evaluated tokens and only runs the new
+        suffix, so a prefilled prefix is reused by every following
+        completion that starts with it.
+        """
+        model = self.evaluator_model
+        cached = self._cached_prefix_len(tokens)
+        if cached < len(tokens):
+            model.n_tokens = cached
+            # With a drafter llama.cpp keeps the logits of every evaluated
+            # token; prompt logits are never read, so skip copying them
+            logits_all = model._logits_all
+            model._logits_all = False
+            try:
+                model.eval(tokens[cached:])
+            finally:
+                model._logits_all = logits_all
+        return cached
 
-            response_text = response['choices'][0]['message']['content']
-            self.last_raw_response = response_text
-            
-            # JSON extraction
+    def _weights_fingerprint(self) -> str:
+        """Identify the evaluator weights file without hashing gigabytes."""
+        stat = self.model_path.stat()
+        return f"{self.model_path.name}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def _model_fingerprint(self) -> str:
+        """Identify the loaded weights and context size for prompt-state keys."""
+        return f"{self._weights_fingerprint()}:{self.model_n_ctx}"
+
+    def _restore_prefix(self, segment_texts: List[str], segment_tokens: List[List[int]]):
+        """
+        Bring the KV cache to the state after the given leading segments.
+
+        Each prefix level (system prompt, then system prompt + context) is
+        looked up in the prompt-state cache by a hash of its text. The
+        deepest available state is loaded, and any levels still missing are
+        prefilled and saved for the next request.
+        """
+        if not self.state_cache.enabled:
+            self._prefill([t for part in segment_tokens for t in part])
+            return
+
+        fingerprint = self._model_fingerprint()
+        levels = []
+        tokens: List[int] = []
+        for i, part in enumerate(segment_tokens):
+            tokens = tokens + part
+            levels.append((make_key(fingerprint, *segment_texts[:i + 1]), tokens))
+
+        resident = self._cached_prefix_len(levels[-1][1])
+        start = sum(1 for _, level_tokens in levels if resident >= len(level_tokens))
+
+        for i in range(len(levels) - 1, start - 1, -1):
+            state = self.state_cache.get(levels[i][0])
+            if state is not None:
+                self.evaluator_model.load_state(state)
+                start = i + 1
+                break
+
+        for key, level_tokens in levels[start:]:
+            self._prefill(level_tokens)
+            self.state_cache.put(key, self.evaluator_model.save_state())
+
+    def _evaluation_grammar(self):
+        """
+        Grammar for exactly the evaluation schema (bounded scores, lists and
+        feedback); generation ends as soon as the object closes.
+        """
+        return evaluation_grammar(*self.grammar_bounds)
+
+    def _evaluation_chunks(self, tokens: List[int]) -> Iterator[str]:
+        """
+        Stream the evaluator completion text for a prepared token prompt.
+
+        Streamed completions carry no `usage` block, so token counters are
+        taken from the prompt length and one streamed chunk per token.
+        """
+        PROMPT_TOKENS.inc(len(tokens))
+        self._begin_completion()
+        with phase("generate"):
+            for chunk in self.evaluator_model.create_completion(
+                prompt=tokens,
+                stop=["<|im_end|>"],
+                grammar=self._evaluation_grammar(),
+                stream=True,
+                **EVALUATOR_SAMPLING
+            ):
+                COMPLETION_TOKENS.inc()
+                yield chunk['choices'][0]['text']
+
+    def _generate_evaluation(self, tokens: List[int]) -> Dict:
+        """Run one evaluator completion over a prepared token prompt and parse it."""
+        response_text = "".join(self._evaluation_chunks(tokens))
+        self.last_raw_response = response_text
+        return self._parse_evaluation(response_text)
+
+    @staticmethod
+    def _parse_evaluation(response_text: str) -> Dict:
+        """Extract the evaluation JSON, falling back to a neutral grade."""
+        with phase("parse"):
             response_text = response_text.strip()
             json_start = response_text.find('{')
             json_end = response_text.rfind('}') + 1
-            
+
             if json_start != -1 and json_end > json_start:
                 json_str = response_text[json_start:json_end]
             else:
                 json_str = response_text
 
-            result = json.loads(json_str)
+            try:
+                return json.loads(json_str)
+            except json.JSONDecodeError:
+                logger.error("Error parsing JSON from evaluator")
+                PARSE_FALLBACKS.inc()
+                return dict(PARSE_FALLBACK_EVALUATION)
+
+    def warm_up(self):
+        """
+        Load the evaluator and run a short generation on every context bucket.
+
+        This touches the weights (page cache), allocates each bucket's
+        compute buffers, compiles the JSON grammar and stores the system
+        prompt state, so the first real evaluation pays none of it.
+        """
+        self._ensure_evaluator()
+        segments = self._evaluator_segments("Warm-up.", "Warm-up question?", "Warm-up answer.")
+        sampling = dict(EVALUATOR_SAMPLING, max_tokens=self.warmup_tokens)
+        with phase("warmup"):
+            for n_ctx in self.ctx_buckets:
+                self._use_bucket(n_ctx)
+                segment_tokens = self._tokenize_segments(segments)
+                self._restore_prefix(segments[:1], segment_tokens[:1])
+                self._begin_completion()
+                for _ in self.evaluator_model.create_completion(
+                    prompt=[t for part in segment_tokens for t in part],
+                    stop=["<|im_end|>"],
+                    grammar=self._evaluation_grammar(),
+                    stream=True,
+                    **sampling
+                ):
+                    pass
+        self._use_bucket(self.ctx_buckets[0])
+        logger.info(f"🔥 Evaluator warmed up on n_ctx buckets {self.ctx_buckets}")
+
+    def _ensure_evaluator(self):
+        was_loading = not self.model_loaded
+        self._load_evaluator_model()
+        if was_loading:
+            logger.info("🚀 Using LOCAL Qwen evaluator model")
+
+    def _prepare_evaluation(self, context: str, question: str, student_answer: str) -> List[int]:
+        """Load the evaluator, route to a context bucket and restore the cached prefix."""
+        self._ensure_evaluator()
+        segments = self._evaluator_segments(context, question, student_answer)
+        with phase("tokenize"):
+            segment_tokens = self._tokenize_segments(segments)
+
+        # Measure up front and pick a pre-sized instance; no reload on overflow
+        budget = self._route_to_bucket(sum(len(part) for part in segment_tokens))
+        segment_tokens = self._trim_context_tokens(segment_tokens, budget)
+        with phase("prefill"):
+            self._restore_prefix(segments[:2], segment_tokens[:2])
+        return [t for part in segment_tokens for t in part]
+
+    def triage_answer(self, context: str, question: str, student_answer: str) -> Optional[Dict]:
+        """
+        The zero-score evaluation of a trivial answer (see backend.triage),
+        or None when the evaluator has to grade it. Cheap enough to run
+        before the answer is queued for the evaluator.
+        """
+        if self.triage is None:
+            return None
+        context_terms = self.documents.vocabulary(context, self.evaluator_context_tokens)
+        result = self.triage.evaluate(question, student_answer, context_terms)
+        if result is not None:
+            logger.info(f"⚡ Triaged answer as {result['triage']['rule']}, skipping the evaluator")
+        return result
+
+    @instrumented("evaluate_answer")
+    @cached_result("evaluate_answer", skip=lambda result: result == PARSE_FALLBACK_EVALUATION)
+    def evaluate_answer(
+        self, 
+        context: str, 
+        question: str, 
+        student_answer: str
+    ) -> Dict:
+        """
+        Agent 3: Answer Evaluator (Distilled Student Model - Local)
+        Evaluate student answer using the local Qwen model.
+        """
+        try:
+            tokens = self._prepare_evaluation(context, question, student_answer)
+
+            logger.info("🔄 Generating evaluation...")
+            result = self._generate_evaluation(tokens)
             logger.info(f"✅ Evaluation complete. Score: {result.get('score_30', 'N/A')}/30")
             
             return result
             
-        except json.JSONDecodeError:
-            logger.error("Error parsing JSON from evaluator")
-            return {
-                "score_30": 15,
-                "key_coverage": 50,
-                "missing_concepts": ["Could not parse evaluation"],
-                "hallucinations": [],
-                "bias_check": False,
-                "feedback": "Error parsing model response."
-            }
         except Exception as e:
-            # Handle context window errors with retry
-            error_msg = str(e)
-            if "context window" in error_msg.lower() and _retry_count == 0:
-                logger.warning("Context window exceeded, retrying with larger context...")
-                self._unload_evaluator_model()
-                self._load_evaluator_model(force_reload=True, n_ctx=8192)
-                return self.evaluate_answer(context, question, student_answer, _retry_count=1)
-            
             logger.error(f"Error evaluating answer: {str(e)}")
             raise Exception(f"Error evaluating answer: {str(e)}")
+
+    @instrumented("stream_evaluation")
+    def stream_evaluation(
+        self,
+        context: str,
+        question: str,
+        student_answer: str
+    ) -> Iterator[Tuple[str, Dict]]:
+        """
+        Agent 3 (streaming): same evaluation as `evaluate_answer`, but yields
+        ("field", {key: value}) as soon as each top-level JSON field is
+        complete, then ("result", evaluation) with the parsed object.
+        """
+        try:
+            cache_key = self._evaluation_cache_key(context, question, student_answer)
+            if cache_key is not None:
+                cached = self.result_cache.get("evaluate_answer", cache_key)
+                if cached is not MISS:
+                    for key, value in cached.items():
+                        yield "field", {key: value}
+                    yield "result", cached
+                    return
+
+            tokens = self._prepare_evaluation(context, question, student_answer)
+
+            logger.info("🔄 Streaming evaluation...")
+            parser = IncrementalJSONParser()
+            for text in self._evaluation_chunks(tokens):
+                for key, value in parser.feed(text):
+                    yield "field", {key: value}
+
+            self.last_raw_response = parser.text
+            result = self._parse_evaluation(parser.text)
+            logger.info(f"✅ Evaluation complete. Score: {result.get('score_30', 'N/A')}/30")
+            if cache_key is not None and result != PARSE_FALLBACK_EVALUATION:
+                self.result_cache.put("evaluate_answer", cache_key, result)
+            yield "result", result
+
+        except Exception as e:
+            logger.error(f"Error evaluating answer: {str(e)}")
+            raise Exception(f"Error evaluating answer: {str(e)}")
+
+    @instrumented("evaluate_batch")
+    def evaluate_batch(
+        self,
+        context: str,
+        question: str,
+        student_answers: List[str]
+    ) -> List[Dict]:
+        """
+        Agent 3 (batch): evaluate many answers to the same question.
+
+        The system prompt, context and question are prefilled once; every
+        answer then only pays prefill for its own tokens. Results are
+        returned in the same order as `student_answers`.
+        """
+        try:
+            results: List[Optional[Dict]] = [None] * len(student_answers)
+            cache_keys = [
+                self._evaluation_cache_key(context, question, answer) for answer in student_answers
+            ]
+            for i, cache_key in enumerate(cache_keys):
+                if cache_key is not None:
+                    cached = self.result_cache.get("evaluate_answer", cache_key)
+                    if cached is not MISS:
+                        results[i] = cached
+            pending = [i for i, result in enumerate(results) if result is None]
+            if not pending:
+                return results
+
+            self._ensure_evaluator()
+            segments = self._evaluator_segments(context, question, "")[:3]
+            with phase("tokenize"):
+                segment_tokens = self._tokenize_segments(segments)
+                answers_tokens = {
+                    i: self.evaluator_model.tokenize(
+                        self._answer_segment(student_answers[i]).encode("utf-8"), add_bos=False, special=True
+                    )
+                    for i in pending
+                }
+
+            # Route the whole batch by its longest prompt so the prefix is shared
+            longest = max(len(t) for t in answers_tokens.values())
+            budget = self._route_to_bucket(sum(len(part) for part in segment_tokens) + longest)
+            segment_tokens = self._trim_context_tokens(segment_tokens, budget - longest)
+            shared = [t for part in segment_tokens for t in part]
+
+            with phase("prefill"):
+                self._restore_prefix(segments[:2], segment_tokens[:2])
+
+            logger.info(f"🔄 Generating {len(pending)} evaluations over a {len(shared)}-token shared prefix...")
+            reused = 0
+            for i in pending:
+                with phase("prefill"):
+                    reused += self._prefill(shared)
+                result = self._generate_evaluation(shared + answers_tokens[i])
+                if cache_keys[i] is not None and result != PARSE_FALLBACK_EVALUATION:
+                    self.result_cache.put("evaluate_answer", cache_keys[i], result)
+                results[i] = result
+            logger.info(
+                f"✅ Batch evaluation complete ({len(pending)} generated, "
+                f"{len(results) - len(pending)} cached, {reused} prefix tokens reused)"
+            )
+
+            return results
+
+        except Exception as e:
+            logger.error(f"Error evaluating batch: {str(e)}")
+            raise Exception(f"Error evaluating batch: {str(e)}")
     
-    def generate_dashboard_feedback(self, evaluations: List[Dict]) -> Dict:
+    @instrumented("generate_dashboard_feedback")
+    @cached_result("generate_dashboard_feedback", skip=lambda result: result == DASHBOARD_FALLBACK)
+    async def generate_dashboard_feedback(self, analytics: Dict) -> Dict:
         """
         Agent 4: Dashboard Generator (Gemini 2.5)
-        Creates comprehensive dashboard data from all evaluations
+        Writes the dashboard narrative from the session analytics
+        (see backend.analytics.session_analytics)
         """
         try:
-            # Calculate overall accuracy
-            # Note: evaluations come from evaluate_answer which returns score_30
-            # We need to handle potential different formats if mixed
-            scores = []
-            for e in evaluations:
-                if "score_30" in e:
-                    scores.append(e["score_30"])
-                elif "score" in e:
-                    # Assuming score is 0-30 if not specified, or convert?
-                    # Let's assume input evaluations might be normalized by server or raw
-                    # Server passes what evaluate_answer returns.
-                    scores.append(e.get("score", 0))
-            
-            # Normalize to 0-100 for the dashboard summary if needed, or keep 0-30?
-            # The prompt expects to analyze evaluations.
-            
-            eval_summary = json.dumps(evaluations, indent=2)
-            
-            prompt = f"""You are an educational analytics agent. Analyze these exam question evaluations:
+            digest = analytics_digest(analytics, self.dashboard_top_concepts, self.dashboard_concept_chars)
+            prompt = f"""You are an educational analytics agent. These statistics summarize a student's exam session
+(accuracy and key coverage in percent, concepts counted by the number of questions they appeared in):
 
-{eval_summary}
+{json.dumps(digest, indent=1, ensure_ascii=False)}
 
 Generate a comprehensive dashboard summary. Return ONLY valid JSON with:
 {{
     "strengths_summary": "2-3 sentence summary of student's strengths",
     "areas_for_improvement": "2-3 sentence summary of areas to improve",
-    "performance_trend": "Improving/Consistent/Declining",
     "recommendations": ["recommendation1", "recommendation2", "recommendation3"]
 }}
 
 Be encouraging but honest. Return ONLY the JSON object."""
 
-            response = self.dashboard_model.generate_content(prompt)
+            response_text = await self.gemini.generate(GEMINI_MODEL_NAME, prompt)
             
-            text = response.text.strip()
+            text = response_text.strip()
             if text.startswith("```json"):
                 text = text[7:]
             if text.startswith("```"):
@@ -352,10 +1033,5 @@ Be encouraging but honest. Return ONLY the JSON object."""
             
         except Exception as e:
             logger.error(f"Error generating dashboard: {str(e)}")
-            return {
-                "strengths_summary": "Completed questions.",
-                "areas_for_improvement": "Continue practicing.",
-                "performance_trend": "Consistent",
-                "recommendations": ["Review course materials"]
-            }
+            return dict(DASHBOARD_FALLBACK)
         
@@ -0,0 +1,222 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+import logging
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Preferred places to cut a document, best first
+CHUNK_BREAKS = ("\n\n", "\n", ". ", " ")
+LEADING_ARTICLES = ("the", "a", "an")
+
+
+def split_document(text: str, chunk_chars: int) -> List[str]:
+    """
+    Split `text` into chunks of at most `chunk_chars` characters, cut at a
+    paragraph, line, sentence or word boundary in the last fifth of each
+    chunk when there is one. Every character ends up in exactly one chunk.
+    """
+    chunks = []
+    start = 0
+    while len(text) - start > chunk_chars:
+        end = start + chunk_chars
+        floor = end - chunk_chars // 5
+        for separator in CHUNK_BREAKS:
+            cut = text.rfind(separator, floor, end)
+            if cut != -1:
+                end = cut + len(separator)
+                break
+        chunks.append(text[start:end])
+        start = end
+    if text[start:].strip():
+        chunks.append(text[start:])
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def topic_key(topic: str) -> str:
+    """Case, accent, punctuation, article and plural insensitive form of a topic."""
+    text = unicodedata.normalize("NFKD", topic).encode("ascii", "ignore").decode("ascii").casefold()
+    words = re.findall(r"[a-z0-9]+", text)
+    if words and words[0] in LEADING_ARTICLES and len(words) > 1:
+        words = words[1:]
+    return " ".join(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words)
+
+
+def merge_topics(topic_lists: List[List[str]], limit: int) -> List[Tuple[str, int]]:
+    """
+    Deduplicate the topics of every chunk; returns up to `limit`
+    `(topic, chunks)` pairs, the topics found in the most chunks first
+    (ties in document order), spelled as they first appeared.
+    """
+    spelling: Dict[str, str] = {}
+    counts: Counter = Counter()
+    for topics in topic_lists:
+        keys = set()
+        for topic in topics:
+            if not isinstance(topic, str) or not topic.strip():
+                continue
+            key = topic_key(topic)
+            if not key or key in keys:
+                continue
+            keys.add(key)
+            spelling.setdefault(key, topic.strip())
+        counts.update(keys)
+    order = {key: index for index, key in enumerate(spelling)}
+    ranked = sorted(counts, key=lambda key: (-counts[key], order[key]))
+    return [(spelling[key], counts[key]) for key in ranked[:limit]]
+
+
+class AnalysisJobNotFoundError(KeyError):
+    pass
+
+
+class AnalysisJob:
+    """One document analysis running in the background, and its progress."""
+
+    def __init__(self, job_id: str, chunks: int, chars: int):
+        self.id = job_id
+        self.chunks = chunks
+        self.chars = chars
+        self.analyzed = 0
+        self.status = "running"
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        # Set (and replaced) on every change, for the event streams
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def advance(self):
+        self.analyzed += 1
+        self._notify()
+
+    def finish(self, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished = time.time()
+        self._notify()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "chunks": self.chunks,
+            "analyzed": self.analyzed,
+            "chars": self.chars,
+            "elapsed_s": round((self.finished or time.time()) - self.created, 2),
+            "result": self.result,
+            "error": self.error,
+        }
+
+    async def events(self) -> AsyncIterator[Tuple[str, Dict]]:
+        """`progress` on every analyzed chunk, then `result` or `error`."""
+        reported = -1
+        while True:
+            changed = self._changed
+            if self.analyzed != reported:
+                reported = self.analyzed
+                yield "progress", {"analyzed": self.analyzed, "chunks": self.chunks}
+            if self.status == "done":
+                yield "result", self.result
+                return
+            if self.status != "running":
+                yield "error", {"detail": self.error or f"Analysis {self.status}"}
+                return
+            await changed.wait()
+
+
+class AnalysisJobStore:
+    """
+    Document analyses running in the background, polled by job ID.
+
+    A job splits the document, analyzes the chunks concurrently and merges
+    the partial results (see EduAgents.analyze_document_chunks). Finished
+    jobs are kept for `ttl` seconds; at most `max_jobs` are kept (oldest
+    dropped first, cancelled if still running).
+    """
+
+    def __init__(self, max_jobs: int = 64, ttl: float = 3600):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self.completed = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls) -> "AnalysisJobStore":
+        return cls(
+            max_jobs=int(os.getenv("ANALYSIS_JOB_MAX", "64")),
+            ttl=float(os.getenv("ANALYSIS_JOB_TTL", "3600")),
+        )
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and now - job.finished > self.ttl]:
+            del self._jobs[job_id]
+        while len(self._jobs) >= self.max_jobs:
+            _, evicted = self._jobs.popitem(last=False)
+            if evicted.task is not None:
+                evicted.task.cancel()
+
+    def submit(self, agents, text: str, chunks: Optional[List[str]] = None) -> AnalysisJob:
+        """Start analyzing `text`; `chunks` are its precomputed document_chunks, if any."""
+        self._prune()
+        if chunks is None:
+            chunks = agents.document_chunks(text)
+        job = AnalysisJob(uuid.uuid4().hex, len(chunks), len(text))
+        job.task = asyncio.create_task(self._run(job, agents, chunks))
+        # Also covers a job cancelled before it started running
+        job.task.add_done_callback(lambda task: task.cancelled() and job.finish("cancelled"))
+        self._jobs[job.id] = job
+        return job
+
+    async def _run(self, job: AnalysisJob, agents, chunks: List[str]):
+        try:
+            result = await agents.analyze_document_chunks(chunks, on_chunk=job.advance)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"❌ Document analysis {job.id} failed: {e}")
+            job.finish("failed", error=str(e))
+        else:
+            self.completed += 1
+            job.finish("done", result=result)
+
+    def get(self, job_id: str) -> AnalysisJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise AnalysisJobNotFoundError(job_id)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        return True
+
+    def close(self):
+        for job in self._jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        self._jobs.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "jobs": len(self._jobs),
+            "running": sum(job.status == "running" for job in self._jobs.values()),
+            "max_jobs": self.max_jobs,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,364 @@
+import math
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# A session counts as Improving/Declining when the fitted trend line moves
+# accuracy by at least this many points between the first and last question
+TREND_THRESHOLD_POINTS = 10.0
+TREND_MIN_QUESTIONS = 3
+
+# Key coverage histogram bins (percent)
+COVERAGE_BINS = (0, 25, 50, 75, 100)
+
+# Questions averaged as "recent" performance
+RECENT_QUESTIONS = 3
+
+
+def _number(value) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return number if math.isfinite(number) else math.nan
+
+
+def _strings(value) -> List[str]:
+    if not isinstance(value, list):
+        return []
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def _round(value: float, digits: int = 1) -> Optional[float]:
+    return None if value is None or math.isnan(value) else round(float(value), digits)
+
+
+def normalize_evaluation(evaluation: Dict) -> Dict:
+    """
+    Read one evaluation in any of the shapes the API hands out: the raw
+    evaluator output (`score_30`, `key_coverage`, ...) or the frontend
+    format from `format_evaluation` (`accuracy_percentage` plus the raw
+    result under `raw_evaluation`).
+    """
+    raw = evaluation.get("raw_evaluation")
+    if not isinstance(raw, dict):
+        raw = evaluation
+
+    accuracy = _number(evaluation.get("accuracy_percentage"))
+    if math.isnan(accuracy):
+        accuracy = _number(raw.get("score_30", evaluation.get("score"))) / 30 * 100
+    missing = evaluation.get("missing_concepts")
+    return {
+        "accuracy": 0.0 if math.isnan(accuracy) else min(max(accuracy, 0.0), 100.0),
+        "coverage": _number(raw.get("key_coverage", evaluation.get("key_coverage"))),
+        "missing_concepts": _strings(missing if missing is not None else raw.get("missing_concepts")),
+        "hallucinations": _strings(raw.get("hallucinations", evaluation.get("hallucinations"))),
+        "bias_flag": raw.get("bias_check") is True,
+    }
+
+
+def linear_trend(values: np.ndarray) -> Dict:
+    """Least-squares line through `values` over question order (1, 2, ...)."""
+    n = len(values)
+    if n < 2:
+        return {"slope": 0.0, "intercept": float(values[0]) if n else 0.0, "r2": 0.0}
+    x = np.arange(1, n + 1, dtype=np.float64)
+    xc = x - x.mean()
+    yc = values - values.mean()
+    sxx = float(xc @ xc)
+    slope = float(xc @ yc) / sxx
+    intercept = float(values.mean()) - slope * float(x.mean())
+    total = float(yc @ yc)
+    residual = yc - slope * xc
+    r2 = 1 - float(residual @ residual) / total if total > 0 else 0.0
+    return {"slope": slope, "intercept": intercept, "r2": r2}
+
+
+def trend_label(slope: float, n_questions: int) -> str:
+    if n_questions < TREND_MIN_QUESTIONS:
+        return "Consistent"
+    # Rounded so the running sums of RunningAnalytics and linear_trend,
+    # which differ in the last bits, agree on a change of exactly the threshold
+    change = round(slope * (n_questions - 1), 6)
+    if change >= TREND_THRESHOLD_POINTS:
+        return "Improving"
+    if change <= -TREND_THRESHOLD_POINTS:
+        return "Declining"
+    return "Consistent"
+
+
+def concept_frequencies(per_question: List[List[str]], ignored: Iterable[str] = ()) -> List[Dict]:
+    """
+    How often each concept recurs across questions, most recurring first.
+
+    Concepts are matched case-insensitively; each entry keeps the first
+    spelling seen, the number of questions it appeared in and the first and
+    last question (1-based) where it showed up.
+    """
+    ignored = {concept.lower() for concept in ignored}
+    keys, questions, spelling = [], [], {}
+    for question, concepts in enumerate(per_question):
+        for concept in concepts:
+            key = " ".join(concept.lower().split())
+            if key in ignored:
+                continue
+            spelling.setdefault(key, concept)
+            keys.append(key)
+            questions.append(question)
+    if not keys:
+        return []
+
+    unique, codes = np.unique(np.array(keys, dtype=object), return_inverse=True)
+    questions = np.array(questions, dtype=np.int64)
+    # Distinct (concept, question) pairs, so a concept listed twice in one
+    # evaluation still counts once for that question
+    pairs = np.unique(codes * len(per_question) + questions)
+    counts = np.bincount(pairs // len(per_question), minlength=len(unique))
+    first = np.full(len(unique), len(per_question), dtype=np.int64)
+    last = np.full(len(unique), -1, dtype=np.int64)
+    np.minimum.at(first, codes, questions)
+    np.maximum.at(last, codes, questions)
+
+    order = np.lexsort((first, -last, -counts))
+    return [
+        {
+            "concept": spelling[unique[i]],
+            "questions": int(counts[i]),
+            "first_seen": int(first[i]) + 1,
+            "last_seen": int(last[i]) + 1,
+        }
+        for i in order
+    ]
+
+
+def _trend_summary(slope: float, r2: float, n_questions: int) -> Dict:
+    # Drop the last bits first, so numbers from the running sums round like
+    # those of linear_trend when they sit on a rounding boundary
+    slope, r2 = round(slope, 9), round(r2, 9)
+    return {
+        "label": trend_label(slope, n_questions),
+        "slope_per_question": _round(slope, 2),
+        "r2": _round(r2, 3),
+    }
+
+
+def _assemble(
+    rows: List[Dict],
+    trend: Dict,
+    histogram: Iterable[int],
+    missing_concepts: List[Dict],
+    hallucinations: List[Dict],
+    bias_flags: int,
+) -> Dict:
+    """The analytics payload shared by session_analytics and RunningAnalytics."""
+    n = len(rows)
+    accuracy = np.array([row["accuracy"] for row in rows], dtype=np.float64)
+    coverage = np.array([row["coverage"] for row in rows], dtype=np.float64)
+    observed = coverage[~np.isnan(coverage)]
+
+    if n:
+        half = n // 2
+        accuracy_stats = {
+            "mean": _round(accuracy.mean()),
+            "std": _round(accuracy.std()),
+            "min": _round(accuracy.min()),
+            "median": _round(np.median(accuracy)),
+            "max": _round(accuracy.max()),
+            "recent_mean": _round(accuracy[-RECENT_QUESTIONS:].mean()),
+            "first_half_mean": _round(accuracy[:half].mean()) if half else None,
+            "second_half_mean": _round(accuracy[half:].mean()),
+        }
+    else:
+        accuracy_stats = {}
+
+    coverage_stats = {
+        "observed": int(len(observed)),
+        "mean": _round(observed.mean()) if len(observed) else None,
+        "quartiles": [_round(q) for q in np.percentile(observed, (25, 50, 75))] if len(observed) else [],
+        "histogram": [
+            {"range": f"{lo}-{hi}", "questions": int(count)}
+            for lo, hi, count in zip(COVERAGE_BINS, COVERAGE_BINS[1:], histogram)
+        ],
+    }
+
+    return {
+        "questions": n,
+        "overall_accuracy": float(accuracy.mean()) if n else 0.0,
+        "question_scores": [int(round(value)) for value in accuracy],
+        "per_question": [
+            {
+                "question": i + 1,
+                "accuracy": _round(row["accuracy"]),
+                "key_coverage": _round(row["coverage"]),
+                "missing_concepts": len(row["missing_concepts"]),
+                "hallucinations": len(row["hallucinations"]),
+                "bias_flag": row["bias_flag"],
+            }
+            for i, row in enumerate(rows)
+        ],
+        "accuracy": accuracy_stats,
+        "trend": trend,
+        "coverage": coverage_stats,
+        "missing_concepts": missing_concepts,
+        "hallucinations": hallucinations,
+        "bias_flags": int(bias_flags),
+    }
+
+
+def session_analytics(evaluations: List[Dict], ignored_concepts: Iterable[str] = ()) -> Dict:
+    """
+    Numeric dashboard for a quiz session, computed locally.
+
+    Per-question accuracy and key coverage, the accuracy trend over
+    question order, the coverage distribution and how often missing
+    concepts and hallucinations recur.
+    """
+    rows = [normalize_evaluation(evaluation) for evaluation in evaluations]
+    accuracy = np.array([row["accuracy"] for row in rows], dtype=np.float64)
+    coverage = np.array([row["coverage"] for row in rows], dtype=np.float64)
+    trend = linear_trend(accuracy)
+    histogram, _ = np.histogram(coverage[~np.isnan(coverage)], bins=COVERAGE_BINS)
+    return _assemble(
+        rows,
+        _trend_summary(trend["slope"], trend["r2"], len(rows)),
+        histogram,
+        concept_frequencies([row["missing_concepts"] for row in rows], ignored_concepts),
+        concept_frequencies([row["hallucinations"] for row in rows], ignored_concepts),
+        sum(row["bias_flag"] for row in rows),
+    )
+
+
+class _ConceptCounter:
+    """Incremental counterpart of concept_frequencies."""
+
+    def __init__(self, ignored: Iterable[str]):
+        self.ignored = {concept.lower() for concept in ignored}
+        # key -> [spelling, questions, first_seen, last_seen]
+        self.entries: Dict[str, List] = {}
+
+    def add(self, question: int, concepts: List[str]):
+        for concept in concepts:
+            key = " ".join(concept.lower().split())
+            if key in self.ignored:
+                continue
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = [concept, 1, question, question]
+            elif entry[3] != question:
+                entry[1] += 1
+                entry[3] = question
+
+    def frequencies(self) -> List[Dict]:
+        ranked = sorted(self.entries.items(), key=lambda item: (-item[1][1], -item[1][3], item[1][2], item[0]))
+        return [
+            {"concept": spelling, "questions": questions, "first_seen": first, "last_seen": last}
+            for _, (spelling, questions, first, last) in ranked
+        ]
+
+
+class RunningAnalytics:
+    """
+    session_analytics maintained one evaluation at a time.
+
+    Regression sums, the coverage histogram, concept counts and bias flags
+    are updated on `add`; `snapshot()` returns the same payload as
+    session_analytics over every evaluation added so far.
+    """
+
+    def __init__(self, ignored_concepts: Iterable[str] = ()):
+        self.rows: List[Dict] = []
+        self.sum_y = 0.0
+        self.sum_yy = 0.0
+        self.sum_xy = 0.0
+        self.histogram = [0] * (len(COVERAGE_BINS) - 1)
+        self.missing_concepts = _ConceptCounter(ignored_concepts)
+        self.hallucinations = _ConceptCounter(ignored_concepts)
+        self.bias_flags = 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, evaluation: Dict) -> Dict:
+        """Add one evaluation; returns its normalized row (see normalize_evaluation)."""
+        row = normalize_evaluation(evaluation)
+        self.add_row(row)
+        return row
+
+    def add_row(self, row: Dict):
+        self.rows.append(row)
+        question = len(self.rows)
+        y = row["accuracy"]
+        self.sum_y += y
+        self.sum_yy += y * y
+        self.sum_xy += question * y
+        coverage = row["coverage"]
+        if COVERAGE_BINS[0] <= coverage <= COVERAGE_BINS[-1]:
+            # Same bins as np.histogram: half-open, the last one closed
+            index = int(np.searchsorted(COVERAGE_BINS, coverage, side="right")) - 1
+            self.histogram[min(index, len(self.histogram) - 1)] += 1
+        self.missing_concepts.add(question, row["missing_concepts"])
+        self.hallucinations.add(question, row["hallucinations"])
+        self.bias_flags += row["bias_flag"]
+
+    def trend(self) -> Dict:
+        """Least-squares slope and r2 from the running sums (x = 1..n)."""
+        n = len(self.rows)
+        if n < 2:
+            return {"slope": 0.0, "r2": 0.0}
+        sxx = n * (n * n - 1) / 12
+        sxy = self.sum_xy - (n + 1) / 2 * self.sum_y
+        syy = self.sum_yy - self.sum_y * self.sum_y / n
+        slope = sxy / sxx
+        r2 = sxy * sxy / (sxx * syy) if syy > 1e-9 else 0.0
+        return {"slope": slope, "r2": min(r2, 1.0)}
+
+    def snapshot(self) -> Dict:
+        trend = self.trend()
+        return _assemble(
+            self.rows,
+            _trend_summary(trend["slope"], trend["r2"], len(self.rows)),
+            self.histogram,
+            self.missing_concepts.frequencies(),
+            self.hallucinations.frequencies(),
+            self.bias_flags,
+        )
+
+
+def _clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+def analytics_digest(analytics: Dict, top_concepts: int = 5, concept_chars: int = 60) -> Dict:
+    """
+    Size-bounded summary of `session_analytics` for the dashboard prompt.
+
+    Per-question rows are left out and concept lists are cut to the
+    `top_concepts` most recurring, each clipped to `concept_chars`, so the
+    digest does not grow with the length of the session.
+    """
+    def top(entries: List[Dict]) -> List[Dict]:
+        return [
+            {
+                "concept": _clip(entry["concept"], concept_chars),
+                "questions": entry["questions"],
+                "last_seen": entry["last_seen"],
+            }
+            for entry in entries[:top_concepts]
+        ]
+
+    return {
+        "questions": analytics["questions"],
+        "accuracy": analytics["accuracy"],
+        "trend": analytics["trend"],
+        "key_coverage": {
+            "mean": analytics["coverage"]["mean"],
+            "quartiles": analytics["coverage"]["quartiles"],
+            "histogram": {entry["range"]: entry["questions"] for entry in analytics["coverage"]["histogram"]},
+        },
+        "top_missing_concepts": top(analytics["missing_concepts"]),
+        "distinct_missing_concepts": len(analytics["missing_concepts"]),
+        "top_hallucinations": top(analytics["hallucinations"]),
+        "distinct_hallucinations": len(analytics["hallucinations"]),
+        "bias_flags": analytics["bias_flags"],
+    }
+
@@ -0,0 +1,330 @@
+"""
+Evaluator benchmark: replays training/dataset.json through
+EduAgents.evaluate_answer and writes a JSON report.
+
+    python -m backend.benchmark --limit 100 --output bench/q4_k_m.json
+    python -m backend.benchmark --stub --output bench/stub.json
+    python -m backend.benchmark --model models/q5_k_m.gguf --compare bench/q4_k_m.json
+
+`--stub` swaps the Llama instances for a stand-in that replays each
+example's target JSON, so the run measures the pipeline overhead alone
+(tokenization, prefix handling, grammar setup, streaming, parsing).
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import argparse
+import platform
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from backend.agents import EduAgents, PARSE_FALLBACK_EVALUATION
+from backend.gemini import FakeGeminiTransport
+from backend.prompt_cache import PromptStateCache
+
+DATASET_PATH = Path(__file__).parent.parent / "training" / "dataset.json"
+
+# Expected evaluator output fields and their JSON types
+EVALUATION_SCHEMA = {
+    "score_30": (int,),
+    "key_coverage": (int, float),
+    "missing_concepts": (list,),
+    "hallucinations": (list,),
+    "bias_check": (bool,),
+    "feedback": (str,),
+}
+
+# Predictions within this many points of the target count as agreeing
+SCORE_TOLERANCE = 3
+
+
+class StubLlama:
+    """
+    Minimal stand-in for `llama_cpp.Llama` with the surface EduAgents uses.
+
+    Tokens are whitespace-delimited pieces hashed into a fake vocabulary;
+    `create_completion` streams `next_response` piece by piece, optionally
+    sleeping `token_delay` seconds per piece.
+    """
+
+    VOCAB_SIZE = 32000
+    PIECE_PATTERN = re.compile(rb"\s*\S+|\s+")
+
+    def __init__(self, n_ctx: int, token_delay: float = 0.0):
+        self._n_ctx = n_ctx
+        self.token_delay = token_delay
+        self.input_ids = np.zeros(n_ctx, dtype=np.intc)
+        self.n_tokens = 0
+        self.next_response = "{}"
+        self.draft_model = None
+        self._logits_all = False
+
+    def n_ctx(self) -> int:
+        return self._n_ctx
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        tokens = [zlib.crc32(piece) % self.VOCAB_SIZE for piece in self.PIECE_PATTERN.findall(text)]
+        return ([1] + tokens) if add_bos else tokens
+
+    def eval(self, tokens: List[int]):
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = tokens
+        self.n_tokens += len(tokens)
+
+    def set_seed(self, seed: int):
+        pass
+
+    def create_completion(self, prompt: List[int], stream: bool = False, **kwargs) -> Iterator[Dict]:
+        self.n_tokens = 0
+        self.eval(prompt)
+        for piece in re.findall(r"\s*\S+|\s+", self.next_response):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield {"choices": [{"text": piece}]}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    return round(float(np.percentile(values, q)), 4) if values else None
+
+
+def schema_valid(result) -> bool:
+    return isinstance(result, dict) and all(
+        key in result
+        and isinstance(result[key], types)
+        and not (bool not in types and isinstance(result[key], bool))
+        for key, types in EVALUATION_SCHEMA.items()
+    )
+
+
+class InstrumentedAgents:
+    """
+    Wraps an EduAgents instance to time each phase of `evaluate_answer`.
+
+    The prepare and generation steps are wrapped on the instance, so the
+    replay runs the real evaluate_answer code path unchanged.
+    """
+
+    def __init__(self, agents: EduAgents):
+        self.agents = agents
+        self.record: Dict = {}
+        prepare = agents._prepare_evaluation
+        chunks = agents._evaluation_chunks
+
+        def timed_prepare(*args, **kwargs):
+            tokens = prepare(*args, **kwargs)
+            self.record["prepare_s"] = time.perf_counter() - self.record["started"]
+            self.record["prompt_tokens"] = len(tokens)
+            self.record["n_ctx"] = agents.model_n_ctx
+            return tokens
+
+        def timed_chunks(tokens):
+            count = 0
+            for text in chunks(tokens):
+                if count == 0:
+                    self.record["first_token_at"] = time.perf_counter()
+                count += 1
+                yield text
+            self.record["completion_tokens"] = count
+
+        agents._prepare_evaluation = timed_prepare
+        agents._evaluation_chunks = timed_chunks
+
+    def evaluate(self, example: Dict) -> Dict:
+        self.record = {"started": time.perf_counter()}
+        result = self.agents.evaluate_answer(example["context"], example["question"], example["student_answer"])
+        finished = time.perf_counter()
+        record = self.record
+        started = record.pop("started")
+        first_token_at = record.pop("first_token_at", finished)
+        record["latency_s"] = finished - started
+        record["ttft_s"] = first_token_at - started
+        decode_time = finished - first_token_at
+        completion_tokens = record.get("completion_tokens", 0)
+        record["decode_tps"] = (completion_tokens - 1) / decode_time if completion_tokens > 1 and decode_time > 0 else None
+        return result
+
+
+def build_agents(stub: bool, token_delay: float, cold: bool, seed: int, model_path: Optional[str] = None) -> EduAgents:
+    """Create EduAgents for the replay, returning it with the evaluator loaded."""
+    agents = EduAgents(gemini_transport=FakeGeminiTransport(lambda model, prompt: "{}"))
+    if model_path:
+        agents.model_path = Path(model_path)
+    # Every example must reach the model
+    agents.result_cache = None
+    if cold or stub:
+        agents.state_cache = PromptStateCache(max_bytes=0)
+    if stub:
+        agents.evaluator_models = {n_ctx: StubLlama(n_ctx, token_delay) for n_ctx in agents.ctx_buckets}
+        agents._use_bucket(agents.ctx_buckets[0])
+        agents.model_loaded = True
+    else:
+        agents._load_evaluator_model()
+    for model in agents.evaluator_models.values():
+        model.set_seed(seed)
+    return agents
+
+
+def replay(agents: EduAgents, example: Dict, stub: bool):
+    """Point the stub models at the example's target output."""
+    if stub:
+        for model in agents.evaluator_models.values():
+            model.next_response = example["target_json"]
+
+
+def run(args) -> Dict:
+    dataset = json.loads(Path(args.dataset).read_text(encoding="utf-8"))
+    examples = dataset[args.offset:args.offset + args.limit] if args.limit else dataset[args.offset:]
+
+    load_started = time.perf_counter()
+    agents = build_agents(args.stub, args.token_delay, args.cold, args.seed, args.model)
+    load_s = time.perf_counter() - load_started
+    bench = InstrumentedAgents(agents)
+
+    for example in examples[:args.warmup]:
+        replay(agents, example, args.stub)
+        bench.evaluate(example)
+
+    rows = []
+    for i, example in enumerate(examples):
+        replay(agents, example, args.stub)
+        result = bench.evaluate(example)
+        raw = agents.last_raw_response or ""
+        try:
+            json.loads(raw.strip())
+            json_valid = True
+        except json.JSONDecodeError:
+            json_valid = False
+        target = json.loads(example["target_json"])
+        row = dict(bench.record)
+        row.update({
+            "index": args.offset + i,
+            "json_valid": json_valid,
+            "schema_valid": schema_valid(result) and result != PARSE_FALLBACK_EVALUATION,
+            "score": result.get("score_30"),
+            "target_score": target.get("score_30"),
+            "key_coverage": result.get("key_coverage"),
+            "target_key_coverage": target.get("key_coverage"),
+        })
+        rows.append(row)
+        if args.verbose:
+            print(f"[{i + 1}/{len(examples)}] {row['latency_s']:.3f}s score {row['score']} (target {row['target_score']})")
+
+    return {
+        "meta": {
+            "mode": "stub" if args.stub else "model",
+            "model": str(agents.model_path) if not args.stub else None,
+            "weights": agents._weights_fingerprint() if not args.stub else None,
+            "llama_cpp": llama_cpp_version(),
+            "ctx_buckets": agents.ctx_buckets,
+            "prompt_state_cache": agents.state_cache.enabled,
+            "speculative": agents.speculative.stats() if agents.speculative is not None else None,
+            "dataset": str(args.dataset),
+            "offset": args.offset,
+            "examples": len(rows),
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "summary": summarize(rows, load_s),
+        "examples": [{k: round(v, 4) if isinstance(v, float) else v for k, v in row.items()} for row in rows],
+    }
+
+
+def llama_cpp_version() -> Optional[str]:
+    try:
+        import llama_cpp
+        return llama_cpp.__version__
+    except (ImportError, AttributeError):
+        return None
+
+
+def summarize(rows: List[Dict], load_s: float) -> Dict:
+    latencies = [row["latency_s"] for row in rows]
+    ttfts = [row["ttft_s"] for row in rows]
+    decode_tps = [row["decode_tps"] for row in rows if row["decode_tps"] is not None]
+    scored = [row for row in rows if isinstance(row["score"], (int, float)) and isinstance(row["target_score"], (int, float))]
+    errors = [abs(row["score"] - row["target_score"]) for row in scored]
+    coverage = [
+        abs(row["key_coverage"] - row["target_key_coverage"]) for row in rows
+        if isinstance(row["key_coverage"], (int, float)) and isinstance(row["target_key_coverage"], (int, float))
+    ]
+    total_time = sum(latencies)
+    completion_tokens = sum(row.get("completion_tokens", 0) for row in rows)
+    n = len(rows)
+
+    def rate(key):
+        return round(sum(1 for row in rows if row[key]) / n, 4) if n else None
+
+    return {
+        "load_s": round(load_s, 4),
+        "examples": n,
+        "prompt_tokens_total": sum(row.get("prompt_tokens", 0) for row in rows),
+        "prompt_tokens_mean": round(sum(row.get("prompt_tokens", 0) for row in rows) / n, 2) if n else None,
+        "completion_tokens_total": completion_tokens,
+        "completion_tokens_mean": round(completion_tokens / n, 2) if n else None,
+        "ttft_p50_s": percentile(ttfts, 50),
+        "ttft_p95_s": percentile(ttfts, 95),
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "latency_mean_s": round(total_time / n, 4) if n else None,
+        "decode_tokens_per_s_p50": percentile(decode_tps, 50),
+        "completion_tokens_per_s": round(completion_tokens / total_time, 2) if total_time else None,
+        "json_valid_rate": rate("json_valid"),
+        "schema_valid_rate": rate("schema_valid"),
+        "score_exact_rate": round(sum(1 for e in errors if e == 0) / len(scored), 4) if scored else None,
+        "score_within_tolerance_rate": round(sum(1 for e in errors if e <= SCORE_TOLERANCE) / len(scored), 4) if scored else None,
+        "score_mae": round(sum(errors) / len(errors), 4) if errors else None,
+        "key_coverage_mae": round(sum(coverage) / len(coverage), 4) if coverage else None,
+    }
+
+
+def compare(previous: Dict, current: Dict):
+    """Print the summary metrics of two runs side by side."""
+    print(f"{'metric':32} {'previous':>12} {'current':>12} {'change':>9}")
+    for key, value in current["summary"].items():
+        before = previous.get("summary", {}).get(key)
+        change = ""
+        if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+            change = f"{(value - before) / before * 100:+.1f}%"
+        print(f"{key:32} {str(before):>12} {str(value):>12} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local evaluator on training/dataset.json")
+    parser.add_argument("--dataset", default=str(DATASET_PATH))
+    parser.add_argument("--model", help="GGUF to benchmark instead of models/qwen_evaluator_q4_k_m.gguf")
+    parser.add_argument("--limit", type=int, default=0, help="examples to replay (0 = all)")
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=1, help="unrecorded examples run first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold", action="store_true", help="disable the prompt-state cache")
+    parser.add_argument("--stub", action="store_true", help="replace the model with a replaying stub")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="stub seconds per generated token")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"💾 Report written to {args.output}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
+    else:
+        print(json.dumps(report["summary"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
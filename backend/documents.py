@@ -0,0 +1,137 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentNotFoundError(KeyError):
+    pass
+
+
+class DocumentText(str):
+    """
+    Text of a stored document, carrying its sha256 as `key`.
+
+    Agents take it wherever they take document text; DocumentIndexStore
+    and the question prefetcher use `key` instead of hashing the text again.
+    """
+
+    key: str
+
+    def __new__(cls, text: str, key: Optional[str] = None):
+        document = super().__new__(cls, text)
+        document.key = key or hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return document
+
+    def __getnewargs__(self):
+        # Sent to the evaluator workers without hashing the text again
+        return str(self), self.key
+
+
+class StoredDocument:
+    """One uploaded document and data derived from it, computed once."""
+
+    def __init__(self, text: str, filename: Optional[str] = None, pages: Optional[int] = None):
+        self.text = DocumentText(text)
+        self.id = self.text.key
+        self.filename = filename
+        self.pages = pages
+        self.size = len(text.encode("utf-8"))
+        self.created = time.time()
+        self._derived: Dict[str, Any] = {}
+
+    def derived(self, name: str, build: Callable[[str], Any]) -> Any:
+        """`build(text)`, computed on first use and kept with the document."""
+        if name not in self._derived:
+            self._derived[name] = build(self.text)
+        return self._derived[name]
+
+    def to_dict(self) -> Dict:
+        return {
+            "doc_id": self.id,
+            "filename": self.filename,
+            "pages": self.pages,
+            "chars": len(self.text),
+            "bytes": self.size,
+        }
+
+
+class DocumentStore:
+    """
+    Uploaded documents, addressed by the sha256 of their text.
+
+    Uploading the same text twice stores it once. Documents are kept in
+    memory up to `max_documents` and `max_bytes` of text (least recently
+    used dropped first); requests for a dropped document get a 404 and the
+    client uploads it again.
+    """
+
+    def __init__(self, max_documents: int = 256, max_bytes: int = 256 * 1024 * 1024):
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._documents: "OrderedDict[str, StoredDocument]" = OrderedDict()
+        self._bytes = 0
+        self.stored = 0
+        self.deduplicated = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "DocumentStore":
+        return cls(
+            max_documents=int(os.getenv("DOCUMENT_STORE_MAX_DOCUMENTS", "256")),
+            max_bytes=int(float(os.getenv("DOCUMENT_STORE_MAX_MB", "256")) * 1024 * 1024),
+        )
+
+    def put(self, text: str, filename: Optional[str] = None, pages: Optional[int] = None) -> StoredDocument:
+        document = StoredDocument(text, filename, pages)
+        with self._lock:
+            existing = self._documents.get(document.id)
+            if existing is not None:
+                self._documents.move_to_end(document.id)
+                self.deduplicated += 1
+                return existing
+            if document.size > self.max_bytes:
+                raise ValueError(f"Document of {document.size} bytes exceeds the store size ({self.max_bytes} bytes)")
+            self._documents[document.id] = document
+            self._bytes += document.size
+            self.stored += 1
+            while len(self._documents) > self.max_documents or self._bytes > self.max_bytes:
+                _, evicted = self._documents.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+        logger.info(f"📄 Stored document {document.id[:12]} ({len(text)} chars)")
+        return document
+
+    def get(self, doc_id: str) -> StoredDocument:
+        with self._lock:
+            document = self._documents.get(doc_id)
+            if document is None:
+                raise DocumentNotFoundError(doc_id)
+            self._documents.move_to_end(doc_id)
+            return document
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock:
+            document = self._documents.pop(doc_id, None)
+            if document is None:
+                return False
+            self._bytes -= document.size
+            return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "max_documents": self.max_documents,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "evictions": self.evictions,
+            }
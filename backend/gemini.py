@@ -0,0 +1,263 @@
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from backend.metrics import observe_phase, phase
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+
+
+class GeminiError(Exception):
+    """A failed Gemini call; `retryable` marks 429/5xx/network failures."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class GeminiTransport:
+    """Sends one prompt to one model and returns the response text."""
+
+    async def generate(self, model: str, prompt: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+class HttpGeminiTransport(GeminiTransport):
+    """Gemini REST API over a pooled, keep-alive httpx client."""
+
+    def __init__(self, api_key: str, max_connections: int = 16):
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the server's event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                headers={"x-goog-api-key": self.api_key},
+            )
+        return self._client
+
+    async def generate(self, model: str, prompt: str, timeout: float) -> str:
+        try:
+            response = await self._get_client().post(
+                GEMINI_API_URL.format(model=model),
+                json={"contents": [{"role": "user", "parts": [{"text": prompt}]}]},
+                timeout=timeout,
+            )
+        except httpx.TimeoutException as e:
+            raise GeminiError(f"Gemini request timed out: {str(e)}", retryable=True)
+        except httpx.TransportError as e:
+            raise GeminiError(f"Gemini connection error: {str(e)}", retryable=True)
+
+        if response.status_code != 200:
+            retry_after = response.headers.get("retry-after")
+            raise GeminiError(
+                f"Gemini returned HTTP {response.status_code}: {response.text[:300]}",
+                status=response.status_code,
+                retryable=response.status_code == 429 or response.status_code >= 500,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+
+        data = response.json()
+        try:
+            parts = data["candidates"][0]["content"]["parts"]
+        except (KeyError, IndexError):
+            raise GeminiError(f"Gemini returned no content: {str(data)[:300]}")
+        return "".join(part.get("text", "") for part in parts)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FakeGeminiTransport(GeminiTransport):
+    """
+    Local stand-in for load tests: `respond(model, prompt)` builds the text,
+    after `latency()` seconds; `error_rate` of the calls fail with a 503.
+    """
+
+    def __init__(self, respond: Callable[[str, str], str],
+                 latency: Callable[[], float] = lambda: 0.0, error_rate: float = 0.0):
+        self.respond = respond
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+
+    async def generate(self, model: str, prompt: str, timeout: float) -> str:
+        self.calls += 1
+        delay = self.latency()
+        if delay > timeout:
+            await asyncio.sleep(timeout)
+            raise GeminiError("Fake Gemini timed out", retryable=True)
+        await asyncio.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            raise GeminiError("Fake Gemini unavailable", status=503, retryable=True)
+        return self.respond(model, prompt)
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` requests per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self, deadline: float) -> float:
+        """Take one token, waiting if needed; returns the time waited."""
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return waited
+            delay = (1 - self._tokens) / self.rate
+            if now + delay > deadline:
+                raise GeminiError("Gemini rate limit wait exceeds the request deadline", status=429)
+            await asyncio.sleep(delay)
+            waited += delay
+
+
+class GeminiGateway:
+    """
+    Shared async entry point for every Gemini call.
+
+    - bounded concurrency over a pooled transport
+    - token-bucket rate limiting sized to the API quota
+    - jittered exponential backoff on 429/5xx within a per-call deadline
+    - singleflight: identical (model, prompt) calls in flight share one request
+    """
+
+    def __init__(
+        self,
+        transport: GeminiTransport,
+        requests_per_minute: float = 60,
+        burst: int = 10,
+        max_concurrency: int = 8,
+        timeout: float = 30,
+        deadline: float = 90,
+        max_retries: int = 4,
+        base_backoff: float = 0.5,
+        max_backoff: float = 10,
+    ):
+        self.transport = transport
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats = {
+            "requests": 0,
+            "coalesced": 0,
+            "calls": 0,
+            "retries": 0,
+            "failures": 0,
+            "in_flight": 0,
+            "rate_limited_wait_s": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls, transport: GeminiTransport) -> "GeminiGateway":
+        return cls(
+            transport,
+            requests_per_minute=float(os.getenv("GEMINI_RPM", "60")),
+            burst=int(os.getenv("GEMINI_BURST", "10")),
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+            timeout=float(os.getenv("GEMINI_TIMEOUT", "30")),
+            deadline=float(os.getenv("GEMINI_DEADLINE", "90")),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "4")),
+        )
+
+    async def generate(self, model: str, prompt: str) -> str:
+        """Generate text, sharing the request with identical concurrent calls."""
+        self._stats["requests"] += 1
+        key = hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call_with_retries(model, prompt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self._stats["coalesced"] += 1
+        # Shielded so one cancelled caller does not cancel the shared call
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Mark the exception as retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    async def _call_with_retries(self, model: str, prompt: str) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            waited = await self.bucket.acquire(deadline)
+            if waited:
+                self._stats["rate_limited_wait_s"] += waited
+                observe_phase("gemini_rate_limit", waited)
+            try:
+                async with self._semaphore:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise GeminiError("Gemini request deadline exceeded")
+                    self._stats["calls"] += 1
+                    self._stats["in_flight"] += 1
+                    try:
+                        timeout = min(self.timeout, remaining)
+                        with phase("gemini"):
+                            return await asyncio.wait_for(
+                                self.transport.generate(model, prompt, timeout), timeout
+                            )
+                    except asyncio.TimeoutError:
+                        raise GeminiError("Gemini request timed out", retryable=True)
+                    finally:
+                        self._stats["in_flight"] -= 1
+            except GeminiError as e:
+                attempt += 1
+                backoff = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+                if e.retry_after:
+                    backoff = max(backoff, e.retry_after)
+                if not e.retryable or attempt > self.max_retries or time.monotonic() + backoff >= deadline:
+                    self._stats["failures"] += 1
+                    raise
+                self._stats["retries"] += 1
+                logger.warning(f"⚠️ Gemini call failed ({str(e)}), retry {attempt} in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats["rate_limited_wait_s"] = round(stats["rate_limited_wait_s"], 3)
+        return stats
+
+    async def aclose(self):
+        await self.transport.aclose()
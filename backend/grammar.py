@@ -0,0 +1,54 @@
+import threading
+from typing import Dict, Tuple
+
+from llama_cpp.llama_grammar import LlamaGrammar
+
+# Bounds of the evaluator output; the training targets stay well inside them
+# (at most 4 list items of 46 characters, feedback up to ~250 characters)
+DEFAULT_MAX_LIST_ITEMS = 6
+DEFAULT_MAX_ITEM_CHARS = 100
+DEFAULT_MAX_FEEDBACK_CHARS = 400
+
+
+def evaluation_gbnf(max_list_items: int, max_item_chars: int, max_feedback_chars: int) -> str:
+    """
+    GBNF for exactly the evaluator schema, keys in training order:
+
+        {"score_30": 0-30, "key_coverage": 0-100,
+         "missing_concepts": [<= max_list_items strings], "hallucinations": [...],
+         "bias_check": true|false, "feedback": "<= max_feedback_chars"}
+
+    The object is the whole grammar, so once `}` is sampled only
+    end-of-generation is allowed and decoding stops there.
+    """
+    return rf'''root ::= "{{" sp "\"score_30\":" sp score sp "," sp "\"key_coverage\":" sp coverage sp "," sp "\"missing_concepts\":" sp items sp "," sp "\"hallucinations\":" sp items sp "," sp "\"bias_check\":" sp boolean sp "," sp "\"feedback\":" sp feedback sp "}}"
+score ::= [0-9] | [1-2] [0-9] | "30"
+coverage ::= [0-9] | [1-9] [0-9] | "100"
+items ::= "[" sp "]" | "[" sp item (sp "," sp item){{0,{max_list_items - 1}}} sp "]"
+item ::= "\"" char{{1,{max_item_chars}}} "\""
+feedback ::= "\"" char{{1,{max_feedback_chars}}} "\""
+char ::= [^"\\\x00-\x1F] | "\\" ["\\/nt]
+boolean ::= "true" | "false"
+sp ::= " "?
+'''
+
+
+_cache_lock = threading.Lock()
+_compiled: Dict[Tuple[int, int, int], LlamaGrammar] = {}
+
+
+def evaluation_grammar(
+    max_list_items: int = DEFAULT_MAX_LIST_ITEMS,
+    max_item_chars: int = DEFAULT_MAX_ITEM_CHARS,
+    max_feedback_chars: int = DEFAULT_MAX_FEEDBACK_CHARS,
+) -> LlamaGrammar:
+    """
+    The evaluator grammar for the given bounds: grammar text built once per
+    process (the sampler is rebuilt per completion).
+    """
+    key = (max_list_items, max_item_chars, max_feedback_chars)
+    with _cache_lock:
+        grammar = _compiled.get(key)
+        if grammar is None:
+            grammar = _compiled[key] = LlamaGrammar.from_string(evaluation_gbnf(*key), verbose=False)
+        return grammar
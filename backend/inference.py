@@ -0,0 +1,297 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from backend.metrics import observe_phase
+from backend.workers import EvaluatorPool
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a relayed stream
+_STREAM_END = object()
+
+
+class QueueFullError(Exception):
+    """Raised when an executor cannot admit more work (maps to HTTP 429)."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class QueueTimeoutError(Exception):
+    """Raised when a job waited too long in the queue (maps to HTTP 503)."""
+
+    def __init__(self, name: str, waited: float, retry_after: int):
+        super().__init__(f"{name} job waited {waited:.1f}s in queue, giving up")
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Runs blocking callables off the event loop with admission control.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may
+    wait; anything beyond that is rejected immediately with QueueFullError
+    instead of piling up behind a slow generation.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, max_wait: float = 0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_service = 0.0
+
+    def _retry_after(self) -> int:
+        """Estimate seconds until a slot frees up from the average service time."""
+        avg_service = self._total_service / self._completed if self._completed else 1.0
+        backlog = (self._queued + self._running) / self.max_workers
+        return max(1, int(round(avg_service * backlog)))
+
+    def _admit(self) -> float:
+        """Reserve a queue slot or reject; returns the enqueue timestamp."""
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise QueueFullError(self.name, self._retry_after())
+            self._queued += 1
+        return time.perf_counter()
+
+    def _tracked(self, fn: Callable, enqueued_at: float) -> Callable:
+        """Wrap `fn` so it updates the wait/service counters when a worker picks it up."""
+        def _job(*args, **kwargs):
+            started_at = time.perf_counter()
+            waited = started_at - enqueued_at
+            observe_phase("queue_wait", waited)
+            with self._lock:
+                self._queued -= 1
+                self._total_wait += waited
+                self._max_wait_seen = max(self._max_wait_seen, waited)
+                if self.max_wait and waited > self.max_wait:
+                    self._timed_out += 1
+                    raise QueueTimeoutError(self.name, waited, self._retry_after())
+                self._running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._total_service += time.perf_counter() - started_at
+        return _job
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run `fn(*args, **kwargs)` in the executor and await its result."""
+        enqueued_at = self._admit()
+        loop = asyncio.get_running_loop()
+        # Carry the request context (phase timings) into the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, context.run, functools.partial(self._tracked(fn, enqueued_at), *args, **kwargs)
+        )
+
+    def stream(self, gen_fn: Callable[..., Iterator], *args, **kwargs) -> AsyncIterator:
+        """
+        Iterate the blocking generator `gen_fn(*args, **kwargs)` in the executor.
+
+        Admission happens immediately, so a full queue still raises
+        QueueFullError before a streaming response is started. Items are
+        relayed to the returned async iterator as they are produced; closing
+        the iterator (e.g. client disconnect) stops the generator early.
+        """
+        enqueued_at = self._admit()
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def _drain():
+            generator = gen_fn(*args, **kwargs)
+            try:
+                for item in generator:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, (item, None))
+            finally:
+                generator.close()
+
+        def _job():
+            try:
+                self._tracked(_drain, enqueued_at)()
+            except BaseException as e:
+                loop.call_soon_threadsafe(items.put_nowait, (_STREAM_END, e))
+                return
+            loop.call_soon_threadsafe(items.put_nowait, (_STREAM_END, None))
+
+        loop.run_in_executor(self._executor, contextvars.copy_context().run, _job)
+
+        async def _relay():
+            try:
+                while True:
+                    item, error = await items.get()
+                    if item is _STREAM_END:
+                        if error is not None:
+                            raise error
+                        return
+                    yield item
+            finally:
+                cancelled.set()
+
+        return _relay()
+
+    def stats(self) -> Dict:
+        """Snapshot of queue depth, wait times and admission counters."""
+        with self._lock:
+            started = self._completed + self._running + self._timed_out
+            return {
+                "queued": self._queued,
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "avg_wait_s": round(self._total_wait / started, 4) if started else 0.0,
+                "max_wait_s": round(self._max_wait_seen, 4),
+                "avg_service_s": round(self._total_service / self._completed, 4) if self._completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class EvaluatorBackend:
+    """
+    One evaluator model and the bounded queue in front of it.
+
+    In process, `agents` owns the `Llama` instances and the queue has a
+    single worker, so they are only ever touched by one thread. With a
+    worker `pool` (EVALUATOR_WORKERS) the queue has one slot per worker
+    process and `agents` only names the model.
+    """
+
+    def __init__(self, agents, pool: Optional[EvaluatorPool] = None):
+        self.agents = agents
+        self.pool = pool
+        self.executor = self._executor(1)
+
+    @staticmethod
+    def _executor(max_workers: int) -> BoundedExecutor:
+        return BoundedExecutor(
+            "evaluator",
+            max_workers=max_workers,
+            max_queue=int(os.getenv("EVALUATOR_QUEUE_SIZE", "16")),
+            max_wait=float(os.getenv("EVALUATOR_QUEUE_MAX_WAIT", "120")),
+        )
+
+    def _start_pool(self):
+        self.pool.start(self.agents.model_path, self.agents.ctx_buckets[-1])
+        executor, self.executor = self.executor, self._executor(self.pool.size)
+        executor.shutdown()
+
+    async def start(self):
+        """Load and warm up the model (in process: through the queue, so never concurrently with a job)."""
+        if self.pool is not None:
+            await asyncio.to_thread(self._start_pool)
+        else:
+            await self.executor.run(self.agents.warm_up)
+
+    async def run(self, method: str, *args, **kwargs) -> Any:
+        """Run `EduAgents.<method>(*args, **kwargs)` on this model."""
+        if self.pool is not None:
+            return await self.executor.run(self.pool.call, method, *args, **kwargs)
+        return await self.executor.run(getattr(self.agents, method), *args, **kwargs)
+
+    def stream(self, method: str, *args, **kwargs) -> AsyncIterator:
+        """Iterate the generator `EduAgents.<method>(*args, **kwargs)`; admission happens now."""
+        if self.pool is not None:
+            return self.executor.stream(self.pool.stream, method, *args, **kwargs)
+        return self.executor.stream(getattr(self.agents, method), *args, **kwargs)
+
+    def idle(self) -> bool:
+        stats = self.executor.stats()
+        return stats["queued"] == 0 and stats["running"] == 0
+
+    def stats(self) -> Dict:
+        stats = {"queue": self.executor.stats()}
+        if self.pool is not None:
+            stats["workers"] = self.pool.stats()
+        elif self.agents.speculative is not None:
+            stats["speculative"] = self.agents.speculative.stats()
+        return stats
+
+    def close(self):
+        """Free the model; call once idle."""
+        self.executor.shutdown()
+        if self.pool is not None:
+            self.pool.shutdown()
+        else:
+            self.agents._unload_evaluator_model()
+
+
+class InferenceLayer:
+    """
+    Execution layer shared by the API handlers.
+
+    - `evaluator_backend()`: an EvaluatorBackend per evaluator model, each
+      with its own bounded queue (see ModelManager for switching models).
+    - `extraction`: a process pool for CPU-bound PDF text extraction, so
+      large uploads use every core instead of one thread under the GIL.
+
+    Gemini calls are async and go through `GeminiGateway` instead.
+    """
+
+    def __init__(self):
+        # Fork where available: workers start instantly instead of
+        # re-importing the server module (warm_up_extraction forks them early)
+        methods = multiprocessing.get_all_start_methods()
+        self.extraction_workers = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 2)))
+        self.extraction = ProcessPoolExecutor(
+            max_workers=self.extraction_workers,
+            mp_context=multiprocessing.get_context("fork" if "fork" in methods else None),
+        )
+        self._extraction_running = 0
+
+    @staticmethod
+    def evaluator_backend(agents) -> EvaluatorBackend:
+        """A backend for the evaluator of `agents`, in process or on EVALUATOR_WORKERS processes."""
+        return EvaluatorBackend(agents, EvaluatorPool.from_env())
+
+    def warm_up_extraction(self):
+        """Start the PDF workers now, before model threads exist in this process."""
+        self.extraction.submit(os.getpid)
+
+    async def run_extraction(self, fn: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        self._extraction_running += 1
+        try:
+            return await loop.run_in_executor(self.extraction, fn, *args)
+        finally:
+            self._extraction_running -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "pdf_extraction": {
+                "workers": self.extraction_workers,
+                "running": self._extraction_running,
+            },
+        }
+
+    def shutdown(self):
+        self.extraction.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,473 @@
+"""
+End-to-end load test of the API server with fake LLM backends.
+
+Replays student session flows (upload -> analyze-document -> 3x
+generate-question + evaluate -> generate-dashboard) at increasing
+concurrency and writes a JSON report with throughput, per-endpoint tail
+latency and the saturation point.
+
+    python -m backend.loadtest --concurrency 1,2,4,8,16 --duration 30 --output bench/load.json
+    python -m backend.loadtest --gemini-latency lognormal:1.2,0.5 --llm-tokens-per-s 15 --compare bench/load.json
+    python -m backend.loadtest --url http://localhost:8000 --concurrency 4
+
+Without `--url` the server runs in a child process with a fake Gemini
+transport and a FakeLlama evaluator, so no quota is used and no model
+file is needed; everything else (queues, caches, retrieval, PDF
+extraction, sessions) is the real code. `/healthz` is probed during the
+run: its latency is the event-loop lag, and grows when a request blocks
+the loop.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import functools
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from backend.agents import EduAgents
+from backend.benchmark import DATASET_PATH, StubLlama, compare, percentile
+from backend.gemini import FakeGeminiTransport
+from backend.prompt_cache import PromptStateCache
+
+FLOW_QUESTIONS = 3
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+# Throughput within this fraction of the peak counts as saturated
+SATURATION_FRACTION = 0.9
+HEALTH_PROBE_INTERVAL = 0.1
+
+
+def latency_distribution(spec: str) -> Callable[[], float]:
+    """
+    Parse a latency distribution in seconds: `fixed:0.5`, `uniform:0.2,1.0`,
+    `exp:0.8` (mean) or `lognormal:0.8,0.5` (median, sigma).
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v.strip()]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "exp" and len(values) == 1:
+        return lambda: random.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    if kind == "lognormal" and len(values) == 2:
+        return lambda: float(np.exp(np.log(values[0]) + values[1] * random.gauss(0, 1)))
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+def fake_gemini_response(model: str, prompt: str) -> str:
+    """Plausible Gemini replies for every prompt the agents send."""
+    if "educational analytics agent" in prompt:
+        return json.dumps({
+            "strengths_summary": "Solid grasp of the core definitions.",
+            "areas_for_improvement": "Answers miss some of the finer details.",
+            "recommendations": ["Review the examples", "Practice derivations", "Summarize each chapter"],
+        })
+    if "educational content analyzer" in prompt:
+        words = [w for w in re.findall(r"[A-Z][a-z]{4,}", prompt) if w not in ("Return", "Course", "Material", "Array")]
+        topics = list(dict.fromkeys(words))[:5] or ["General Concepts"]
+        return json.dumps({"topics": topics, "summary": "Course material.", "suggested_difficulty": "Medium"})
+    count = re.search(r"Create (\d+) exam questions", prompt)
+    if count:
+        return json.dumps([f"Explain aspect {i} of the topic in detail." for i in range(1, int(count.group(1)) + 1)])
+    number = re.search(r"Create question #(\d+)", prompt)
+    return f"Explain aspect {number.group(1) if number else 1} of the topic in detail."
+
+
+class FakeLlama(StubLlama):
+    """
+    Stand-in for the evaluator `Llama` with a realistic timing profile.
+
+    Prompt tokens cost `1 / prefill_tokens_per_s` seconds each, generated
+    tokens `1 / tokens_per_s`; `error_rate` of the completions raise. The
+    reply is a random but schema-valid evaluation. Sleeping releases the
+    GIL like llama.cpp does, so the server sees the same blocking pattern.
+    """
+
+    def __init__(self, n_ctx: int, tokens_per_s: float = 30.0, prefill_tokens_per_s: float = 1000.0,
+                 error_rate: float = 0.0, **llama_options):
+        super().__init__(n_ctx, token_delay=1 / tokens_per_s if tokens_per_s > 0 else 0.0)
+        self.prefill_delay = 1 / prefill_tokens_per_s if prefill_tokens_per_s > 0 else 0.0
+        self.error_rate = error_rate
+
+    def eval(self, tokens: List[int]):
+        time.sleep(len(tokens) * self.prefill_delay)
+        super().eval(tokens)
+
+    def create_completion(self, prompt: List[int], stream: bool = False, max_tokens: int = 512, **kwargs) -> Iterator[Dict]:
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("FakeLlama decode failed")
+        score = random.randint(0, 30)
+        self.next_response = json.dumps({
+            "score_30": score,
+            "key_coverage": min(100, score * 3 + random.randint(0, 10)),
+            "missing_concepts": random.sample(["definition", "example", "edge cases", "complexity"], k=random.randint(0, 2)),
+            "hallucinations": [],
+            "bias_check": False,
+            "feedback": "The answer covers the main idea but lacks supporting detail.",
+        })
+        for count, chunk in enumerate(super().create_completion(prompt, stream=stream, **kwargs)):
+            if count >= max_tokens:
+                break
+            yield chunk
+
+
+def build_fake_agents(args) -> EduAgents:
+    agents = EduAgents(
+        gemini_transport=FakeGeminiTransport(
+            fake_gemini_response, latency=latency_distribution(args.gemini_latency), error_rate=args.gemini_error_rate
+        ),
+        llama_factory=functools.partial(
+            FakeLlama,
+            tokens_per_s=args.llm_tokens_per_s,
+            prefill_tokens_per_s=args.llm_prefill_tokens_per_s,
+            error_rate=args.llm_error_rate,
+        ),
+    )
+    # Prompt states are keyed by the weights file, which the fake does not have
+    agents.state_cache = PromptStateCache(max_bytes=0)
+    return agents
+
+
+def serve(args):
+    """Run the API server in this process with the fake backends."""
+    # Worker processes build their own (real) agents; the fake evaluator
+    # loads instantly on first use
+    os.environ["EVALUATOR_WORKERS"] = "0"
+    os.environ["EVALUATOR_WARMUP"] = "0"
+    import uvicorn
+    from backend import server
+    server.agents_factory = lambda: build_fake_agents(args)
+    uvicorn.run(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def make_pdf(pages: List[str], line_chars: int = 90, lines_per_page: int = 60) -> bytes:
+    """A minimal PDF with the given text, one or more PDF pages per entry."""
+    page_lines: List[List[str]] = []
+    for text in pages:
+        lines = []
+        for paragraph in text.splitlines():
+            words, line = paragraph.split(), ""
+            for word in words:
+                if line and len(line) + len(word) + 1 > line_chars:
+                    lines.append(line)
+                    line = word
+                else:
+                    line = f"{line} {word}".strip()
+            lines.append(line)
+        page_lines.extend(lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page))
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in page_lines:
+        escaped = [line.encode("latin-1", "replace").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+                   for line in lines]
+        stream = b"BT /F1 10 Tf 12 TL 40 800 Td " + b" ".join(b"(" + line + b") ' " for line in escaped) + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                       b"/Contents %d 0 R >>" % (len(objects)))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+class Recorder:
+    """Latency and status of every request, per endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+        self.requests = 0
+
+    async def post(self, client: httpx.AsyncClient, endpoint: str, **kwargs) -> Optional[Dict]:
+        """POST and record; returns the JSON body, or None on failure."""
+        self.requests += 1
+        started = time.perf_counter()
+        try:
+            response = await client.post(endpoint, **kwargs)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        elapsed = time.perf_counter() - started
+        if response is not None and response.status_code == 200:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            return response.json()
+        errors = self.errors.setdefault(endpoint, {})
+        errors[status] = errors.get(status, 0) + 1
+        return None
+
+    def endpoints(self) -> Dict:
+        return {
+            endpoint: {
+                "ok": len(self.latencies.get(endpoint, [])),
+                "errors": self.errors.get(endpoint, {}),
+                "p50_s": percentile(self.latencies.get(endpoint, []), 50),
+                "p95_s": percentile(self.latencies.get(endpoint, []), 95),
+                "p99_s": percentile(self.latencies.get(endpoint, []), 99),
+                "max_s": round(max(self.latencies[endpoint]), 4) if self.latencies.get(endpoint) else None,
+            }
+            for endpoint in sorted(set(self.latencies) | set(self.errors))
+        }
+
+
+async def session_flow(client: httpx.AsyncClient, recorder: Recorder, pdf: bytes, examples: List[Dict]) -> bool:
+    """One student session; returns whether every step succeeded."""
+    upload = await recorder.post(client, "/upload", params={"include_text": "false"},
+                                 files={"file": ("course.pdf", pdf, "application/pdf")})
+    if upload is None:
+        return False
+    doc_id = upload["doc_id"]
+    analysis = await recorder.post(client, "/analyze-document", json={"doc_id": doc_id})
+    if analysis is None:
+        return False
+    topic = random.choice(analysis.get("topics") or ["General Concepts"])
+    difficulty = random.choice(DIFFICULTIES)
+
+    evaluations = []
+    for number in range(1, FLOW_QUESTIONS + 1):
+        question = await recorder.post(client, "/generate-question", json={
+            "doc_id": doc_id, "topic": topic, "difficulty": difficulty,
+            "question_number": number, "total_questions": FLOW_QUESTIONS,
+        })
+        if question is None:
+            return False
+        example = random.choice(examples)
+        # A unique suffix keeps the result cache from answering every evaluation
+        answer = f"{example['student_answer']} ({random.getrandbits(32):08x})"
+        evaluation = await recorder.post(client, "/evaluate", json={
+            "doc_id": doc_id, "question": question["question"], "student_answer": answer,
+        })
+        if evaluation is None:
+            return False
+        evaluations.append(evaluation)
+
+    return await recorder.post(client, "/generate-dashboard", json={"evaluations": evaluations}) is not None
+
+
+async def probe_health(client: httpx.AsyncClient, samples: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/healthz")
+            samples.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), HEALTH_PROBE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(url: str, concurrency: int, duration: float, timeout: float,
+                    pdfs: List[bytes], examples: List[Dict]) -> Dict:
+    """`concurrency` users run flows back to back for `duration` seconds (started flows finish)."""
+    recorder = Recorder()
+    flows = {"ok": 0, "failed": 0}
+    flow_latencies: List[float] = []
+    health: List[float] = []
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=concurrency + 1, max_keepalive_connections=concurrency + 1)
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        deadline = time.perf_counter() + duration
+
+        async def user():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                ok = await session_flow(client, recorder, random.choice(pdfs), examples)
+                flows["ok" if ok else "failed"] += 1
+                if ok:
+                    flow_latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        prober = asyncio.create_task(probe_health(client, health, stop))
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await prober
+
+    failed_requests = sum(sum(errors.values()) for errors in recorder.errors.values())
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "flows": flows["ok"],
+        "failed_flows": flows["failed"],
+        "flows_per_s": round(flows["ok"] / elapsed, 4),
+        "requests_per_s": round(recorder.requests / elapsed, 2),
+        "error_rate": round(failed_requests / recorder.requests, 4) if recorder.requests else 0.0,
+        "flow_p50_s": percentile(flow_latencies, 50),
+        "flow_p95_s": percentile(flow_latencies, 95),
+        "loop_lag_p50_s": percentile(health, 50),
+        "loop_lag_p99_s": percentile(health, 99),
+        "loop_lag_max_s": round(max(health), 4) if health else None,
+        "endpoints": recorder.endpoints(),
+    }
+
+
+def saturation_point(levels: List[Dict], max_error_rate: float) -> Optional[Dict]:
+    """
+    The lowest concurrency reaching `SATURATION_FRACTION` of the peak
+    throughput: beyond it more users only add queueing. Levels whose error
+    rate exceeds `max_error_rate` do not count as serving that throughput.
+    """
+    healthy = [level for level in levels if level["error_rate"] <= max_error_rate and level["flows_per_s"] > 0]
+    if not healthy:
+        return None
+    peak = max(level["flows_per_s"] for level in healthy)
+    knee = next(level for level in healthy if level["flows_per_s"] >= SATURATION_FRACTION * peak)
+    return {"concurrency": knee["concurrency"], "flows_per_s": knee["flows_per_s"], "peak_flows_per_s": peak}
+
+
+def summarize(levels: List[Dict], saturation: Optional[Dict]) -> Dict:
+    """Flat metrics of the run, in the shape benchmark.compare expects."""
+    summary = {
+        "saturation_concurrency": saturation["concurrency"] if saturation else None,
+        "peak_flows_per_s": saturation["peak_flows_per_s"] if saturation else None,
+    }
+    for level in levels:
+        prefix = f"c{level['concurrency']}"
+        summary[f"{prefix}_flows_per_s"] = level["flows_per_s"]
+        summary[f"{prefix}_error_rate"] = level["error_rate"]
+        summary[f"{prefix}_loop_lag_p99_s"] = level["loop_lag_p99_s"]
+        for endpoint, stats in level["endpoints"].items():
+            summary[f"{prefix}_{endpoint.strip('/')}_p95_s"] = stats["p95_s"]
+    return summary
+
+
+async def wait_ready(url: str, timeout: float):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/readyz")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"Server at {url} not ready after {timeout}s")
+
+
+def fake_server_command(args) -> List[str]:
+    return [
+        sys.executable, "-m", "backend.loadtest", "--serve", "--port", str(args.port),
+        "--gemini-latency", args.gemini_latency, "--gemini-error-rate", str(args.gemini_error_rate),
+        "--llm-tokens-per-s", str(args.llm_tokens_per_s),
+        "--llm-prefill-tokens-per-s", str(args.llm_prefill_tokens_per_s),
+        "--llm-error-rate", str(args.llm_error_rate),
+    ]
+
+
+async def run(args) -> Dict:
+    random.seed(args.seed)
+    dataset = json.loads(Path(args.dataset).read_text(encoding="utf-8"))
+    # Course packs of `--pages` dataset contexts each
+    pdfs = [make_pdf([random.choice(dataset)["context"] for _ in range(args.pages)]) for _ in range(4)]
+
+    server = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen(fake_server_command(args), cwd=str(Path(__file__).parent.parent))
+    try:
+        await wait_ready(url, args.ready_timeout)
+        levels = []
+        for concurrency in args.concurrency:
+            level = await run_level(url, concurrency, args.duration, args.timeout, pdfs, dataset)
+            levels.append(level)
+            print(f"👥 {concurrency:>3} users: {level['flows_per_s']:.3f} flows/s, "
+                  f"flow p95 {level['flow_p95_s']}s, errors {level['error_rate']:.1%}, "
+                  f"loop lag p99 {level['loop_lag_p99_s']}s")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    saturation = saturation_point(levels, args.max_error_rate)
+    return {
+        "meta": {
+            "mode": "external" if args.url else "fake",
+            "url": url,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "pages": args.pages,
+            "fake": None if args.url else {
+                "gemini_latency": args.gemini_latency,
+                "gemini_error_rate": args.gemini_error_rate,
+                "llm_tokens_per_s": args.llm_tokens_per_s,
+                "llm_prefill_tokens_per_s": args.llm_prefill_tokens_per_s,
+                "llm_error_rate": args.llm_error_rate,
+            },
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "saturation": saturation,
+        "summary": summarize(levels, saturation),
+        "levels": levels,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API server with replayed session flows")
+    parser.add_argument("--url", help="server to test (default: start one with fake backends)")
+    parser.add_argument("--port", type=int, default=8765, help="port of the fake-backend server")
+    parser.add_argument("--concurrency", type=lambda s: [int(n) for n in s.split(",")], default=[1, 2, 4, 8],
+                        help="comma-separated concurrent users, one level each")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of new flows per level")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds per request")
+    parser.add_argument("--pages", type=int, default=8, help="dataset contexts per uploaded PDF")
+    parser.add_argument("--dataset", default=str(DATASET_PATH))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="levels with more failed requests do not count toward saturation")
+    parser.add_argument("--ready-timeout", type=float, default=120)
+    parser.add_argument("--gemini-latency", default="lognormal:0.8,0.4", help="fake Gemini latency distribution")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="fake Gemini 503 rate (retried)")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=30, help="fake evaluator decode speed")
+    parser.add_argument("--llm-prefill-tokens-per-s", type=float, default=1000, help="fake evaluator prefill speed")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fake evaluator failure rate")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    report = asyncio.run(run(args))
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"💾 Report written to {args.output}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
+    else:
+        print(json.dumps({"saturation": report["saturation"], "summary": report["summary"]}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
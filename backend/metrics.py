@@ -0,0 +1,271 @@
+import os
+import time
+import inspect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; spans a cache hit (ms) up to a cold model load or long generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_sample(self, key, state) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state[0]):
+            cumulative += count
+            le = 'le="{}"'.format(_format_value(bound) if bound != float("inf") else "+Inf")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state[1])}")
+        lines.append(f"{self.name}_count{labels} {state[2]}")
+        return lines
+
+
+class Registry:
+    """
+    Minimal Prometheus registry rendering the text exposition format.
+
+    `collectors` are called on every scrape to refresh gauges that mirror
+    state owned elsewhere (queue depths, cache sizes).
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+AGENT_LATENCY = REGISTRY.histogram(
+    "edu_agent_duration_seconds", "Agent call latency, result-cache hits included.", ["agent"]
+)
+AGENT_IN_FLIGHT = REGISTRY.gauge("edu_agent_in_flight", "Agent calls currently running.", ["agent"])
+AGENT_ERRORS = REGISTRY.counter("edu_agent_errors_total", "Agent calls that raised.", ["agent"])
+PHASE_LATENCY = REGISTRY.histogram(
+    "edu_phase_duration_seconds",
+    "Time spent per hot-path phase (queue_wait, model_load, warmup, retrieval, tokenize, prefill, generate, parse, gemini).",
+    ["phase"],
+)
+PROMPT_TOKENS = REGISTRY.counter("edu_evaluator_prompt_tokens_total", "Prompt tokens sent to the local evaluator.")
+COMPLETION_TOKENS = REGISTRY.counter(
+    "edu_evaluator_completion_tokens_total", "Completion tokens generated by the local evaluator."
+)
+MODEL_LOADS = REGISTRY.counter("edu_evaluator_model_loads_total", "Evaluator model loads.", ["reload"])
+PARSE_FALLBACKS = REGISTRY.counter(
+    "edu_evaluator_parse_fallbacks_total", "Evaluations answered with the neutral score_30=15 fallback."
+)
+DRAFT_TOKENS = REGISTRY.counter(
+    "edu_evaluator_draft_tokens_total", "Tokens drafted for speculative decoding (rounds with a known outcome)."
+)
+DRAFT_ACCEPTED_TOKENS = REGISTRY.counter(
+    "edu_evaluator_draft_accepted_tokens_total", "Drafted tokens accepted by the evaluator."
+)
+TRIAGE_DECISIONS = REGISTRY.counter(
+    "edu_evaluator_triage_total", "Answers seen by the fast-path triage, by rule (evaluator: not triaged).", ["outcome"]
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "edu_http_request_duration_seconds", "HTTP request latency until the response starts.", ["route", "method", "status"]
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("edu_http_requests_in_flight", "HTTP requests currently being handled.")
+
+# Phase timings of the current request, for the Server-Timing header. The
+# list is shared (not copied) with executor threads that inherit the context.
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def timing_headers_enabled() -> bool:
+    return os.getenv("SERVER_TIMING_HEADERS", "0") == "1"
+
+
+def start_request_timing() -> List[Tuple[str, float]]:
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    """Format phase timings as a Server-Timing header value (milliseconds)."""
+    totals: Dict[str, float] = {}
+    for name, seconds in list(timings):
+        totals[name] = totals.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def observe_phase(name: str, seconds: float):
+    PHASE_LATENCY.observe(seconds, phase=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block as one hot-path phase."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(name, time.perf_counter() - started)
+
+
+def instrumented(agent: str):
+    """Record latency, in-flight count and errors of an EduAgents method (sync or async)."""
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                AGENT_IN_FLIGHT.inc(agent=agent)
+                started = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                except Exception:
+                    AGENT_ERRORS.inc(agent=agent)
+                    raise
+                finally:
+                    AGENT_IN_FLIGHT.dec(agent=agent)
+                    AGENT_LATENCY.observe(time.perf_counter() - started, agent=agent)
+        elif inspect.isgeneratorfunction(method):
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                AGENT_IN_FLIGHT.inc(agent=agent)
+                started = time.perf_counter()
+                try:
+                    yield from method(*args, **kwargs)
+                except Exception:
+                    AGENT_ERRORS.inc(agent=agent)
+                    raise
+                finally:
+                    AGENT_IN_FLIGHT.dec(agent=agent)
+                    AGENT_LATENCY.observe(time.perf_counter() - started, agent=agent)
+        else:
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                AGENT_IN_FLIGHT.inc(agent=agent)
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                except Exception:
+                    AGENT_ERRORS.inc(agent=agent)
+                    raise
+                finally:
+                    AGENT_IN_FLIGHT.dec(agent=agent)
+                    AGENT_LATENCY.observe(time.perf_counter() - started, agent=agent)
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+import os
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+from llama_cpp import LlamaState
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(*parts: str) -> str:
+    """Hash prompt parts (model fingerprint, system prompt, context...) into a cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def compact_state(state: LlamaState) -> LlamaState:
+    """
+    Drop the logits rows from a saved state.
+
+    `Llama.load_state` always marks the context as needing a fresh decode,
+    and the evaluator never asks for logprobs, so the saved scores are never
+    read back. Keeping a single broadcastable row saves hundreds of MB per
+    entry (n_batch x n_vocab floats).
+    """
+    return LlamaState(
+        input_ids=state.input_ids,
+        scores=np.zeros((1, state.scores.shape[-1]), dtype=np.single),
+        n_tokens=state.n_tokens,
+        llama_state=state.llama_state,
+        llama_state_size=state.llama_state_size,
+        seed=state.seed,
+    )
+
+
+def state_nbytes(state: LlamaState) -> int:
+    return int(state.llama_state_size) + state.input_ids.nbytes + state.scores.nbytes
+
+
+class PromptStateCache:
+    """
+    LRU cache of llama.cpp model states for prompt prefixes.
+
+    States live in RAM up to `max_bytes`. When `cache_dir` is set every state
+    is also written to disk (bounded by `max_disk_bytes`) so a restarted
+    process, or an entry evicted from RAM, can skip the prefill again.
+    """
+
+    def __init__(self, max_bytes: int, cache_dir: Optional[str] = None, max_disk_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._lock = threading.Lock()
+        self._ram: "OrderedDict[str, LlamaState]" = OrderedDict()
+        self._ram_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._index_disk()
+
+    @classmethod
+    def from_env(cls) -> "PromptStateCache":
+        return cls(
+            max_bytes=int(float(os.getenv("EVALUATOR_STATE_CACHE_MB", "1024")) * 1024 * 1024),
+            cache_dir=os.getenv("EVALUATOR_STATE_CACHE_DIR") or None,
+            max_disk_bytes=int(float(os.getenv("EVALUATOR_STATE_CACHE_DISK_MB", "4096")) * 1024 * 1024),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or self.cache_dir is not None
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.llstate"
+
+    def _index_disk(self):
+        """Rebuild the disk LRU order from file access times after a restart."""
+        entries = []
+        for path in self.cache_dir.glob("*.llstate"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        if entries:
+            logger.info(f"💾 Prompt state cache: {len(entries)} states on disk ({self._disk_bytes / 1e6:.1f} MB)")
+
+    def get(self, key: str) -> Optional[LlamaState]:
+        with self._lock:
+            state = self._ram.get(key)
+            if state is not None:
+                self._ram.move_to_end(key)
+                self.hits += 1
+                return state
+            on_disk = key in self._disk
+
+        if on_disk:
+            state = self._read_disk(key)
+            if state is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._disk.move_to_end(key)
+                    self._store_ram(key, state)
+                return state
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, state: LlamaState):
+        if not self.enabled:
+            return
+        state = compact_state(state)
+        with self._lock:
+            self._store_ram(key, state)
+        if self.cache_dir is not None:
+            self._write_disk(key, state)
+
+    def _store_ram(self, key: str, state: LlamaState):
+        if key in self._ram:
+            self._ram_bytes -= state_nbytes(self._ram.pop(key))
+        size = state_nbytes(state)
+        if size > self.max_bytes:
+            return
+        self._ram[key] = state
+        self._ram_bytes += size
+        while self._ram_bytes > self.max_bytes:
+            _, evicted = self._ram.popitem(last=False)
+            self._ram_bytes -= state_nbytes(evicted)
+            self.evictions += 1
+
+    def _read_disk(self, key: str) -> Optional[LlamaState]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            os.utime(path, None)
+            return state
+        except Exception as e:
+            logger.warning(f"⚠️ Dropping unreadable prompt state {path.name}: {str(e)}")
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            path.unlink(missing_ok=True)
+            return None
+
+    def _write_disk(self, key: str, state: LlamaState):
+        path = self._path(key)
+        # Per process: evaluator workers may write the same state at once
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not persist prompt state: {str(e)}")
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        size = path.stat().st_size
+        with self._lock:
+            self._disk_bytes += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                old_key, old_size = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                self._path(old_key).unlink(missing_ok=True)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "ram_entries": len(self._ram),
+                "ram_bytes": self._ram_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes if self.cache_dir else 0,
+            }
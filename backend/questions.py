@@ -0,0 +1,136 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List
+
+from backend.retrieval import DocumentIndexStore
+
+logger = logging.getLogger(__name__)
+
+QUESTION_MODES = ("batch", "concurrent")
+
+
+class QuestionPrefetcher:
+    """
+    Generates the questions of a quiz ahead of the student.
+
+    A quiz is identified by session, document, topic and difficulty. In
+    `batch` mode the first request starts one generate_question_set call
+    for the whole quiz; in `concurrent` mode each request starts
+    generate_question for its own number and for the next one. Either way
+    the next question is being generated while the student answers the
+    current one, and is usually ready when it is asked for.
+
+    Generation runs in background tasks that outlive the request, so a
+    client that disconnects does not waste a prefetched question. At most
+    `max_quizzes` quizzes are kept (least recently used dropped first).
+    """
+
+    def __init__(self, mode: str = "batch", max_quizzes: int = 256):
+        if mode not in QUESTION_MODES:
+            raise ValueError(f"Unknown question mode {mode!r}, expected one of {QUESTION_MODES}")
+        self.mode = mode
+        self.max_quizzes = max_quizzes
+        # (session, document key, topic, difficulty) -> {question number or "set": task}
+        self._quizzes: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self.ready = 0
+        self.waited = 0
+        self.fallbacks = 0
+
+    @classmethod
+    def from_env(cls) -> "QuestionPrefetcher":
+        return cls(
+            mode=os.getenv("QUESTION_PREFETCH_MODE", "batch"),
+            max_quizzes=int(os.getenv("QUESTION_PREFETCH_MAX_QUIZZES", "256")),
+        )
+
+    def _quiz(self, session_id: str, context: str, topic: str, difficulty: str) -> Dict:
+        key = (session_id, DocumentIndexStore.document_key(context), topic, difficulty)
+        quiz = self._quizzes.get(key)
+        if quiz is None:
+            quiz = self._quizzes[key] = {}
+            while len(self._quizzes) > self.max_quizzes:
+                _, evicted = self._quizzes.popitem(last=False)
+                self._cancel(evicted)
+        self._quizzes.move_to_end(key)
+        return quiz
+
+    @staticmethod
+    def _cancel(quiz: Dict):
+        for task in quiz.values():
+            task.cancel()
+
+    @staticmethod
+    def _task(quiz: Dict, key, factory) -> asyncio.Task:
+        """The task in `quiz[key]`, (re)started when missing or failed."""
+        task = quiz.get(key)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            task = quiz[key] = asyncio.create_task(factory())
+            # A prefetch nobody asks for must not log "exception never retrieved"
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def _await(self, task: asyncio.Task):
+        if task.done():
+            self.ready += 1
+        else:
+            self.waited += 1
+        # Shielded: a cancelled request must not cancel a shared prefetch
+        return await asyncio.shield(task)
+
+    async def question(
+        self,
+        agents,
+        session_id: str,
+        context: str,
+        topic: str,
+        difficulty: str,
+        question_number: int,
+        total_questions: int,
+    ) -> str:
+        """Question `question_number` (1-based) of the quiz, generating ahead as needed."""
+        quiz = self._quiz(session_id, context, topic, difficulty)
+
+        def single(number: int):
+            return lambda: agents.generate_question(context, topic, difficulty, number, total_questions)
+
+        if self.mode == "concurrent":
+            task = self._task(quiz, question_number, single(question_number))
+            if question_number < total_questions:
+                self._task(quiz, question_number + 1, single(question_number + 1))
+            return await self._await(task)
+
+        task = self._task(quiz, "set", lambda: agents.generate_question_set(context, topic, difficulty, total_questions))
+        questions: List[str] = await self._await(task)
+        if question_number <= len(questions):
+            return questions[question_number - 1]
+
+        # The set came back short (unparseable reply): the missing questions
+        # are generated one by one, all at once
+        self.fallbacks += 1
+        if question_number not in quiz:
+            logger.warning(f"Question set has {len(questions)} of {total_questions} questions, generating the rest separately")
+        for number in range(len(questions) + 1, max(total_questions, question_number) + 1):
+            self._task(quiz, number, single(number))
+        return await self._await(quiz[question_number])
+
+    def forget(self, session_id: str):
+        """Drop (and cancel) every quiz of a session."""
+        for key in [key for key in self._quizzes if key[0] == session_id]:
+            self._cancel(self._quizzes.pop(key))
+
+    def close(self):
+        for quiz in self._quizzes.values():
+            self._cancel(quiz)
+        self._quizzes.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "quizzes": len(self._quizzes),
+            "max_quizzes": self.max_quizzes,
+            "ready": self.ready,
+            "waited": self.waited,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,423 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.inference import EvaluatorBackend
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = Path(__file__).parent.parent / "models"
+DEFAULT_MODEL_FILE = "qwen_evaluator_q4_k_m.gguf"
+ROLLOUT_MODES = ("switch", "shadow", "canary")
+# Latencies kept per model for the rollout percentiles
+LATENCY_WINDOW = 1000
+
+
+class ChecksumMismatchError(Exception):
+    pass
+
+
+class RolloutError(Exception):
+    """A model switch that cannot start in the current state (maps to HTTP 409)."""
+
+
+class ModelVariant:
+    """One evaluator GGUF of the registry."""
+
+    def __init__(
+        self,
+        name: str,
+        path: Path,
+        quantization: Optional[str] = None,
+        n_ctx: Optional[int] = None,
+        sha256: Optional[str] = None,
+        description: str = "",
+    ):
+        self.name = name
+        self.path = path
+        self.quantization = quantization
+        self.n_ctx = n_ctx
+        self.sha256 = sha256.lower() if sha256 else None
+        self.description = description
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "path": str(self.path),
+            "quantization": self.quantization,
+            "n_ctx": self.n_ctx,
+            "sha256": self.sha256,
+            "description": self.description,
+            "available": self.path.is_file(),
+        }
+
+
+class ModelRegistry:
+    """
+    Evaluator GGUF variants listed in a JSON file:
+
+        {"default": "q4", "models": [
+            {"name": "q4", "path": "qwen_evaluator_q4_k_m.gguf", "quantization": "q4_k_m",
+             "n_ctx": 8192, "sha256": "..."}]}
+
+    Relative paths are resolved against the file's directory. Without the
+    file the registry holds only the bundled model. `n_ctx` caps the
+    context buckets; `sha256`, when given, is checked before loading.
+    """
+
+    def __init__(self, variants: List[ModelVariant], default: str):
+        self._variants = {variant.name: variant for variant in variants}
+        if default not in self._variants:
+            raise ValueError(f"Default model {default!r} is not in the registry")
+        self.default = default
+        self._lock = threading.Lock()
+        # (path, sha256) -> (size, mtime) of files whose checksum matched
+        self._verified: Dict[Tuple[str, str], Tuple[int, float]] = {}
+
+    @classmethod
+    def from_file(cls, path: Path, default: Optional[str] = None) -> "ModelRegistry":
+        with open(path) as f:
+            spec = json.load(f)
+        variants = [
+            ModelVariant(
+                name=entry["name"],
+                path=(path.parent / entry["path"]).resolve(),
+                quantization=entry.get("quantization"),
+                n_ctx=entry.get("n_ctx"),
+                sha256=entry.get("sha256"),
+                description=entry.get("description", ""),
+            )
+            for entry in spec["models"]
+        ]
+        return cls(variants, default or spec.get("default") or variants[0].name)
+
+    @classmethod
+    def from_env(cls) -> "ModelRegistry":
+        path = Path(os.getenv("EVALUATOR_MODEL_REGISTRY", str(MODELS_DIR / "registry.json")))
+        default = os.getenv("EVALUATOR_MODEL", "") or None
+        if path.is_file():
+            return cls.from_file(path, default)
+        bundled = ModelVariant("default", MODELS_DIR / DEFAULT_MODEL_FILE, quantization="q4_k_m")
+        return cls([bundled], default or bundled.name)
+
+    def get(self, name: str) -> ModelVariant:
+        return self._variants[name]
+
+    def variants(self) -> List[ModelVariant]:
+        return list(self._variants.values())
+
+    def verify(self, variant: ModelVariant):
+        """Check the file against its sha256 (once per size and mtime); blocking."""
+        if not variant.path.is_file():
+            raise FileNotFoundError(f"Model file not found: {variant.path}")
+        if variant.sha256 is None:
+            return
+        stat = variant.path.stat()
+        signature = (stat.st_size, stat.st_mtime)
+        key = (str(variant.path), variant.sha256)
+        with self._lock:
+            if self._verified.get(key) == signature:
+                return
+        digest = hashlib.sha256()
+        with open(variant.path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        if digest.hexdigest() != variant.sha256:
+            raise ChecksumMismatchError(f"{variant.path.name}: sha256 {digest.hexdigest()} != {variant.sha256}")
+        with self._lock:
+            self._verified[key] = signature
+
+
+class RolloutStats:
+    """Latency of both models and, in shadow mode, how often their grades agree."""
+
+    def __init__(self, score_tolerance: int):
+        self.score_tolerance = score_tolerance
+        self._latencies: Dict[str, Deque[float]] = {
+            "active": deque(maxlen=LATENCY_WINDOW), "candidate": deque(maxlen=LATENCY_WINDOW)
+        }
+        self._scores: Dict[str, List[int]] = {"active": [], "candidate": []}
+        self.compared = 0
+        self.score_agreement = 0
+        self.bias_agreement = 0
+        self.abs_score_diff = 0
+        self.abs_coverage_diff = 0
+        self.shadow_dropped = 0
+
+    def observe(self, role: str, seconds: float, evaluation: Optional[Dict] = None):
+        self._latencies[role].append(seconds)
+        if isinstance(evaluation, dict) and isinstance(evaluation.get("score_30"), int):
+            self._scores[role].append(evaluation["score_30"])
+
+    def compare(self, active: Dict, candidate: Dict):
+        self.compared += 1
+        score_diff = abs(int(active.get("score_30", 0)) - int(candidate.get("score_30", 0)))
+        self.abs_score_diff += score_diff
+        self.abs_coverage_diff += abs(int(active.get("key_coverage", 0)) - int(candidate.get("key_coverage", 0)))
+        self.score_agreement += score_diff <= self.score_tolerance
+        self.bias_agreement += bool(active.get("bias_check")) == bool(candidate.get("bias_check"))
+
+    def _latency(self, role: str) -> Dict:
+        values = np.array(self._latencies[role], dtype=np.float64)
+        if not len(values):
+            return {"count": 0}
+        p50, p95 = np.percentile(values, [50, 95])
+        return {"count": len(values), "p50_s": round(float(p50), 4), "p95_s": round(float(p95), 4)}
+
+    def stats(self) -> Dict:
+        stats = {
+            role: dict(
+                self._latency(role),
+                mean_score=round(float(np.mean(scores)), 2) if scores else None,
+            )
+            for role, scores in self._scores.items()
+        }
+        stats["compared"] = self.compared
+        stats["shadow_dropped"] = self.shadow_dropped
+        if self.compared:
+            stats["score_agreement"] = round(self.score_agreement / self.compared, 4)
+            stats["score_tolerance"] = self.score_tolerance
+            stats["mean_abs_score_diff"] = round(self.abs_score_diff / self.compared, 3)
+            stats["mean_abs_coverage_diff"] = round(self.abs_coverage_diff / self.compared, 3)
+            stats["bias_agreement"] = round(self.bias_agreement / self.compared, 4)
+        return stats
+
+
+class ModelManager:
+    """
+    The evaluator model being served, and switches between registry variants
+    without downtime.
+
+    `activate()` verifies, loads and warms the new variant next to the
+    active one, in its own EvaluatorBackend, while traffic keeps flowing:
+
+    - `switch`: new requests move to it as soon as it is warm.
+    - `shadow`: `percent`% of evaluations are also graded by it in the
+      background; clients get the active model's result.
+    - `canary`: `percent`% of requests are served by it.
+
+    `promote()` or `rollback()` ends a shadow or canary rollout. A replaced
+    backend finishes the jobs it already admitted and is freed once idle.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        backend_factory: Callable[[ModelVariant], EvaluatorBackend],
+        drain_timeout: float = 300,
+        score_tolerance: int = 3,
+    ):
+        self.registry = registry
+        self.backend_factory = backend_factory
+        self.drain_timeout = drain_timeout
+        self.score_tolerance = score_tolerance
+        self.active: Optional[EvaluatorBackend] = None
+        self.active_variant: Optional[ModelVariant] = None
+        self.candidate: Optional[EvaluatorBackend] = None
+        self.candidate_variant: Optional[ModelVariant] = None
+        self.mode: Optional[str] = None
+        self.percent = 0.0
+        self.rollout = RolloutStats(score_tolerance)
+        # idle -> verifying -> loading -> (rolling_out) -> idle, or failed
+        self.status = {"status": "idle", "target": None, "error": None}
+        self.switches = 0
+        self._retiring: List[EvaluatorBackend] = []
+        self._tasks: set = set()
+
+    @classmethod
+    def from_env(cls, backend_factory: Callable[[ModelVariant], EvaluatorBackend]) -> "ModelManager":
+        return cls(
+            ModelRegistry.from_env(),
+            backend_factory,
+            drain_timeout=float(os.getenv("EVALUATOR_DRAIN_TIMEOUT", "300")),
+            score_tolerance=int(os.getenv("EVALUATOR_SHADOW_SCORE_TOLERANCE", "3")),
+        )
+
+    def select(self, name: Optional[str] = None):
+        """Serve `name` (default: the registry default); the model loads on start() or first use."""
+        self.active_variant = self.registry.get(name or self.registry.default)
+        self.active = self.backend_factory(self.active_variant)
+
+    async def start(self):
+        """Verify and warm up the active model."""
+        await asyncio.to_thread(self.registry.verify, self.active_variant)
+        await self.active.start()
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _route(self) -> Tuple[str, EvaluatorBackend, Optional[EvaluatorBackend]]:
+        """`(role, backend, shadow backend)` for one request."""
+        candidate = self.candidate
+        if candidate is not None and random.uniform(0, 100) < self.percent:
+            if self.mode == "canary":
+                return "candidate", candidate, None
+            return "active", self.active, candidate
+        return "active", self.active, None
+
+    def _observe(self, role: str, started: float, result):
+        if self.candidate is not None:
+            self.rollout.observe(role, time.perf_counter() - started, result)
+
+    async def _shadow(self, backend: EvaluatorBackend, method: str, args, kwargs, result: Dict):
+        started = time.perf_counter()
+        try:
+            shadow_result = await backend.run(method, *args, **kwargs)
+        except Exception as e:
+            # Full queue or failure: the shadow never affects clients
+            self.rollout.shadow_dropped += 1
+            logger.warning(f"⚠️ Shadow evaluation dropped: {str(e)}")
+            return
+        if backend is self.candidate:
+            self.rollout.observe("candidate", time.perf_counter() - started, shadow_result)
+            self.rollout.compare(result, shadow_result)
+
+    async def run(self, method: str, *args, **kwargs):
+        """Run `EduAgents.<method>` on the model chosen for this request."""
+        role, backend, shadow = self._route()
+        started = time.perf_counter()
+        result = await backend.run(method, *args, **kwargs)
+        self._observe(role, started, result)
+        if shadow is not None and method == "evaluate_answer":
+            self._spawn(self._shadow(shadow, method, args, kwargs, result))
+        return result
+
+    def stream(self, method: str, *args, **kwargs) -> AsyncIterator:
+        """Stream `EduAgents.<method>` from the model chosen for this request; admission happens now."""
+        role, backend, shadow = self._route()
+        started = time.perf_counter()
+        events = backend.stream(method, *args, **kwargs)
+
+        async def _observed():
+            try:
+                async for kind, payload in events:
+                    if kind == "result":
+                        self._observe(role, started, payload)
+                        if shadow is not None:
+                            self._spawn(self._shadow(shadow, "evaluate_answer", args, kwargs, payload))
+                    yield kind, payload
+            finally:
+                await events.aclose()
+
+        return _observed()
+
+    def activate(self, name: str, mode: str = "switch", percent: float = 0.0) -> Dict:
+        """Start rolling out `name` in the background; see the class docstring for the modes."""
+        if mode not in ROLLOUT_MODES:
+            raise ValueError(f"Unknown rollout mode {mode!r}, expected one of {ROLLOUT_MODES}")
+        if not 0 <= percent <= 100:
+            raise ValueError("percent must be between 0 and 100")
+        variant = self.registry.get(name)
+        if self.status["status"] in ("verifying", "loading") or self.candidate is not None:
+            raise RolloutError(f"A rollout of {self.status['target']!r} is in progress")
+        if variant is self.active_variant:
+            raise RolloutError(f"{name!r} is already the active model")
+        self.status = {"status": "verifying", "target": name, "error": None}
+        self._spawn(self._roll_out(variant, mode, percent))
+        return self.status
+
+    async def _roll_out(self, variant: ModelVariant, mode: str, percent: float):
+        backend = None
+        try:
+            await asyncio.to_thread(self.registry.verify, variant)
+            self.status["status"] = "loading"
+            logger.info(f"🔄 Loading evaluator model {variant.name!r} for {mode}")
+            backend = self.backend_factory(variant)
+            await backend.start()
+        except Exception as e:
+            logger.error(f"❌ Could not load evaluator model {variant.name!r}: {str(e)}")
+            self.status.update(status="failed", error=str(e))
+            if backend is not None:
+                await asyncio.to_thread(backend.close)
+            return
+        if mode == "switch":
+            self._switch(backend, variant)
+            return
+        self.candidate, self.candidate_variant = backend, variant
+        self.mode, self.percent = mode, percent
+        self.rollout = RolloutStats(self.score_tolerance)
+        self.status["status"] = "rolling_out"
+        logger.info(f"🧪 Evaluator model {variant.name!r} in {mode} on {percent:g}% of requests")
+
+    def _switch(self, backend: EvaluatorBackend, variant: ModelVariant):
+        """Send new requests to `backend` at once and retire the old one in the background."""
+        previous, self.active, self.active_variant = self.active, backend, variant
+        self.candidate = self.candidate_variant = None
+        self.mode, self.percent = None, 0.0
+        self.switches += 1
+        self.status = {"status": "idle", "target": None, "error": None}
+        logger.info(f"✅ Evaluator model switched to {variant.name!r}")
+        self._spawn(self._retire(previous))
+
+    async def _retire(self, backend: EvaluatorBackend):
+        """Free `backend` once the jobs it admitted are done (or after `drain_timeout`)."""
+        self._retiring.append(backend)
+        deadline = time.monotonic() + self.drain_timeout
+        while not backend.idle() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if not backend.idle():
+            logger.warning(f"⚠️ Evaluator backend still busy after {self.drain_timeout:.0f}s, freeing it anyway")
+        await asyncio.to_thread(backend.close)
+        self._retiring.remove(backend)
+        logger.info("🔄 Previous evaluator model drained and freed")
+
+    def promote(self) -> Dict:
+        if self.candidate is None:
+            raise RolloutError("No shadow or canary rollout to promote")
+        self._switch(self.candidate, self.candidate_variant)
+        return self.status
+
+    def rollback(self) -> Dict:
+        if self.candidate is None:
+            raise RolloutError("No shadow or canary rollout to roll back")
+        candidate, name = self.candidate, self.candidate_variant.name
+        self.candidate = self.candidate_variant = None
+        self.mode, self.percent = None, 0.0
+        self.status = {"status": "idle", "target": None, "error": None}
+        logger.info(f"↩️ Rolled back evaluator model {name!r}")
+        self._spawn(self._retire(candidate))
+        return self.status
+
+    def queue_stats(self) -> Dict:
+        stats = {"evaluator": self.active.executor.stats()} if self.active is not None else {}
+        if self.candidate is not None:
+            stats["evaluator_candidate"] = self.candidate.executor.stats()
+        return stats
+
+    def stats(self) -> Dict:
+        stats = {
+            "active": self.active_variant.to_dict() if self.active_variant else None,
+            "backend": self.active.stats() if self.active else None,
+            "rollout": dict(self.status),
+            "switches": self.switches,
+            "draining": len(self._retiring),
+            "registry": [variant.to_dict() for variant in self.registry.variants()],
+        }
+        if self.candidate is not None:
+            stats["rollout"].update(
+                mode=self.mode,
+                percent=self.percent,
+                candidate=self.candidate_variant.to_dict(),
+                backend=self.candidate.stats(),
+                comparison=self.rollout.stats(),
+            )
+        return stats
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        for backend in [self.active, self.candidate, *self._retiring]:
+            if backend is not None:
+                await asyncio.to_thread(backend.close)
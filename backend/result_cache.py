@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import inspect
+import logging
+import functools
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate every stored result after a prompt change
+CACHE_SCHEMA_VERSION = 1
+
+# Returned by ResultCache.get on a miss (None can be a legitimate value)
+MISS = object()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of agent results in SQLite.
+
+    Keys hash the agent name, the model identity (weights or Gemini model
+    name, sampling params, system prompt) and the call arguments. Entries
+    expire after `ttl` seconds; beyond `max_entries` or `max_bytes` the
+    least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float,
+        max_entries: int,
+        max_bytes: int,
+        bypass: Iterable[str] = (),
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bypass: Set[str] = set(bypass)
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                agent TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results(accessed)")
+        self._count, self._bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultCache"]:
+        if os.getenv("RESULT_CACHE_ENABLED", "1") != "1":
+            return None
+        default_path = Path(__file__).parent.parent / ".cache" / "results.sqlite3"
+        return cls(
+            path=os.getenv("RESULT_CACHE_PATH", str(default_path)),
+            ttl=float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600))),
+            max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000")),
+            max_bytes=int(float(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            bypass=[a.strip() for a in os.getenv("RESULT_CACHE_BYPASS", "generate_question,generate_question_set").split(",") if a.strip()],
+        )
+
+    def enabled_for(self, agent: str) -> bool:
+        return agent not in self.bypass
+
+    @staticmethod
+    def make_key(agent: str, identity: Dict, arguments: Dict) -> str:
+        payload = json.dumps(
+            [CACHE_SCHEMA_VERSION, agent, identity, arguments],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, agent: str, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created, size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._count -= 1
+                self._bytes -= row[2]
+                row = None
+            if row is None:
+                self._misses[agent] = self._misses.get(agent, 0) + 1
+                return MISS
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._hits[agent] = self._hits.get(agent, 0) + 1
+        return json.loads(row[0])
+
+    def put(self, agent: str, key: str, value: Any):
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._count -= 1
+                self._bytes -= old[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, agent, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, agent, encoded, size, now, now),
+            )
+            self._count += 1
+            self._bytes += size
+            self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones until under budget."""
+        if self._count <= self.max_entries and self._bytes <= self.max_bytes:
+            return
+        self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        self._count, self._bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        while self._count > self.max_entries or self._bytes > self.max_bytes:
+            batch = max(1, self._count - self.max_entries, self._count // 10)
+            rows = self._db.execute(
+                "SELECT key, size FROM results ORDER BY accessed LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            self._db.executemany("DELETE FROM results WHERE key = ?", [(k,) for k, _ in rows])
+            self._count -= len(rows)
+            self._bytes -= sum(size for _, size in rows)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            agents = sorted(set(self._hits) | set(self._misses))
+            per_agent = {}
+            for agent in agents:
+                hits = self._hits.get(agent, 0)
+                lookups = hits + self._misses.get(agent, 0)
+                per_agent[agent] = {
+                    "hits": hits,
+                    "misses": lookups - hits,
+                    "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                }
+            return {
+                "entries": self._count,
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "bypass": sorted(self.bypass),
+                "agents": per_agent,
+            }
+
+
+def cached_result(agent: str, skip: Callable[[Any], bool] = lambda result: False, ignore: Tuple[str, ...] = ()):
+    """
+    Cache an EduAgents method in `self.result_cache`.
+
+    The key covers `self._cache_identity(agent)` and the bound call
+    arguments, except those named in `ignore` (derived from the others);
+    results for which `skip(result)` is true (fallback payloads) are
+    returned but never stored.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        def lookup(self, args, kwargs):
+            cache = self.result_cache
+            if cache is None or not cache.enabled_for(agent):
+                return None, MISS
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = {k: v for k, v in bound.arguments.items() if k != "self" and k not in ignore}
+            key = cache.make_key(agent, self._cache_identity(agent), arguments)
+            return key, cache.get(agent, key)
+
+        def store(self, key, result):
+            if key is not None and not skip(result):
+                self.result_cache.put(agent, key, result)
+
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                key, result = lookup(self, args, kwargs)
+                if result is not MISS:
+                    return result
+                result = await method(self, *args, **kwargs)
+                store(self, key, result)
+                return result
+        else:
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                key, result = lookup(self, args, kwargs)
+                if result is not MISS:
+                    return result
+                result = method(self, *args, **kwargs)
+                store(self, key, result)
+                return result
+
+        return wrapper
+    return decorator
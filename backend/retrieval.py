@@ -0,0 +1,243 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Collection, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TERM_PATTERN = re.compile(r"\w+")
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Placed between passages that are not contiguous in the document
+PASSAGE_SEPARATOR = "\n...\n"
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word terms; single letters are dropped, single digits kept."""
+    return [term for term in TERM_PATTERN.findall(text.lower()) if len(term) > 1 or term.isdigit()]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def chunk_spans(text: str, chunk_chars: int, overlap_chars: int) -> List[Tuple[int, int]]:
+    """
+    Split `text` into overlapping `(start, end)` spans of about `chunk_chars`.
+
+    Each chunk ends on the last paragraph break, line break, sentence end or
+    space in its second half, so passages rarely cut a sentence in two.
+    """
+    spans = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_chars, length)
+        if end < length:
+            floor = start + chunk_chars // 2
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(separator, floor, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        spans.append((start, end))
+        if end >= length:
+            break
+        next_start = max(end - overlap_chars, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return spans
+
+
+class DocumentIndex:
+    """
+    BM25 index over the chunks of one document.
+
+    The inverted index is stored as compact arrays (CSR layout): the
+    postings of term `t` are `posting_chunks[offsets[t]:offsets[t + 1]]`
+    with matching term frequencies in `posting_tf`. Chunks are spans into
+    the original text, so no passage text is duplicated.
+    """
+
+    def __init__(self, text: str, chunk_chars: int = 1200, overlap_chars: int = 200):
+        self.text = text
+        spans = chunk_spans(text, chunk_chars, overlap_chars)
+        self.starts = np.array([s for s, _ in spans], dtype=np.int64)
+        self.ends = np.array([e for _, e in spans], dtype=np.int64)
+        self.chunk_tokens = np.array([estimate_tokens(text[s:e]) for s, e in spans], dtype=np.int32)
+        self.total_tokens = estimate_tokens(text)
+
+        vocabulary: Dict[str, int] = {}
+        term_ids, chunk_ids, frequencies = [], [], []
+        chunk_lengths = np.zeros(len(spans), dtype=np.float32)
+        for chunk_id, (start, end) in enumerate(spans):
+            counts: Dict[int, int] = {}
+            terms = tokenize(text[start:end])
+            for term in terms:
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            chunk_lengths[chunk_id] = len(terms)
+            term_ids.extend(counts.keys())
+            chunk_ids.extend([chunk_id] * len(counts))
+            frequencies.extend(counts.values())
+
+        term_ids = np.array(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        self.vocabulary = vocabulary
+        self.posting_chunks = np.array(chunk_ids, dtype=np.int32)[order]
+        self.posting_tf = np.array(frequencies, dtype=np.float32)[order]
+        document_frequency = np.bincount(term_ids, minlength=len(vocabulary))
+        self.offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=self.offsets[1:])
+
+        n_chunks = len(spans)
+        self.idf = np.log1p((n_chunks - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        average_length = float(chunk_lengths.mean()) if n_chunks else 0.0
+        # Per-chunk BM25 length normalisation, precomputed once
+        self.length_norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk_lengths / max(average_length, 1.0))
+
+    @property
+    def n_chunks(self) -> int:
+        return len(self.starts)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-`k` `(chunk_id, score)` pairs for `query`, best first; chunks with no query term are left out."""
+        scores = np.zeros(self.n_chunks, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            lo, hi = self.offsets[term_id], self.offsets[term_id + 1]
+            chunks = self.posting_chunks[lo:hi]
+            tf = self.posting_tf[lo:hi]
+            scores[chunks] += self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + self.length_norm[chunks])
+
+        k = min(k, self.n_chunks)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(c), float(scores[c])) for c in top if scores[c] > 0]
+
+    def passages(self, query: str, token_budget: int, k: int) -> str:
+        """
+        The passages most relevant to `query` that fit in `token_budget`.
+
+        Up to `k` top-scoring chunks are taken greedily while they fit, then
+        put back in document order with overlapping chunks merged. With no
+        match the document is read from the beginning instead. A document
+        that already fits the budget is returned unchanged.
+        """
+        if self.total_tokens <= token_budget:
+            return self.text
+
+        ranked = [chunk for chunk, _ in self.search(query, k)]
+        if not ranked:
+            ranked = range(self.n_chunks)
+
+        selected, used = [], 0
+        for chunk in ranked:
+            cost = int(self.chunk_tokens[chunk])
+            if used + cost > token_budget:
+                continue
+            selected.append(chunk)
+            used += cost
+            if len(selected) >= k:
+                break
+
+        spans: List[List[int]] = []
+        for chunk in sorted(selected):
+            start, end = int(self.starts[chunk]), int(self.ends[chunk])
+            if spans and start <= spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([start, end])
+        return PASSAGE_SEPARATOR.join(self.text[start:end].strip() for start, end in spans)
+
+
+class DocumentIndexStore:
+    """
+    LRU of DocumentIndex objects keyed by a hash of the document text.
+
+    Documents are indexed on upload; agents look their context up by the
+    same hash and index it on a miss, so a restart only costs one rebuild.
+    """
+
+    def __init__(self, max_documents: int = 32, chunk_chars: int = 1200, overlap_chars: int = 200, top_k: int = 8):
+        self.max_documents = max_documents
+        self.chunk_chars = chunk_chars
+        self.overlap_chars = overlap_chars
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._indexes: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "DocumentIndexStore":
+        return cls(
+            max_documents=int(os.getenv("RETRIEVAL_MAX_DOCUMENTS", "32")),
+            chunk_chars=int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1200")),
+            overlap_chars=int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "200")),
+            top_k=int(os.getenv("RETRIEVAL_TOP_K", "8")),
+        )
+
+    @staticmethod
+    def document_key(text: str) -> str:
+        # Stored documents (backend.documents.DocumentText) carry their hash
+        key = getattr(text, "key", None)
+        return key if key is not None else hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def settings(self) -> Dict:
+        """Parameters that change which passages are selected (part of result-cache keys)."""
+        return {"chunk_chars": self.chunk_chars, "overlap_chars": self.overlap_chars, "top_k": self.top_k}
+
+    def index(self, text: str) -> DocumentIndex:
+        key = self.document_key(text)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                self.hits += 1
+                return index
+            self.misses += 1
+
+        index = DocumentIndex(text, self.chunk_chars, self.overlap_chars)
+        logger.info(f"📑 Indexed document: {index.n_chunks} chunks, {len(index.vocabulary)} terms")
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_documents:
+                self._indexes.popitem(last=False)
+        return index
+
+    def passages(self, text: str, query: str, token_budget: int) -> str:
+        """Top passages of `text` for `query` within `token_budget` (see DocumentIndex.passages)."""
+        if estimate_tokens(text) <= token_budget:
+            return text
+        return self.index(text).passages(query, token_budget, self.top_k)
+
+    def vocabulary(self, text: str, token_budget: int) -> Collection[str]:
+        """Terms of `text`; a document longer than `token_budget` is indexed (as by `passages`) and its vocabulary reused."""
+        if estimate_tokens(text) <= token_budget:
+            return set(tokenize(text))
+        return self.index(text).vocabulary
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "documents": len(self._indexes),
+                "max_documents": self.max_documents,
+                "chunks": sum(index.n_chunks for index in self._indexes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -1,19 +1,115 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import uvicorn
+import asyncio
+import time
 import os
 import sys
+import traceback
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # Add backend to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from backend.agents import EduAgents
-from backend.tools import Tools
+from backend.agents import EduAgents, DASHBOARD_FALLBACK, PARSE_FALLBACK_EVALUATION
+from backend.analytics import session_analytics
+from backend.analysis import AnalysisJobNotFoundError, AnalysisJobStore
+from backend.documents import DocumentNotFoundError, DocumentStore
+from backend.sessions import SessionNotFoundError, SessionStore
+from backend.questions import QuestionPrefetcher
+from backend.tools import Tools, UploadTooLargeError
+from backend.inference import InferenceLayer, QueueFullError, QueueTimeoutError
+from backend.registry import ModelManager, RolloutError
+from backend.streaming import sse_event
+from backend.metrics import (
+    HTTP_IN_FLIGHT, HTTP_LATENCY, REGISTRY, server_timing, start_request_timing, timing_headers_enabled
+)
+
+# Agents are created at startup; see lifespan()
+agents = None
+
+# Builds the agents; the load test (backend.loadtest) swaps in fake backends
+agents_factory = EduAgents
+
+# Evaluator model(s) being served; created with the agents
+models = None
+
+# Blocking model calls run here, never on the event loop
+inference = InferenceLayer()
+
+# Practice sessions; the parse fallback's placeholder is not a concept the student missed
+sessions = SessionStore.from_env(ignored_concepts=PARSE_FALLBACK_EVALUATION["missing_concepts"])
+
+# Quiz questions generated ahead of the student, per session
+question_prefetcher = QuestionPrefetcher.from_env()
 
-app = FastAPI(title="Edu-Distill API")
+# Uploaded documents, referenced by doc_id instead of re-sending their text
+documents = DocumentStore.from_env()
+
+# Document analyses running in the background
+analysis_jobs = AnalysisJobStore.from_env()
+
+# Reported by /readyz: starting -> warming -> ready, or failed
+readiness = {"status": "starting", "error": None, "warmup_s": None}
+
+def create_agents():
+    global agents, models
+    try:
+        agents = agents_factory()
+        models = ModelManager.from_env(
+            lambda variant: inference.evaluator_backend(agents.with_model(variant.path, variant.n_ctx))
+        )
+        models.select()
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Error initializing agents: {e}")
+        readiness.update(status="failed", error=f"Error initializing agents: {e}")
+
+async def warm_up_evaluator():
+    """Load the evaluator and run a short generation before reporting ready."""
+    readiness["status"] = "warming"
+    started = time.perf_counter()
+    try:
+        # In process this runs in the evaluator queue, so the model is never
+        # shared; with a worker pool each worker loads (and warms up) its own
+        await models.start()
+        readiness.update(status="ready", warmup_s=round(time.perf_counter() - started, 2))
+        print(f"✅ Evaluator warmed up in {readiness['warmup_s']}s")
+    except Exception as e:
+        print(f"❌ Evaluator warm-up failed: {e}")
+        readiness.update(status="failed", error=str(e))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # PDF workers fork before any model or worker thread exists
+    inference.warm_up_extraction()
+    create_agents()
+    warm_up_task = None
+    if models is not None:
+        # The worker pool always starts here; EVALUATOR_WARMUP then only
+        # decides whether the workers warm up before reporting ready
+        if os.getenv("EVALUATOR_WARMUP", "1") == "1" or models.active.pool is not None:
+            warm_up_task = asyncio.create_task(warm_up_evaluator())
+        else:
+            # Lazy loading: the first evaluation pays for the model load
+            readiness["status"] = "ready"
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    question_prefetcher.close()
+    analysis_jobs.close()
+    if models is not None:
+        await models.close()
+    inference.shutdown()
+    sessions.close()
+    if agents is not None:
+        await agents.gemini.aclose()
+
+app = FastAPI(title="Edu-Distill API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -24,157 +120,705 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Agents
-agents = None
-try:
-    agents = EduAgents()
-except Exception as e:
-    import traceback
-    traceback.print_exc()
-    print(f"Error initializing agents: {e}")
-    # We might want to handle this more gracefully, but for now let's print
-    pass
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(QueueTimeoutError)
+async def queue_timeout_handler(request: Request, exc: QueueTimeoutError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+def check_session(session_id: Optional[str]):
+    if session_id is not None and not sessions.exists(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+def record_in_session(session_id: Optional[str], evaluation: dict):
+    if session_id is None:
+        return
+    try:
+        sessions.append(session_id, evaluation)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
 
 def check_agents_initialized():
-    if agents is None:
+    if agents is None or models is None:
         raise HTTPException(
             status_code=503, 
             detail="Backend agents not initialized. Please check server logs (likely missing GEMINI_API_KEY)."
         )
 
+def get_document(doc_id: str):
+    try:
+        return documents.get(doc_id)
+    except DocumentNotFoundError:
+        raise HTTPException(status_code=404, detail="Document not found, upload it again")
+
+def resolve_document(text: Optional[str], doc_id: Optional[str], field: str) -> str:
+    """The document text of a request: inline in `field`, or stored under `doc_id`."""
+    if (text is None) == (doc_id is None):
+        raise HTTPException(status_code=400, detail=f"Pass either {field} or doc_id")
+    if doc_id is not None:
+        return get_document(doc_id).text
+    return text
+
 # Pydantic Models
+# Document text is sent inline or as the doc_id returned by /upload or /documents
 class AnalyzeRequest(BaseModel):
+    text: Optional[str] = None
+    doc_id: Optional[str] = None
+
+class DocumentRequest(BaseModel):
     text: str
 
 class GenerateQuestionRequest(BaseModel):
-    context: str
+    context: Optional[str] = None
+    doc_id: Optional[str] = None
     topic: str
     difficulty: str
     question_number: Optional[int] = 1
+    total_questions: Optional[int] = 3
+    # With a session the whole quiz is generated ahead (see QuestionPrefetcher)
+    session_id: Optional[str] = None
 
 class EvaluateRequest(BaseModel):
-    context: str
+    context: Optional[str] = None
+    doc_id: Optional[str] = None
     question: str
     student_answer: str
+    # Appends the result to this practice session (see POST /sessions)
+    session_id: Optional[str] = None
+
+QUEUE_DEPTH = REGISTRY.gauge("edu_queue_depth", "Jobs waiting in an executor queue.", ["queue"])
+QUEUE_RUNNING = REGISTRY.gauge("edu_queue_running", "Jobs running in an executor.", ["queue"])
+QUEUE_REJECTED = REGISTRY.gauge("edu_queue_rejected", "Jobs rejected with 429 since startup.", ["queue"])
+GEMINI_IN_FLIGHT = REGISTRY.gauge("edu_gemini_requests_in_flight", "Gemini HTTP requests in flight.")
+CACHE_HIT_RATIO = REGISTRY.gauge("edu_cache_hit_ratio", "Hit ratio since startup.", ["cache"])
+
+def collect_runtime_metrics():
+    """Mirror queue, gateway and cache state into gauges on every scrape."""
+    queues = dict(inference.stats(), **(models.queue_stats() if models is not None else {}))
+    for name, queue in queues.items():
+        if "queued" in queue:
+            QUEUE_DEPTH.set(queue["queued"], queue=name)
+            QUEUE_RUNNING.set(queue["running"], queue=name)
+            QUEUE_REJECTED.set(queue["rejected"], queue=name)
+    if agents is not None:
+        GEMINI_IN_FLIGHT.set(agents.gemini.stats()["in_flight"])
+        CACHE_HIT_RATIO.set(agents.state_cache.stats()["hit_ratio"], cache="prompt_state")
+        if agents.result_cache is not None:
+            for agent, agent_stats in agents.result_cache.stats()["agents"].items():
+                CACHE_HIT_RATIO.set(agent_stats["hit_ratio"], cache=f"result:{agent}")
+
+REGISTRY.add_collector(collect_runtime_metrics)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Request latency, in-flight gauge and (optionally) a Server-Timing header per request."""
+    timings = start_request_timing()
+    started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if timing_headers_enabled():
+            response.headers["Server-Timing"] = server_timing(timings, time.perf_counter() - started)
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        HTTP_LATENCY.observe(
+            time.perf_counter() - started,
+            route=getattr(route, "path", "unmatched"),
+            method=request.method,
+            status=str(status)
+        )
+
+@app.get("/metrics")
+def read_metrics():
+    """Prometheus text exposition of the latency, token, model and queue metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "Edu-Distill API is running"}
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+@app.get("/healthz")
+def read_health():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def read_ready():
+    """Readiness: agents initialized and the evaluator loaded and warmed up."""
+    status_code = 200 if readiness["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=readiness)
+
+@app.get("/stats")
+def read_stats():
+    stats = {"queues": inference.stats()}
+    if models is not None:
+        stats["queues"].update(models.queue_stats())
+        stats["models"] = models.stats()
+    if agents is not None:
+        stats["prompt_state_cache"] = agents.state_cache.stats()
+        if agents.result_cache is not None:
+            stats["result_cache"] = agents.result_cache.stats()
+        stats["gemini"] = agents.gemini.stats()
+        stats["documents"] = agents.documents.stats()
+        if agents.triage is not None:
+            stats["triage"] = agents.triage.stats()
+    stats["sessions"] = sessions.stats()
+    stats["question_prefetch"] = question_prefetcher.stats()
+    stats["analysis_jobs"] = analysis_jobs.stats()
+    stats["document_store"] = documents.stats()
+    return stats
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024)
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+async def spool_pdf(file: UploadFile, first_page: Optional[int], last_page: Optional[int]):
+    """Spool an uploaded PDF to disk and resolve the page range; returns (path, start, stop, pages)."""
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-    
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Save to temp file for PyPDF2 (it expects a file-like object or path)
-        # But Tools.extract_text_from_pdf expects a file-like object
-        # We can wrap bytes in BytesIO
-        from io import BytesIO
-        file_obj = BytesIO(content)
-        
-        text = Tools.extract_text_from_pdf(file_obj)
-        return {"text": text, "filename": file.filename}
+        path = await Tools.spool_upload(file, MAX_UPLOAD_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        page_count = await Tools.count_pdf_pages(path, inference.run_extraction)
+        start, stop = Tools.resolve_page_range(page_count, first_page, last_page)
+        return path, start, stop, page_count
+    except ValueError as e:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        os.unlink(path)
+        raise
+
+async def store_document(text: str, filename: Optional[str] = None, pages: Optional[int] = None):
+    """
+    Store the text under its doc_id and build the retrieval index now, so
+    the first question does not pay for it.
+    """
+    try:
+        document = await asyncio.to_thread(documents.put, text, filename, pages)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if agents is not None:
+        await asyncio.to_thread(agents.documents.index, document.text)
+    return document
+
+@app.post("/upload")
+async def upload_file(
+    file: UploadFile = File(...),
+    first_page: Optional[int] = Query(None, ge=1),
+    last_page: Optional[int] = Query(None, ge=1),
+    include_text: bool = Query(True)
+):
+    """
+    Extract and store a PDF. Later requests pass the returned `doc_id`
+    instead of the text; with `include_text=false` the text is not sent back.
+    """
+    path, start, stop, page_count = await spool_pdf(file, first_page, last_page)
+    try:
+        text = await Tools.extract_text_from_pdf_path(
+            path, start, stop, inference.run_extraction, PDF_PAGES_PER_TASK
+        )
+        document = await store_document(text, file.filename, page_count)
+        response = {
+            "doc_id": document.id,
+            "chars": len(text),
+            "filename": file.filename,
+            "pages": page_count,
+            "first_page": start + 1,
+            "last_page": stop
+        }
+        if include_text:
+            response["text"] = text
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        os.unlink(path)
+
+@app.post("/upload-stream")
+async def upload_file_stream(
+    file: UploadFile = File(...),
+    first_page: Optional[int] = Query(None, ge=1),
+    last_page: Optional[int] = Query(None, ge=1)
+):
+    """
+    Server-Sent Events variant of /upload.
+
+    Emits a `document` event with the page count and range, then one `page`
+    event per page in order as soon as its text is extracted, then `done`
+    with the `doc_id` of the stored text. Failures after the stream started
+    arrive as `error`.
+    """
+    path, start, stop, page_count = await spool_pdf(file, first_page, last_page)
+
+    async def event_source():
+        pages = Tools.iter_pdf_pages(path, start, stop, inference.run_extraction, PDF_PAGES_PER_TASK)
+        try:
+            yield sse_event("document", {
+                "filename": file.filename,
+                "pages": page_count,
+                "first_page": start + 1,
+                "last_page": stop
+            })
+            texts = []
+            async for page_number, text in pages:
+                texts.append(text + "\n")
+                yield sse_event("page", {"page": page_number, "text": text})
+            document = await store_document("".join(texts), file.filename, page_count)
+            yield sse_event("done", {"doc_id": document.id, "chars": len(document.text)})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            await pages.aclose()
+            os.unlink(path)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/documents")
+async def create_document(request: DocumentRequest):
+    """Store text from another source; returns the same `doc_id` as /upload for the same text."""
+    return (await store_document(request.text)).to_dict()
+
+@app.get("/documents/{doc_id}")
+def read_document(doc_id: str, include_text: bool = Query(False)):
+    document = get_document(doc_id)
+    response = document.to_dict()
+    if include_text:
+        response["text"] = document.text
+    return response
+
+@app.delete("/documents/{doc_id}")
+def delete_document(doc_id: str):
+    if not documents.delete(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"deleted": doc_id}
+
+def resolve_analysis_input(request: AnalyzeRequest):
+    """`(text, chunks)` to analyze; a stored document's chunks are split once and kept with it."""
+    if request.doc_id is not None and request.text is None:
+        document = get_document(request.doc_id)
+        return document.text, document.derived("analysis_chunks", agents.document_chunks)
+    return resolve_document(request.text, request.doc_id, "text"), None
 
 @app.post("/analyze-document")
 async def analyze_document(request: AnalyzeRequest):
     check_agents_initialized()
+    text, chunks = resolve_analysis_input(request)
     try:
-        analysis = agents.analyze_document(request.text)
+        analysis = await agents.analyze_document(text, chunks)
         return analysis
+    except (QueueFullError, QueueTimeoutError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analysis-jobs", status_code=202)
+async def start_analysis_job(request: AnalyzeRequest):
+    """
+    Background variant of /analyze-document for long documents.
+
+    Returns a `job_id` at once; poll `GET /analysis-jobs/{job_id}` or
+    follow `GET /analysis-jobs/{job_id}/events` for progress and the result.
+    """
+    check_agents_initialized()
+    text, chunks = resolve_analysis_input(request)
+    job = analysis_jobs.submit(agents, text, chunks)
+    return job.to_dict()
+
+def get_analysis_job(job_id: str):
+    try:
+        return analysis_jobs.get(job_id)
+    except AnalysisJobNotFoundError:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+
+@app.get("/analysis-jobs/{job_id}")
+def read_analysis_job(job_id: str):
+    return get_analysis_job(job_id).to_dict()
+
+@app.get("/analysis-jobs/{job_id}/events")
+async def read_analysis_job_events(job_id: str):
+    """
+    Server-Sent Events of an analysis job: a `progress` event as each
+    chunk is analyzed, then `result` (the /analyze-document payload) or
+    `error`. Disconnecting does not cancel the job.
+    """
+    events = get_analysis_job(job_id).events()
+
+    async def event_source():
+        try:
+            async for kind, payload in events:
+                yield sse_event(kind, payload)
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.delete("/analysis-jobs/{job_id}")
+def cancel_analysis_job(job_id: str):
+    if not analysis_jobs.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return {"cancelled": job_id}
+
 @app.post("/generate-question")
 async def generate_question(request: GenerateQuestionRequest):
     check_agents_initialized()
+    check_session(request.session_id)
+    if request.question_number < 1 or request.total_questions < request.question_number:
+        raise HTTPException(status_code=400, detail="question_number must be between 1 and total_questions")
+    context = resolve_document(request.context, request.doc_id, "context")
     try:
-        question = agents.generate_question(
-            request.context, 
-            request.topic, 
-            request.difficulty
-        )
+        if request.session_id is not None:
+            question = await question_prefetcher.question(
+                agents,
+                request.session_id,
+                context,
+                request.topic,
+                request.difficulty,
+                request.question_number,
+                request.total_questions
+            )
+        else:
+            question = await agents.generate_question(
+                context,
+                request.topic, 
+                request.difficulty,
+                request.question_number,
+                request.total_questions
+            )
         return {"question": question}
+    except (QueueFullError, QueueTimeoutError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def format_evaluation(raw_evaluation: dict) -> dict:
+    """
+    Transform an evaluator result to match the frontend Evaluation interface:
+
+    interface Evaluation {
+        score: number;
+        accuracy_percentage: number;
+        feedback: string;
+        key_points_covered: string[];
+        missing_concepts: string[];
+        strengths: string;
+        improvements: string;
+        raw_evaluation?: any;
+    }
+    """
+    score_30 = raw_evaluation.get("score_30", 0)
+    accuracy = (score_30 / 30) * 100
+    
+    return {
+        "score": score_30,
+        "accuracy_percentage": accuracy,
+        "feedback": raw_evaluation.get("feedback", ""),
+        "key_points_covered": [], # Not provided by current agent, defaulting to empty
+        "missing_concepts": raw_evaluation.get("missing_concepts", []),
+        "strengths": "Good effort", # Placeholder
+        "improvements": "See feedback", # Placeholder
+        "raw_evaluation": raw_evaluation
+    }
+
+async def triage_answers(context: str, question: str, student_answers: List[str]) -> List[Optional[dict]]:
+    """
+    Zero-score evaluations of the trivial answers, None for the ones the
+    evaluator has to grade. Runs before admission: a trivial answer never
+    waits in the evaluator queue.
+    """
+    return await asyncio.to_thread(
+        lambda: [agents.triage_answer(context, question, answer) for answer in student_answers]
+    )
+
 @app.post("/evaluate")
 async def evaluate_answer(request: EvaluateRequest):
     check_agents_initialized()
+    check_session(request.session_id)
+    context = resolve_document(request.context, request.doc_id, "context")
+    triaged, = await triage_answers(context, request.question, [request.student_answer])
+    if triaged is not None:
+        evaluation = format_evaluation(triaged)
+        record_in_session(request.session_id, evaluation)
+        return evaluation
     try:
-        raw_evaluation = agents.evaluate_answer(
-            request.context,
+        raw_evaluation = await models.run(
+            "evaluate_answer",
+            context,
             request.question,
             request.student_answer
         )
-        
-        # Transform to match frontend Evaluation interface
-        # interface Evaluation {
-        #     score: number;
-        #     accuracy_percentage: number;
-        #     feedback: string;
-        #     key_points_covered: string[];
-        #     missing_concepts: string[];
-        #     strengths: string;
-        #     improvements: string;
-        #     raw_evaluation?: any;
-        # }
-        
-        score_30 = raw_evaluation.get("score_30", 0)
-        accuracy = (score_30 / 30) * 100
-        
-        return {
-            "score": score_30,
-            "accuracy_percentage": accuracy,
-            "feedback": raw_evaluation.get("feedback", ""),
-            "key_points_covered": [], # Not provided by current agent, defaulting to empty
-            "missing_concepts": raw_evaluation.get("missing_concepts", []),
-            "strengths": "Good effort", # Placeholder
-            "improvements": "See feedback", # Placeholder
-            "raw_evaluation": raw_evaluation
-        }
+
+        evaluation = format_evaluation(raw_evaluation)
+        record_in_session(request.session_id, evaluation)
+        return evaluation
+    except (QueueFullError, QueueTimeoutError, HTTPException):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/evaluate-stream")
+async def evaluate_answer_stream(request: EvaluateRequest):
+    """
+    Server-Sent Events variant of /evaluate.
+
+    Emits one `field` event per top-level evaluator field as soon as it is
+    generated (score_30 first), then a `result` event with the same payload
+    /evaluate returns. Failures after the stream started arrive as `error`.
+    Triaged answers get the same events at once.
+    """
+    check_agents_initialized()
+    check_session(request.session_id)
+    context = resolve_document(request.context, request.doc_id, "context")
+    triaged, = await triage_answers(context, request.question, [request.student_answer])
+    if triaged is not None:
+        events = triaged_events(triaged)
+    else:
+        # Admission happens here, so a full queue is still a plain 429
+        events = models.stream(
+            "stream_evaluation",
+            context,
+            request.question,
+            request.student_answer
+        )
+
+    async def event_source():
+        try:
+            async for kind, payload in events:
+                if kind == "result":
+                    evaluation = format_evaluation(payload)
+                    record_in_session(request.session_id, evaluation)
+                    yield sse_event("result", evaluation)
+                else:
+                    yield sse_event(kind, payload)
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def triaged_events(evaluation: dict):
+    """The `(kind, payload)` events of stream_evaluation, for a triaged answer."""
+    for key, value in evaluation.items():
+        yield "field", {key: value}
+    yield "result", evaluation
+
+class EvaluateBatchRequest(BaseModel):
+    context: Optional[str] = None
+    doc_id: Optional[str] = None
+    question: str
+    student_answers: List[str]
+
+MAX_BATCH_ANSWERS = int(os.getenv("EVALUATOR_BATCH_MAX", "64"))
+
+@app.post("/evaluate-batch")
+async def evaluate_batch(request: EvaluateBatchRequest):
+    check_agents_initialized()
+    if not request.student_answers:
+        raise HTTPException(status_code=400, detail="student_answers must not be empty")
+    if len(request.student_answers) > MAX_BATCH_ANSWERS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BATCH_ANSWERS} answers per batch"
+        )
+    context = resolve_document(request.context, request.doc_id, "context")
+    raw_evaluations = await triage_answers(context, request.question, request.student_answers)
+    pending = [i for i, raw in enumerate(raw_evaluations) if raw is None]
+    try:
+        if pending:
+            # One executor job for the whole batch keeps the shared prefix in the KV cache
+            evaluated = await models.run(
+                "evaluate_batch",
+                context,
+                request.question,
+                [request.student_answers[i] for i in pending]
+            )
+            for i, raw in zip(pending, evaluated):
+                raw_evaluations[i] = raw
+        return {"results": [format_evaluation(raw) for raw in raw_evaluations]}
+    except (QueueFullError, QueueTimeoutError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 class DashboardRequest(BaseModel):
     evaluations: List[dict]
 
+def dashboard_analytics(evaluations: List[dict]) -> dict:
+    return session_analytics(evaluations, ignored_concepts=sessions.ignored_concepts)
+
+EMPTY_DASHBOARD = {
+    "overall_accuracy": 0,
+    "question_scores": [],
+    "strengths_summary": "No evaluations yet.",
+    "areas_for_improvement": "Start a quiz to get feedback.",
+    "performance_trend": "Stable",
+    "recommendations": ["Start practicing!"]
+}
+
+def dashboard_response(analytics: dict, feedback: dict) -> dict:
+    return {
+        "overall_accuracy": analytics["overall_accuracy"],
+        "question_scores": analytics["question_scores"],
+        "strengths_summary": feedback.get("strengths_summary", "Good effort."),
+        "areas_for_improvement": feedback.get("areas_for_improvement", "Keep practicing."),
+        "performance_trend": analytics["trend"]["label"],
+        "recommendations": feedback.get("recommendations", ["Review material."]),
+        "analytics": analytics
+    }
+
+@app.post("/dashboard-analytics")
+async def get_dashboard_analytics(request: DashboardRequest):
+    """Numeric dashboard (scores, trend, coverage, recurring concepts) without an LLM call."""
+    return dashboard_analytics(request.evaluations)
+
 @app.post("/generate-dashboard")
 async def generate_dashboard(request: DashboardRequest):
     check_agents_initialized()
     try:
         evaluations = request.evaluations
         if not evaluations:
-            return {
-                "overall_accuracy": 0,
-                "question_scores": [],
-                "strengths_summary": "No evaluations yet.",
-                "areas_for_improvement": "Start a quiz to get feedback.",
-                "performance_trend": "Stable",
-                "recommendations": ["Start practicing!"]
-            }
-            
-        scores = [e.get("accuracy_percentage", 0) for e in evaluations]
-        overall_accuracy = sum(scores) / len(scores) if scores else 0
-        
-        # Generate AI feedback
-        feedback = agents.generate_dashboard_feedback(evaluations)
-                
-        return {
-            "overall_accuracy": overall_accuracy,
-            "question_scores": [round(s) for s in scores],
-            "strengths_summary": feedback.get("strengths_summary", "Good effort."),
-            "areas_for_improvement": feedback.get("areas_for_improvement", "Keep practicing."),
-            "performance_trend": feedback.get("performance_trend", "Consistent"),
-            "recommendations": feedback.get("recommendations", ["Review material."])
-        }
+            return dict(EMPTY_DASHBOARD)
+
+        analytics = dashboard_analytics(evaluations)
+
+        # Generate AI feedback from the analytics digest
+        feedback = await agents.generate_dashboard_feedback(analytics)
+        return dashboard_response(analytics, feedback)
+    except (QueueFullError, QueueTimeoutError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/sessions")
+def create_session():
+    """Start a practice session; pass its id as `session_id` to /evaluate."""
+    return {"session_id": sessions.create()}
+
+@app.get("/sessions/{session_id}/analytics")
+def get_session_analytics(session_id: str):
+    """Running analytics of a session, no LLM call."""
+    try:
+        analytics, _, _ = sessions.dashboard(session_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return analytics
+
+@app.get("/sessions/{session_id}/dashboard")
+async def get_session_dashboard(session_id: str):
+    """
+    /generate-dashboard for a stored session. The analytics are kept up to
+    date as evaluations arrive; Gemini is only called when evaluations were
+    added since the last narrative.
+    """
+    check_agents_initialized()
+    try:
+        analytics, version, narrative = sessions.dashboard(session_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if version == 0:
+        return dict(EMPTY_DASHBOARD, session_id=session_id)
+    try:
+        if narrative is None:
+            narrative = await agents.generate_dashboard_feedback(analytics)
+            if narrative != DASHBOARD_FALLBACK:
+                sessions.set_narrative(session_id, narrative, version)
+        return dict(dashboard_response(analytics, narrative), session_id=session_id)
+    except (QueueFullError, QueueTimeoutError):
+        raise
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    question_prefetcher.forget(session_id)
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"deleted": session_id}
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def check_admin(token: Optional[str]):
+    """Admin endpoints need ADMIN_TOKEN set on the server and sent as X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    check_agents_initialized()
+
+class ActivateModelRequest(BaseModel):
+    name: str
+    # switch: serve it once warm; shadow/canary: compare it on `percent`% of requests first
+    mode: str = "switch"
+    percent: float = 0.0
+
+@app.get("/admin/models")
+def list_models(x_admin_token: Optional[str] = Header(None)):
+    """Registry variants, the active model and any rollout in progress."""
+    check_admin(x_admin_token)
+    return models.stats()
+
+@app.post("/admin/models/activate", status_code=202)
+async def activate_model(request: ActivateModelRequest, x_admin_token: Optional[str] = Header(None)):
+    """Load and warm up a registry variant in the background, then switch to it or start a shadow/canary rollout."""
+    check_admin(x_admin_token)
+    try:
+        return models.activate(request.name, request.mode, request.percent)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model {request.name!r}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RolloutError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/admin/models/promote")
+async def promote_model(x_admin_token: Optional[str] = Header(None)):
+    """End a shadow/canary rollout by switching to the candidate."""
+    check_admin(x_admin_token)
+    try:
+        return models.promote()
+    except RolloutError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/admin/models/rollback")
+async def rollback_model(x_admin_token: Optional[str] = Header(None)):
+    """End a shadow/canary rollout by dropping the candidate."""
+    check_admin(x_admin_token)
+    try:
+        return models.rollback()
+    except RolloutError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 if __name__ == "__main__":
     uvicorn.run("backend.server:app", host="0.0.0.0", port=8002, reload=True)
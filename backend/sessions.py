@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from backend.analytics import RunningAnalytics
+
+logger = logging.getLogger(__name__)
+
+
+class SessionNotFoundError(KeyError):
+    pass
+
+
+class Session:
+    """One practice session: its running analytics and the last dashboard narrative."""
+
+    def __init__(self, session_id: str, ignored_concepts: Iterable[str], created: Optional[float] = None):
+        self.id = session_id
+        self.created = created if created is not None else time.time()
+        self.updated = self.created
+        self.analytics = RunningAnalytics(ignored_concepts)
+        # Narrative generated for `narrative_version` evaluations
+        self.narrative: Optional[Dict] = None
+        self.narrative_version = -1
+        self._snapshot: Optional[Dict] = None
+
+    @property
+    def version(self) -> int:
+        """Sessions are append-only, so the evaluation count identifies the data."""
+        return len(self.analytics)
+
+    def snapshot(self) -> Dict:
+        if self._snapshot is None or self._snapshot["questions"] != self.version:
+            self._snapshot = self.analytics.snapshot()
+        return self._snapshot
+
+
+class SessionStore:
+    """
+    Practice sessions kept in memory, optionally persisted to SQLite.
+
+    Each evaluation is folded into the session's RunningAnalytics as it
+    arrives, so the dashboard never re-reads the evaluations. At most
+    `max_sessions` stay in memory (least recently used dropped first);
+    with a `path` they are reloaded from SQLite on the next access,
+    without one they are gone.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_sessions: int = 1000, ignored_concepts: Iterable[str] = ()):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ignored_concepts = tuple(ignored_concepts)
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+
+        self._db = None
+        if path:
+            if path != ":memory:":
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    narrative TEXT,
+                    narrative_version INTEGER NOT NULL DEFAULT -1
+                )"""
+            )
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS session_evaluations (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    row TEXT NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                )"""
+            )
+
+    @classmethod
+    def from_env(cls, ignored_concepts: Iterable[str] = ()) -> "SessionStore":
+        return cls(
+            path=os.getenv("SESSION_STORE_PATH", "") or None,
+            max_sessions=int(os.getenv("SESSION_MAX_IN_MEMORY", "1000")),
+            ignored_concepts=ignored_concepts,
+        )
+
+    def _remember(self, session: Session):
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        if self._db is None:
+            return None
+        record = self._db.execute(
+            "SELECT created, updated, narrative, narrative_version FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if record is None:
+            return None
+        session = Session(session_id, self.ignored_concepts, created=record[0])
+        for (row,) in self._db.execute(
+            "SELECT row FROM session_evaluations WHERE session_id = ? ORDER BY seq", (session_id,)
+        ):
+            session.analytics.add_row(json.loads(row))
+        session.updated = record[1]
+        if record[2] is not None:
+            session.narrative = json.loads(record[2])
+            session.narrative_version = record[3]
+        self.loads += 1
+        return session
+
+    def _get(self, session_id: str) -> Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._load(session_id)
+            if session is None:
+                raise SessionNotFoundError(session_id)
+        self._remember(session)
+        return session
+
+    def create(self) -> str:
+        session = Session(uuid.uuid4().hex, self.ignored_concepts)
+        with self._lock:
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO sessions (id, created, updated) VALUES (?, ?, ?)",
+                    (session.id, session.created, session.updated),
+                )
+            self._remember(session)
+        return session.id
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            try:
+                self._get(session_id)
+            except SessionNotFoundError:
+                return False
+            return True
+
+    def append(self, session_id: str, evaluation: Dict) -> int:
+        """Fold one evaluation into the session; returns the new version."""
+        with self._lock:
+            session = self._get(session_id)
+            row = session.analytics.add(evaluation)
+            session.updated = time.time()
+            if self._db is not None:
+                self._db.execute("BEGIN")
+                self._db.execute(
+                    "INSERT INTO session_evaluations (session_id, seq, row) VALUES (?, ?, ?)",
+                    (session_id, session.version, json.dumps(row)),
+                )
+                self._db.execute("UPDATE sessions SET updated = ? WHERE id = ?", (session.updated, session_id))
+                self._db.execute("COMMIT")
+            return session.version
+
+    def dashboard(self, session_id: str) -> Tuple[Dict, int, Optional[Dict]]:
+        """`(analytics, version, narrative)`; the narrative is None when missing or stale."""
+        with self._lock:
+            session = self._get(session_id)
+            fresh = session.narrative_version == session.version
+            return session.snapshot(), session.version, session.narrative if fresh else None
+
+    def set_narrative(self, session_id: str, narrative: Dict, version: int):
+        """Store a narrative generated for `version`, unless a newer one is already stored."""
+        with self._lock:
+            session = self._get(session_id)
+            if version < session.narrative_version:
+                return
+            session.narrative = narrative
+            session.narrative_version = version
+            if self._db is not None:
+                self._db.execute(
+                    "UPDATE sessions SET narrative = ?, narrative_version = ? WHERE id = ?",
+                    (json.dumps(narrative), version, session_id),
+                )
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+            if self._db is not None:
+                self._db.execute("BEGIN")
+                deleted = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+                self._db.execute("DELETE FROM session_evaluations WHERE session_id = ?", (session_id,))
+                self._db.execute("COMMIT")
+                found = found or deleted > 0
+            return found
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {
+                "in_memory": len(self._sessions),
+                "max_in_memory": self.max_sessions,
+                "persistent": self._db is not None,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+            if self._db is not None:
+                stats["stored"] = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return stats
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,109 @@
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import numpy.typing as npt
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+from backend.metrics import DRAFT_ACCEPTED_TOKENS, DRAFT_TOKENS
+
+SPECULATIVE_MODES = ("off", "prompt_lookup", "draft_model")
+
+
+class GGUFDraftModel(LlamaDraftModel):
+    """
+    Drafts with a smaller GGUF sharing the evaluator's vocabulary.
+
+    The draft model decodes greedily; its KV cache keeps the longest common
+    prefix between calls, so each call only evaluates the tokens accepted
+    since the previous one.
+    """
+
+    def __init__(self, model: Llama, num_pred_tokens: int):
+        self.model = model
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids: npt.NDArray[np.intc], /, **kwargs) -> npt.NDArray[np.intc]:
+        drafted: List[int] = []
+        tokens = self.model.generate(input_ids.tolist(), top_k=1, temp=0.0, repeat_penalty=1.0)
+        try:
+            for token in tokens:
+                drafted.append(token)
+                if len(drafted) >= self.num_pred_tokens or token == self.model.token_eos():
+                    break
+        finally:
+            tokens.close()
+        return np.array(drafted, dtype=np.intc)
+
+
+class SpeculativeStats:
+    """Draft and acceptance counters shared by the drafters of every context bucket."""
+
+    def __init__(self, mode: str, draft_tokens: int):
+        self.mode = mode
+        self.draft_tokens = draft_tokens
+        self._lock = threading.Lock()
+        self.rounds = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    def record(self, drafted: int, accepted: int):
+        with self._lock:
+            self.rounds += 1
+            self.drafted += drafted
+            self.accepted += accepted
+        DRAFT_TOKENS.inc(drafted)
+        DRAFT_ACCEPTED_TOKENS.inc(accepted)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "draft_tokens": self.draft_tokens,
+                "rounds": self.rounds,
+                "drafted": self.drafted,
+                "accepted": self.accepted,
+                "acceptance_rate": round(self.accepted / self.drafted, 4) if self.drafted else 0.0,
+            }
+
+
+class CountingDraftModel(LlamaDraftModel):
+    """
+    Wraps a drafter to measure how many drafted tokens the evaluator accepts.
+
+    llama.cpp verifies a draft by sampling every drafted position from the
+    evaluator itself and keeping the drafted tokens up to the first
+    mismatch, so the output distribution is unchanged. The outcome of a
+    draft shows in the next call: the accepted tokens are the ones still in
+    place where the draft was written. The last draft of a completion is
+    not counted (call `begin()` before each completion).
+    """
+
+    def __init__(self, drafter: LlamaDraftModel, stats: SpeculativeStats):
+        self.drafter = drafter
+        self.stats = stats
+        self._pending: Optional[npt.NDArray[np.intc]] = None
+        self._pending_at = 0
+
+    def begin(self):
+        self._pending = None
+
+    def __call__(self, input_ids: npt.NDArray[np.intc], /, **kwargs) -> npt.NDArray[np.intc]:
+        if self._pending is not None and len(self._pending):
+            written = input_ids[self._pending_at:self._pending_at + len(self._pending)]
+            matches = written == self._pending[:len(written)]
+            accepted = int(np.argmin(matches)) if not matches.all() else len(written)
+            self.stats.record(len(self._pending), accepted)
+        draft = self.drafter(input_ids, **kwargs)
+        self._pending = draft
+        self._pending_at = len(input_ids)
+        return draft
+
+
+def make_drafter(mode: str, draft_tokens: int, ngram_size: int, draft_model: Optional[Llama]) -> LlamaDraftModel:
+    if mode == "prompt_lookup":
+        return LlamaPromptLookupDecoding(max_ngram_size=ngram_size, num_pred_tokens=draft_tokens)
+    if mode == "draft_model":
+        return GGUFDraftModel(draft_model, draft_tokens)
+    raise ValueError(f"Unknown speculative mode {mode!r}, expected one of {SPECULATIVE_MODES}")
@@ -0,0 +1,90 @@
+import json
+from typing import Any, List, Tuple
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for a streamed, flat JSON object.
+
+    Feed it text chunks as the model produces them; every call returns the
+    top-level `(key, value)` pairs whose values became complete in that
+    chunk. Nested lists/objects are returned whole once they close, so
+    `"missing_concepts": [...]` is emitted as soon as its `]` arrives.
+    """
+
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = "object"  # object -> key -> colon -> value
+        self._key_start = -1
+        self._value_start = -1
+        self._key = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        completed = []
+        for char in chunk:
+            index = len(self._buffer)
+            self._buffer.append(char)
+            if self.done:
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == "key":
+                        self._key = json.loads("".join(self._buffer[self._key_start:index + 1]))
+                        self._expect = "colon"
+                    elif self._depth == 1 and self._expect == "value":
+                        self._complete_value(index + 1, completed)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect == "key":
+                    self._key_start = index
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect = "key"
+            elif char in "}]":
+                if self._depth == 1:
+                    self._complete_value(index, completed)
+                    self.done = True
+                self._depth -= 1
+                if self._depth == 1:
+                    self._complete_value(index + 1, completed)
+            elif self._depth == 1:
+                if char == ":" and self._expect == "colon":
+                    self._expect = "value"
+                    self._value_start = index + 1
+                elif char == ",":
+                    self._complete_value(index, completed)
+                    self._expect = "key"
+        return completed
+
+    def _complete_value(self, end: int, completed: List[Tuple[str, Any]]):
+        """Decode the current value ending before `end`; scalars complete on `,` or `}`."""
+        if self._expect != "value" or self._key is None:
+            return
+        raw = "".join(self._buffer[self._value_start:end]).strip()
+        try:
+            completed.append((self._key, json.loads(raw)))
+        except json.JSONDecodeError:
+            pass
+        self._key = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._buffer)
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -1,9 +1,26 @@
 import tempfile
 import os
+import asyncio
 from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
 import PyPDF2
 
 
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size cap (maps to HTTP 413)."""
+
+
+def _count_pdf_pages(path: str) -> int:
+    """Worker: number of pages in the PDF at `path`."""
+    return len(PyPDF2.PdfReader(path).pages)
+
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> List[str]:
+    """Worker: text of pages [start, stop) of the PDF at `path`."""
+    pdf_reader = PyPDF2.PdfReader(path)
+    return [(pdf_reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
 class Tools:
     """Utility class for handling PDF and audio operations."""
 
@@ -23,22 +40,144 @@ class Tools:
         """
         try:
             pdf_reader = PyPDF2.PdfReader(file_obj)
-            text = ""
-
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n"
+            pages = [(page.extract_text() or "") + "\n" for page in pdf_reader.pages]
+            text = "".join(pages)
 
             if not text.strip():
                 raise ValueError("No text could be extracted from the PDF.")
 
             return text
 
-        except PyPDF2.PdfReadError as e:
+        except PyPDF2.errors.PdfReadError as e:
             raise ValueError(f"Failed to read PDF file: {str(e)}")
         except Exception as e:
             raise ValueError(f"Error extracting text from PDF: {str(e)}")
 
+    @staticmethod
+    async def spool_upload(upload, max_bytes: int, chunk_size: int = 1024 * 1024) -> str:
+        """
+        Copy an uploaded file to a temporary file on disk, chunk by chunk.
+
+        Args:
+            upload: A FastAPI UploadFile.
+            max_bytes (int): Size cap; larger uploads are rejected.
+            chunk_size (int): Bytes read per chunk.
+
+        Returns:
+            str: Path to the temporary file. The caller deletes it.
+
+        Raises:
+            UploadTooLargeError: If the upload exceeds `max_bytes`.
+        """
+        temp_file = tempfile.NamedTemporaryFile(
+            delete=False, suffix=Path(upload.filename or "").suffix, dir=tempfile.gettempdir()
+        )
+        size = 0
+        try:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(
+                        f"File exceeds the {max_bytes / (1024 * 1024):g} MB upload limit."
+                    )
+                temp_file.write(chunk)
+            temp_file.close()
+            return temp_file.name
+        except BaseException:
+            temp_file.close()
+            os.unlink(temp_file.name)
+            raise
+
+    @staticmethod
+    def resolve_page_range(
+        page_count: int, first_page: Optional[int] = None, last_page: Optional[int] = None
+    ) -> Tuple[int, int]:
+        """
+        Turn an optional 1-based, inclusive page range into [start, stop) indices.
+
+        Raises:
+            ValueError: If the range is empty or outside the document.
+        """
+        first = first_page or 1
+        last = page_count if last_page is None else last_page
+        if first < 1 or last > page_count or first > last:
+            raise ValueError(
+                f"Invalid page range {first}-{last} for a document with {page_count} pages."
+            )
+        return first - 1, last
+
+    @staticmethod
+    async def count_pdf_pages(path: str, run: Callable[..., Awaitable]) -> int:
+        """Count the pages of the PDF at `path`, running the parse through `run`."""
+        try:
+            return await run(_count_pdf_pages, path)
+        except PyPDF2.errors.PdfReadError as e:
+            raise ValueError(f"Failed to read PDF file: {str(e)}")
+
+    @staticmethod
+    async def iter_pdf_pages(
+        path: str,
+        start: int,
+        stop: int,
+        run: Callable[..., Awaitable],
+        pages_per_task: int = 8,
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Extract pages [start, stop) of the PDF at `path` in parallel.
+
+        The range is split into tasks of `pages_per_task` pages, all handed to
+        `run` (a process pool) at once; pages are yielded in order as
+        `(page_number, text)`, 1-based, as soon as their task finishes.
+
+        Raises:
+            ValueError: If the PDF is invalid or cannot be read.
+        """
+        tasks = [
+            asyncio.ensure_future(run(_extract_pdf_pages, path, i, min(i + pages_per_task, stop)))
+            for i in range(start, stop, pages_per_task)
+        ]
+        try:
+            page_number = start + 1
+            for task in tasks:
+                try:
+                    texts = await task
+                except PyPDF2.errors.PdfReadError as e:
+                    raise ValueError(f"Failed to read PDF file: {str(e)}")
+                for text in texts:
+                    yield page_number, text
+                    page_number += 1
+        finally:
+            # Client went away or a page failed: drop the tasks not started yet
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def extract_text_from_pdf_path(
+        path: str, start: int, stop: int, run: Callable[..., Awaitable], pages_per_task: int = 8
+    ) -> str:
+        """
+        Extract pages [start, stop) of the PDF at `path` in parallel.
+
+        Returns:
+            str: Extracted text, one line break after each page.
+
+        Raises:
+            ValueError: If the PDF is invalid or no text could be extracted.
+        """
+        pages = []
+        async for _, page_text in Tools.iter_pdf_pages(path, start, stop, run, pages_per_task):
+            pages.append(page_text)
+            pages.append("\n")
+        text = "".join(pages)
+
+        if not text.strip():
+            raise ValueError("No text could be extracted from the PDF.")
+
+        return text
+
     @staticmethod
     def save_temp_audio(audio_bytes):
         """
@@ -0,0 +1,415 @@
+"""
+Fast-path triage of student answers.
+
+Empty answers, "I don't know", keyboard mashing and gibberish score 0 by
+the evaluator's own rubric, so they are graded here in microseconds
+instead of by a full local generation. The checks are lexical: character
+trigram entropy, the share of recognizable words (common English words
+plus the question and document vocabulary) and the overlap with the
+question and document.
+
+Calibration against training/dataset.json (the real answers must pass,
+synthetic trivial answers built from it should be caught):
+
+    python -m backend.triage --output bench/triage.json
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from backend.metrics import TRIAGE_DECISIONS
+from backend.retrieval import tokenize
+
+DATASET_PATH = Path(__file__).parent.parent / "training" / "dataset.json"
+
+TRIAGE_RULES = ("empty", "dont_know", "repetitive", "gibberish", "off_topic")
+# off_topic is opt-in: correct paraphrases ("gates" for "gating mechanisms")
+# share no exact term with a short context, see the calibration report
+DEFAULT_TRIAGE_RULES = ("empty", "dont_know", "repetitive", "gibberish")
+
+# Feedback of the zero-score payload, per rule
+TRIAGE_FEEDBACK = {
+    "empty": "No answer was given.",
+    "dont_know": "The student stated that they do not know the answer.",
+    "repetitive": "The answer is repeated characters, not an answer.",
+    "gibberish": "The answer contains no recognizable words.",
+    "off_topic": "The answer shares no terms with the question or the course material.",
+}
+
+# The whole answer (punctuation aside) is one of these. No "pass", "skip"
+# or "n/a": each is a correct one-word answer somewhere ("Na" for sodium)
+DONT_KNOW_PATTERN = re.compile(
+    r"(?:i\s+)?(?:really\s+|just\s+)?(?:do\s+not|don'?t|dont)\s+know(?:\s+(?:the\s+answer|this|that|it))?"
+    r"|(?:i\s+have\s+)?no\s+(?:idea|clue)|(?:i'?m\s+|i\s+am\s+)?not\s+sure|idk|dunno"
+    r"|(?:io\s+)?non\s+(?:lo\s+)?so|boh",
+    re.IGNORECASE,
+)
+
+
+# Frequent English words, the "dictionary" next to the question and document terms
+COMMON_WORDS = frozenset("""
+a about above across after again against all almost also although always am among an and another any are around as at
+be because been before being below between both but by can cannot could did do does doing done down during each either
+else enough even every few first for from further get gets getting give given gives go goes going good got great had
+has have having he her here hers him his how however i if in into is it its itself just keep know known large last
+least less like likely little long made make makes making many may me might more most much must my need needs never
+new next no nor not now of off often on once one only or other others otherwise our out over own part per perhaps
+same second several she should show shows similar since small so some something sometimes such than that the their
+them then there therefore these they thing things this those though through thus to too two under until up upon us
+use used uses using usually very via was way ways we well were what when where whether which while who whom whose why
+will with within without would yes yet you your
+answer called cause causes change changes data different example function higher important input level low lower
+means method model models number output point problem process result results set simple step steps system term terms
+time type value values word words work works
+""".split())
+
+# Letter pairs that do not occur inside English words; "asdfgh", "zxcvb" and
+# random letters nearly always have one
+RARE_BIGRAMS = frozenset("""
+bq bx bz cb cg cj cp cq cv cw cx cz dq dx dz fb fd fg fh fj fk fm fq fv fw fx fz gj gk gq gv gw gx gz hj hq hv hx hz
+jb jc jd jf jg jh jj jk jl jm jn jp jq jr js jt jv jw jx jy jz kj kq kv kx kz lj lq lx lz mj mq mz nq nx pq pv px pz
+qw rq rx sx tq tx vb vc vd vf vh vj vk vn vp vq vt vw vx vz wj wq wv wx wz xj xk xq xv xz zb zc zd zf zg zj zp zq zr zv zx
+""".split())
+# Acronyms ("LSTM", "RLHF") have no vowel either, but are short
+ACRONYM_MAX_LETTERS = 5
+
+
+def unpronounceable(word: str) -> bool:
+    """Whether `word` (lowercase) is no English word, rather than one missing from the dictionary."""
+    if word.isalpha() and len(word) <= ACRONYM_MAX_LETTERS and not re.search(r"[aeiouy]", word):
+        # "dqn", "svm": possibly an acronym, left to the evaluator
+        return False
+    if any(word[i:i + 2] in RARE_BIGRAMS for i in range(len(word) - 1)):
+        return True
+    return word.isalpha() and not re.search(r"[aeiouy]", word)
+
+
+# Below this many letters the trigram entropy says nothing
+ENTROPY_MIN_LETTERS = 12
+
+
+def char_entropy(text: str) -> float:
+    """
+    Shannon entropy of the character trigrams over its maximum (0-1):
+    close to 1 for text, low for `aaaaaa` or `asdasdasd`.
+    """
+    letters = re.sub(r"[\W\d_]+", " ", text.lower()).strip()
+    trigrams = [letters[i:i + 3] for i in range(len(letters) - 2)]
+    if len(trigrams) < 2:
+        return 1.0
+    counts = Counter(trigrams)
+    total = len(trigrams)
+    entropy = -sum(n / total * math.log2(n / total) for n in counts.values())
+    return entropy / math.log2(total)
+
+
+def says_dont_know(student_answer: str) -> bool:
+    """Whether the whole answer, punctuation aside, is "I don't know" or the like."""
+    text = re.sub(r"[^\w\s'/]+", " ", student_answer.replace("’", "'"))
+    return bool(DONT_KNOW_PATTERN.fullmatch(" ".join(text.split())))
+
+
+def answer_features(question: str, student_answer: str, context_terms: Collection[str]) -> Dict:
+    """The lexical features the triage rules look at."""
+    words = tokenize(student_answer)
+    question_terms = set(tokenize(question))
+
+    def known(word: str) -> bool:
+        return word.isdigit() or word in COMMON_WORDS or word in question_terms or word in context_terms
+
+    content = [word for word in words if word not in COMMON_WORDS and not word.isdigit()]
+    unknown = [word for word in words if not known(word)]
+    return {
+        "chars": len(student_answer.strip()),
+        "words": len(words),
+        "content_words": len(content),
+        "letters": sum(c.isalpha() for c in student_answer),
+        "entropy": round(char_entropy(student_answer), 4),
+        "dictionary_rate": round(sum(map(known, words)) / len(words), 4) if words else 0.0,
+        # Unknown words that cannot be read aloud, so not a term the dictionary lacks
+        "unpronounceable_rate": round(
+            sum(map(unpronounceable, unknown)) / len(unknown), 4
+        ) if unknown else 0.0,
+        "overlap": round(
+            sum(word in question_terms or word in context_terms for word in content) / len(content), 4
+        ) if content else 0.0,
+    }
+
+
+class AnswerTriage:
+    """
+    Decides which answers get the zero-score payload without the evaluator.
+
+    Rules, in order (`rules` picks which run, off_topic is off by default):
+    - empty: no letter or digit at all
+    - dont_know: only "I don't know" or the like
+    - repetitive: 12 letters or more, trigram entropy below `min_entropy`
+    - gibberish: under `min_dictionary_rate` of the words recognizable,
+      none from the question or document, and half of the unknown ones (a
+      quarter from three words up) unpronounceable, so a correct term the
+      document lacks ("backpropagation") still reaches the evaluator
+    - off_topic: at least `off_topic_min_words` content words and none of
+      them from the question or document
+    """
+
+    def __init__(
+        self,
+        rules: Collection[str] = DEFAULT_TRIAGE_RULES,
+        min_entropy: float = 0.5,
+        min_dictionary_rate: float = 0.25,
+        off_topic_min_words: int = 6,
+    ):
+        unknown = set(rules) - set(TRIAGE_RULES)
+        if unknown:
+            raise ValueError(f"Unknown triage rules {sorted(unknown)}, expected some of {TRIAGE_RULES}")
+        self.rules = tuple(rule for rule in TRIAGE_RULES if rule in rules)
+        self.min_entropy = min_entropy
+        self.min_dictionary_rate = min_dictionary_rate
+        self.off_topic_min_words = off_topic_min_words
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    @classmethod
+    def from_env(cls) -> Optional["AnswerTriage"]:
+        """None when EVALUATOR_TRIAGE is 0."""
+        if os.getenv("EVALUATOR_TRIAGE", "1") != "1":
+            return None
+        rules = os.getenv("EVALUATOR_TRIAGE_RULES", ",".join(DEFAULT_TRIAGE_RULES))
+        return cls(
+            rules=[rule.strip() for rule in rules.split(",") if rule.strip()],
+            min_entropy=float(os.getenv("EVALUATOR_TRIAGE_MIN_ENTROPY", "0.5")),
+            min_dictionary_rate=float(os.getenv("EVALUATOR_TRIAGE_MIN_DICTIONARY_RATE", "0.25")),
+            off_topic_min_words=int(os.getenv("EVALUATOR_TRIAGE_OFF_TOPIC_MIN_WORDS", "6")),
+        )
+
+    def classify(self, question: str, student_answer: str, context_terms: Collection[str]) -> Tuple[Optional[str], Dict]:
+        """`(rule, features)`; the rule is None when the evaluator must grade the answer."""
+        features = answer_features(question, student_answer, context_terms)
+        for rule in self.rules:
+            if rule == "empty" and features["letters"] == 0 and not any(c.isdigit() for c in student_answer):
+                return rule, features
+            if rule == "dont_know" and says_dont_know(student_answer):
+                return rule, features
+            if rule == "repetitive" and features["letters"] >= ENTROPY_MIN_LETTERS and features["entropy"] < self.min_entropy:
+                return rule, features
+            if rule == "gibberish" and features["words"] and features["overlap"] == 0 and \
+                    features["dictionary_rate"] < self.min_dictionary_rate and \
+                    features["unpronounceable_rate"] >= (0.5 if features["words"] < 3 else 0.25):
+                return rule, features
+            if rule == "off_topic" and features["content_words"] >= self.off_topic_min_words and features["overlap"] == 0:
+                return rule, features
+        return None, features
+
+    def evaluate(self, question: str, student_answer: str, context_terms: Collection[str]) -> Optional[Dict]:
+        """The zero-score evaluation of a trivial answer, or None; the decision is counted."""
+        rule, features = self.classify(question, student_answer, context_terms)
+        outcome = rule or "evaluator"
+        with self._lock:
+            self.counts[outcome] += 1
+        TRIAGE_DECISIONS.inc(outcome=outcome)
+        if rule is None:
+            return None
+        return {
+            "score_30": 0,
+            "key_coverage": 0,
+            "missing_concepts": [],
+            "hallucinations": [],
+            "bias_check": False,
+            "feedback": TRIAGE_FEEDBACK[rule],
+            "triage": {"rule": rule, "features": features},
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            seen = sum(self.counts.values())
+            fast = seen - self.counts["evaluator"]
+            return {
+                "rules": list(self.rules),
+                "seen": seen,
+                "fast_path": fast,
+                "fast_path_rate": round(fast / seen, 4) if seen else 0.0,
+                "by_rule": {rule: self.counts[rule] for rule in self.rules},
+            }
+
+
+# Calibration ------------------------------------------------------------------
+
+# Terse correct answers; graded against no document terms (the worst case),
+# none of them may be triaged
+SHORT_ANSWERS = (
+    ("Which algorithm combined Q-learning with deep neural networks for Atari?", "DQN"),
+    ("Which model quantizes a VAE latent space with a learned codebook?", "VQ-VAE"),
+    ("How are gradients propagated through an unrolled RNN?", "BPTT"),
+    ("Which recurrent architecture uses input, forget and output gates?", "LSTM"),
+    ("Which method aligns language models with human preference rankings?", "RLHF"),
+    ("Which classifier maximizes the margin between classes?", "SVM"),
+    ("Which technique projects data onto the directions of maximum variance?", "PCA"),
+    ("Which divergence is symmetric and bounded, unlike KL?", "JS divergence"),
+    ("Which framework models sequential decisions with states, actions and rewards?", "MDP"),
+    ("Which optimizer updates weights from one mini-batch at a time?", "SGD"),
+    ("Which boosting library is popular for tabular data?", "XGBoost"),
+    ("Which algorithm computes the gradients of a neural network?", "Backpropagation"),
+    ("Which activation function outputs max(0, x)?", "ReLU"),
+    ("Which model learns word embeddings from their contexts?", "word2vec"),
+    ("Which visualization method preserves local neighbourhoods?", "t-SNE"),
+    ("What is the chemical symbol of sodium?", "Na"),
+    ("Which Python statement does nothing?", "pass"),
+    ("Which connections let a residual network bypass layers?", "skip"),
+)
+OFF_TOPIC_ANSWERS = (
+    "My favourite pizza is margherita with fresh basil and buffalo mozzarella from Naples.",
+    "Yesterday the football match ended with a late penalty and the fans celebrated downtown.",
+    "Please remember to water the tomatoes and feed the cat before leaving for holidays.",
+)
+DONT_KNOW_ANSWERS = ("I don't know", "idk", "No idea.", "I really don't know the answer", "not sure", "Non lo so")
+KEYBOARD_ROWS = ("qwertyuiop", "asdfghjkl", "zxcvbnm")
+
+
+def synthetic_trivial_answers(rng: random.Random) -> List[Tuple[str, str]]:
+    """`(kind, answer)` pairs that should all score 0."""
+    row = rng.choice(KEYBOARD_ROWS)
+    start = rng.randrange(len(row) - 4)
+    mash = row[start:start + rng.randint(3, 5)]
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    random_word = lambda: "".join(rng.choice(letters) for _ in range(rng.randint(5, 11)))
+    return [
+        ("empty", rng.choice(["", "   ", "\n", "...", "?"])),
+        ("dont_know", rng.choice(DONT_KNOW_ANSWERS)),
+        ("repetitive", rng.choice("abcxyz") * rng.randint(12, 40)),
+        ("repetitive", mash * rng.randint(3, 8)),
+        ("gibberish", random_word()),
+        ("gibberish", " ".join(random_word() for _ in range(rng.randint(2, 8)))),
+        ("off_topic", rng.choice(OFF_TOPIC_ANSWERS)),
+    ]
+
+
+def calibrate(triage: AnswerTriage, dataset: List[Dict], trivial_share: float, zero_band: int, seed: int) -> Dict:
+    """
+    Real answers and SHORT_ANSWERS measure false positives (how often a
+    graded answer would get a 0 it did not earn); synthetic trivial
+    answers measure recall.
+    """
+    rng = random.Random(seed)
+    real = {"answers": 0, "fast_path": 0, "fast_path_in_zero_band": 0, "by_rule": Counter(), "false_positives": []}
+    synthetic = {}
+    timings = []
+
+    short = {"answers": len(SHORT_ANSWERS), "false_positives": []}
+    for question, answer in SHORT_ANSWERS:
+        rule, features = triage.classify(question, answer, set())
+        if rule is not None:
+            short["false_positives"].append({"answer": answer, "rule": rule, "features": features})
+
+    for index, example in enumerate(dataset):
+        context_terms = set(tokenize(example["context"]))
+        target = json.loads(example["target_json"]).get("score_30")
+
+        started = time.perf_counter()
+        rule, features = triage.classify(example["question"], example["student_answer"], context_terms)
+        timings.append(time.perf_counter() - started)
+        real["answers"] += 1
+        if rule is not None:
+            real["fast_path"] += 1
+            real["by_rule"][rule] += 1
+            if isinstance(target, int) and target <= zero_band:
+                real["fast_path_in_zero_band"] += 1
+            else:
+                real["false_positives"].append({"index": index, "rule": rule, "target_score": target, "features": features})
+
+        for kind, answer in synthetic_trivial_answers(rng):
+            started = time.perf_counter()
+            rule, _ = triage.classify(example["question"], answer, context_terms)
+            timings.append(time.perf_counter() - started)
+            counts = synthetic.setdefault(kind, {"answers": 0, "caught": 0, "by_rule": Counter()})
+            counts["answers"] += 1
+            if rule is not None:
+                counts["caught"] += 1
+                counts["by_rule"][rule] += 1
+
+    n_real = real["answers"]
+    # Recall over the kinds of trivial answer the enabled rules are meant for
+    enabled = [counts for kind, counts in synthetic.items() if kind in triage.rules]
+    n_synthetic = sum(counts["answers"] for counts in enabled)
+    recall = sum(counts["caught"] for counts in enabled) / n_synthetic if n_synthetic else 0.0
+    false_positive_rate = len(real["false_positives"]) / n_real if n_real else 0.0
+    timings_us = sorted(t * 1e6 for t in timings)
+    return {
+        "meta": {
+            "rules": list(triage.rules),
+            "min_entropy": triage.min_entropy,
+            "min_dictionary_rate": triage.min_dictionary_rate,
+            "off_topic_min_words": triage.off_topic_min_words,
+            "zero_band": zero_band,
+            "trivial_share": trivial_share,
+            "seed": seed,
+        },
+        "summary": {
+            "real_answers": n_real,
+            "real_fast_path_rate": round(real["fast_path"] / n_real, 4) if n_real else 0.0,
+            "false_positive_rate": round(false_positive_rate, 4),
+            "short_answer_false_positives": len(short["false_positives"]),
+            "synthetic_answers": n_synthetic,
+            "synthetic_recall": round(recall, 4),
+            # Expected share of traffic answered without the evaluator, and
+            # how many of those answers really deserved a 0
+            "expected_offload": round(trivial_share * recall + (1 - trivial_share) * real["fast_path"] / max(n_real, 1), 4),
+            "expected_precision": round(
+                trivial_share * recall / (trivial_share * recall + (1 - trivial_share) * false_positive_rate), 4
+            ) if recall or false_positive_rate else None,
+            "classify_us_p50": round(timings_us[len(timings_us) // 2], 1) if timings_us else None,
+            "classify_us_p99": round(timings_us[int(len(timings_us) * 0.99)], 1) if timings_us else None,
+        },
+        "real": dict(real, by_rule=dict(real["by_rule"])),
+        "short_answers": short,
+        "synthetic": {
+            kind: {
+                "answers": counts["answers"],
+                "recall": round(counts["caught"] / counts["answers"], 4),
+                "by_rule": dict(counts["by_rule"]),
+            }
+            for kind, counts in synthetic.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the answer triage on training/dataset.json")
+    parser.add_argument("--dataset", default=str(DATASET_PATH))
+    parser.add_argument("--trivial-share", type=float, default=0.1,
+                        help="assumed share of trivial answers in real traffic, for the offload estimate")
+    parser.add_argument("--zero-band", type=int, default=5,
+                        help="target scores up to this count as correctly sent to the fast path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    # Same settings as the server (EVALUATOR_TRIAGE_* variables), even when disabled there
+    os.environ["EVALUATOR_TRIAGE"] = "1"
+    triage = AnswerTriage.from_env()
+    dataset = json.loads(Path(args.dataset).read_text(encoding="utf-8"))
+    report = calibrate(triage, dataset, args.trivial_share, args.zero_band, args.seed)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"💾 Report written to {args.output}")
+    print(json.dumps({"summary": report["summary"], "synthetic": report["synthetic"]}, indent=2))
+    for false_positive in report["short_answers"]["false_positives"]:
+        print(f"⚠️ Short answer {false_positive['answer']!r} sent to the fast path by {false_positive['rule']}")
+    for false_positive in report["real"]["false_positives"][:10]:
+        print(f"⚠️ Example {false_positive['index']} (target {false_positive['target_score']}) "
+              f"sent to the fast path by {false_positive['rule']}: {false_positive['features']}")
+
+
+if __name__ == "__main__":
+    main()
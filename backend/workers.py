@@ -0,0 +1,434 @@
+import os
+import time
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# EduAgents methods a worker serves; True for generators, relayed item by item
+WORKER_METHODS = {"evaluate_answer": False, "evaluate_batch": False, "stream_evaluation": True}
+
+# Calibration job: prefill then greedy decode, roughly the shape of an evaluation
+CALIBRATION_PROMPT_TOKENS = 512
+CALIBRATION_DECODE_TOKENS = 64
+
+
+class WorkerError(Exception):
+    """An evaluator worker could not be started or could not run a job."""
+
+
+class WorkerCrashedError(WorkerError):
+    """The worker process died (e.g. a crash inside llama.cpp) while running a job."""
+
+
+def _calibrate(agents) -> float:
+    """Seconds for one prefill + decode run on the loaded evaluator."""
+    agents._ensure_evaluator()
+    model = agents.evaluator_model
+    sample = model.tokenize(b"The student explains how the concept works and why it matters.", add_bos=False)
+    prompt = [model.token_bos()] + (sample * CALIBRATION_PROMPT_TOKENS)[:CALIBRATION_PROMPT_TOKENS - 1]
+    started = time.perf_counter()
+    model.reset()
+    agents._prefill(prompt)
+    for _ in range(CALIBRATION_DECODE_TOKENS):
+        model.eval([model.sample(top_k=1, temp=0.0)])
+    return time.perf_counter() - started
+
+
+def _worker_main(conn, index: int, cpus: List[int], threads: int, model_path: str, max_ctx: Optional[int], warm_up: bool):
+    """
+    Entry point of a worker process: one EduAgents with its own evaluator.
+
+    Requests are `("call", job_id, method, args, kwargs)`; replies are
+    `(kind, job_id, payload)` with kind `result`, `item`, `done` or `error`.
+    A streamed job stops early when `("cancel", job_id)` arrives.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    os.environ["EVALUATOR_N_THREADS"] = str(threads)
+    try:
+        from backend.agents import EduAgents
+
+        agents = EduAgents().with_model(Path(model_path), max_ctx)
+        if warm_up:
+            agents.warm_up()
+    except Exception as e:
+        conn.send(("failed", index, f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", index, os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        kind, job_id = message[0], message[1]
+        if kind == "stop":
+            return
+        if kind == "cancel":
+            # The job it was meant for already finished
+            continue
+        try:
+            if kind == "calibrate":
+                conn.send(("result", job_id, _calibrate(agents)))
+                continue
+            _, _, method, args, kwargs = message
+            if not WORKER_METHODS[method]:
+                conn.send(("result", job_id, getattr(agents, method)(*args, **kwargs)))
+                continue
+            generator = getattr(agents, method)(*args, **kwargs)
+            try:
+                for item in generator:
+                    conn.send(("item", job_id, item))
+                    if conn.poll() and conn.recv() == ("cancel", job_id):
+                        break
+            finally:
+                generator.close()
+            conn.send(("done", job_id, None))
+        except Exception as e:
+            try:
+                conn.send(("error", job_id, e))
+            except Exception:
+                # Not picklable: send what it said
+                conn.send(("error", job_id, WorkerError(f"{type(e).__name__}: {e}")))
+
+
+class _Worker:
+    def __init__(self, index: int, cpus: List[int]):
+        self.index = index
+        self.cpus = cpus
+        self.process = None
+        self.conn = None
+        self.pid: Optional[int] = None
+        # starting -> idle <-> busy; a crash goes to restarting, a failed start to failed
+        self.state = "starting"
+        self.affinity: Optional[int] = None
+        self.jobs = 0
+        self.busy_s = 0.0
+        self.crashes = 0
+
+    def stats(self) -> Dict:
+        return {
+            "index": self.index,
+            "pid": self.pid,
+            "cpus": self.cpus,
+            "state": self.state,
+            "jobs": self.jobs,
+            "busy_s": round(self.busy_s, 3),
+            "crashes": self.crashes,
+        }
+
+
+class EvaluatorPool:
+    """
+    Evaluator worker processes, each with its own EduAgents and Llama.
+
+    The GGUF is memory-mapped, so the workers share the weight pages; each
+    keeps its own KV cache, prompt-state RAM cache and context buckets.
+    Worker `i` is pinned to its own slice of `threads` cores. Jobs go to an
+    idle worker, preferring the one that last served the same context (its
+    KV cache still holds that prefix), then the least busy one; when every
+    worker is busy they wait in the API's evaluator queue.
+
+    `workers` and `threads` are numbers or None for automatic: with one of
+    them fixed the other fills the available cores; with both automatic
+    every split (threads a power of two, at most `max_workers` workers) is
+    timed on a short calibration job and the best aggregate throughput wins.
+
+    A worker that dies fails only its current job and is restarted in the
+    background.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        threads: Optional[int] = None,
+        max_workers: int = 8,
+        pin_cpus: bool = True,
+        warm_up: bool = True,
+        start_timeout: float = 300,
+    ):
+        self.cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.requested = (workers, threads)
+        self.max_workers = max_workers
+        self.pin_cpus = pin_cpus
+        self.warm_up = warm_up
+        self.start_timeout = start_timeout
+        self.threads = 0
+        self.calibration: List[Dict] = []
+        self.model_path: Optional[str] = None
+        self.max_ctx: Optional[int] = None
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[_Worker] = []
+        self._available = threading.Condition()
+        self._job_ids = itertools.count()
+        self._closed = False
+
+    @classmethod
+    def from_env(cls) -> Optional["EvaluatorPool"]:
+        """The pool configured by EVALUATOR_WORKERS, or None for the in-process evaluator."""
+        workers = os.getenv("EVALUATOR_WORKERS", "0")
+        if workers in ("", "0"):
+            return None
+        threads = os.getenv("EVALUATOR_THREADS_PER_WORKER", "auto")
+        return cls(
+            workers=None if workers == "auto" else int(workers),
+            threads=None if threads == "auto" else int(threads),
+            max_workers=int(os.getenv("EVALUATOR_MAX_WORKERS", "8")),
+            pin_cpus=os.getenv("EVALUATOR_PIN_CPUS", "1") == "1",
+            warm_up=os.getenv("EVALUATOR_WARMUP", "1") == "1",
+            start_timeout=float(os.getenv("EVALUATOR_WORKER_START_TIMEOUT", "300")),
+        )
+
+    @property
+    def size(self) -> int:
+        return len(self._workers)
+
+    def candidate_splits(self) -> List[Tuple[int, int]]:
+        """`(workers, threads)` splits of the available cores worth trying."""
+        cores = len(self.cpus)
+        workers, threads = self.requested
+        if workers and threads:
+            return [(workers, threads)]
+        if workers:
+            return [(workers, max(1, cores // workers))]
+        if threads:
+            return [(max(1, min(self.max_workers, cores // threads)), threads)]
+        splits = []
+        for t in sorted({2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores} | {cores}):
+            if cores // t <= self.max_workers:
+                splits.append((cores // t, t))
+        return splits or [(self.max_workers, max(1, cores // self.max_workers))]
+
+    def _slice(self, index: int, threads: int) -> List[int]:
+        if not self.pin_cpus:
+            return []
+        # Wraps around when the split asks for more threads than cores
+        return sorted({self.cpus[(index * threads + j) % len(self.cpus)] for j in range(threads)})
+
+    def _spawn(self, worker: _Worker, threads: int, warm_up: bool):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, worker.index, worker.cpus, threads, self.model_path, self.max_ctx, warm_up),
+            name=f"evaluator-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        try:
+            if not parent_conn.poll(self.start_timeout):
+                raise WorkerError(f"evaluator worker {worker.index} did not start in {self.start_timeout:.0f}s")
+            reply = parent_conn.recv()
+        except (EOFError, OSError):
+            reply = ("failed", worker.index, f"exit code {process.exitcode}")
+        except WorkerError:
+            process.kill()
+            raise
+        if reply[0] != "ready":
+            process.join(5)
+            raise WorkerError(f"evaluator worker {worker.index} failed to start: {reply[2]}")
+        worker.process, worker.conn, worker.pid = process, parent_conn, reply[2]
+        worker.affinity = None
+
+    def _start_workers(self, count: int, threads: int, warm_up: bool) -> List[_Worker]:
+        workers = [_Worker(i, self._slice(i, threads)) for i in range(count)]
+        with ThreadPoolExecutor(max_workers=count) as starter:
+            outcomes = list(starter.map(lambda w: self._try(self._spawn, w, threads, warm_up), workers))
+        errors = [error for error in outcomes if error is not None]
+        if errors:
+            self._stop_workers(workers)
+            raise errors[0]
+        return workers
+
+    @staticmethod
+    def _try(fn, *args) -> Optional[Exception]:
+        try:
+            fn(*args)
+        except Exception as e:
+            return e
+        return None
+
+    @staticmethod
+    def _stop_workers(workers: List[_Worker]):
+        for worker in workers:
+            if worker.conn is not None:
+                try:
+                    worker.conn.send(("stop", None))
+                except OSError:
+                    pass
+        for worker in workers:
+            if worker.process is not None:
+                worker.process.join(5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+                worker.conn.close()
+
+    def _measure(self, count: int, threads: int) -> float:
+        """Aggregate calibration jobs per second of `count` workers with `threads` each."""
+        workers = self._start_workers(count, threads, warm_up=False)
+        try:
+            started = time.perf_counter()
+            for worker in workers:
+                worker.conn.send(("calibrate", None))
+            for worker in workers:
+                kind, _, payload = worker.conn.recv()
+                if kind == "error":
+                    raise payload
+            return count / (time.perf_counter() - started)
+        finally:
+            self._stop_workers(workers)
+
+    def start(self, model_path: str, max_ctx: Optional[int] = None):
+        """Choose the split (calibrating if needed) and start the workers; blocking."""
+        self.model_path = str(model_path)
+        self.max_ctx = max_ctx
+        splits = self.candidate_splits()
+        if len(splits) > 1:
+            logger.info(f"📐 Calibrating evaluator workers on {len(self.cpus)} cores: {splits}")
+            for count, threads in splits:
+                jobs_per_s = self._measure(count, threads)
+                self.calibration.append({"workers": count, "threads": threads, "jobs_per_s": round(jobs_per_s, 3)})
+                logger.info(f"📐 {count} workers x {threads} threads: {jobs_per_s:.3f} jobs/s")
+            best = max(self.calibration, key=lambda result: result["jobs_per_s"])
+            splits = [(best["workers"], best["threads"])]
+
+        count, self.threads = splits[0]
+        workers = self._start_workers(count, self.threads, self.warm_up)
+        with self._available:
+            self._workers = workers
+            for worker in workers:
+                worker.state = "idle"
+            self._available.notify_all()
+        logger.info(f"👷 Started {count} evaluator workers x {self.threads} threads")
+
+    def _acquire(self, args: tuple) -> _Worker:
+        affinity = hash(args[0]) if args and isinstance(args[0], str) else None
+        with self._available:
+            while True:
+                if self._closed:
+                    raise WorkerError("evaluator pool is shut down")
+                if self._workers and all(worker.state == "failed" for worker in self._workers):
+                    raise WorkerError("every evaluator worker failed to restart")
+                idle = [worker for worker in self._workers if worker.state == "idle"]
+                if idle:
+                    worker = min(idle, key=lambda w: (w.affinity != affinity, w.busy_s))
+                    worker.state = "busy"
+                    worker.affinity = affinity
+                    return worker
+                self._available.wait()
+
+    def _release(self, worker: _Worker, started: float):
+        with self._available:
+            worker.jobs += 1
+            worker.busy_s += time.perf_counter() - started
+            if worker.state == "busy":
+                worker.state = "idle"
+            self._available.notify()
+
+    def _crashed(self, worker: _Worker) -> WorkerCrashedError:
+        worker.process.join(1)
+        exit_code = worker.process.exitcode
+        with self._available:
+            worker.crashes += 1
+            worker.state = "restarting"
+        logger.error(f"💥 Evaluator worker {worker.index} (pid {worker.pid}) died with exit code {exit_code}, restarting")
+        threading.Thread(target=self._restart, args=(worker,), daemon=True).start()
+        return WorkerCrashedError(f"evaluator worker {worker.index} died (exit code {exit_code})")
+
+    def _restart(self, worker: _Worker):
+        worker.conn.close()
+        try:
+            self._spawn(worker, self.threads, self.warm_up)
+        except Exception as e:
+            logger.error(f"❌ Evaluator worker {worker.index} could not be restarted: {str(e)}")
+            state = "failed"
+        else:
+            logger.info(f"👷 Evaluator worker {worker.index} restarted (pid {worker.pid})")
+            state = "idle"
+        with self._available:
+            worker.state = state
+            self._available.notify_all()
+
+    def _receive(self, worker: _Worker, job_id: int) -> Tuple[str, Any]:
+        while True:
+            try:
+                kind, reply_id, payload = worker.conn.recv()
+            except (EOFError, OSError):
+                raise self._crashed(worker) from None
+            if reply_id == job_id:
+                return kind, payload
+
+    def _send(self, worker: _Worker, message: tuple):
+        try:
+            worker.conn.send(message)
+        except OSError:
+            raise self._crashed(worker) from None
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        """Run `EduAgents.<method>(*args, **kwargs)` on a worker; blocking."""
+        worker = self._acquire(args)
+        started = time.perf_counter()
+        job_id = next(self._job_ids)
+        try:
+            self._send(worker, ("call", job_id, method, args, kwargs))
+            kind, payload = self._receive(worker, job_id)
+            if kind == "error":
+                raise payload
+            return payload
+        finally:
+            self._release(worker, started)
+
+    def stream(self, method: str, *args, **kwargs) -> Iterator:
+        """Iterate the generator `EduAgents.<method>(*args, **kwargs)` running on a worker."""
+        worker = self._acquire(args)
+        started = time.perf_counter()
+        job_id = next(self._job_ids)
+        finished = False
+        try:
+            self._send(worker, ("call", job_id, method, args, kwargs))
+            while True:
+                kind, payload = self._receive(worker, job_id)
+                if kind == "item":
+                    yield payload
+                    continue
+                finished = True
+                if kind == "error":
+                    raise payload
+                return
+        except WorkerCrashedError:
+            finished = True
+            raise
+        finally:
+            if not finished:
+                # Closed early: stop the worker's generator and wait for it to wind down
+                try:
+                    self._send(worker, ("cancel", job_id))
+                    while self._receive(worker, job_id)[0] == "item":
+                        pass
+                except WorkerCrashedError:
+                    pass
+            self._release(worker, started)
+
+    def stats(self) -> Dict:
+        with self._available:
+            return {
+                "workers": self.size,
+                "threads_per_worker": self.threads,
+                "cpus": len(self.cpus),
+                "pinned": self.pin_cpus,
+                "calibration": self.calibration,
+                "per_worker": [worker.stats() for worker in self._workers],
+            }
+
+    def shutdown(self):
+        with self._available:
+            self._closed = True
+            workers = [worker for worker in self._workers if worker.state in ("idle", "busy")]
+            self._available.notify_all()
+        self._stop_workers(workers)
@@ -32,8 +32,8 @@ const ConversationalDashboard: React.FC = () => {
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState<string | null>(null);
 
-    // Document data
-    const [pdfText, setPdfText] = useState('');
+    // Document data (the text stays on the server, referenced by doc_id)
+    const [docId, setDocId] = useState('');
     const [topics, setTopics] = useState<string[]>([]);
     const [summary, setSummary] = useState('');
 
@@ -46,6 +46,7 @@ const ConversationalDashboard: React.FC = () => {
     const [currentQuestion, setCurrentQuestion] = useState('');
     const [currentAnswer, setCurrentAnswer] = useState('');
     const [evaluations, setEvaluations] = useState<Evaluation[]>([]);
+    const [sessionId, setSessionId] = useState<string | null>(null);
 
     // Speech-to-text
     const [isRecording, setIsRecording] = useState(false);
@@ -63,12 +64,12 @@ const ConversationalDashboard: React.FC = () => {
 
         try {
             // Upload PDF
-            const uploadRes = await axios.post(`${API_URL}/upload`, formData);
-            const text = uploadRes.data.text;
-            setPdfText(text);
+            const uploadRes = await axios.post(`${API_URL}/upload?include_text=false`, formData);
+            const uploadedDocId = uploadRes.data.doc_id;
+            setDocId(uploadedDocId);
 
             // Analyze document
-            const analyzeRes = await axios.post(`${API_URL}/analyze-document`, { text });
+            const analyzeRes = await axios.post(`${API_URL}/analyze-document`, { doc_id: uploadedDocId });
             setTopics(analyzeRes.data.topics);
             setSummary(analyzeRes.data.summary);
             setSelectedDifficulty(analyzeRes.data.suggested_difficulty);
@@ -92,11 +93,18 @@ const ConversationalDashboard: React.FC = () => {
         setError(null);
 
         try {
+            // Evaluations are collected server-side for the dashboard, and the
+            // server generates the next questions while the student answers
+            const sessionRes = await axios.post(`${API_URL}/sessions`);
+            setSessionId(sessionRes.data.session_id);
+
             const res = await axios.post(`${API_URL}/generate-question`, {
-                context: pdfText,
+                doc_id: docId,
                 topic: selectedTopic,
                 difficulty: selectedDifficulty,
-                question_number: 1
+                question_number: 1,
+                total_questions: 3,
+                session_id: sessionRes.data.session_id
             });
 
             setCurrentQuestion(res.data.question);
@@ -121,9 +129,10 @@ const ConversationalDashboard: React.FC = () => {
 
         try {
             const res = await axios.post(`${API_URL}/evaluate`, {
-                context: pdfText,
+                doc_id: docId,
                 question: currentQuestion,
-                student_answer: currentAnswer
+                student_answer: currentAnswer,
+                session_id: sessionId
             });
 
             const evaluation: Evaluation = res.data;
@@ -133,10 +142,12 @@ const ConversationalDashboard: React.FC = () => {
             if (currentQuestionNumber < 3) {
                 // Generate next question
                 const nextRes = await axios.post(`${API_URL}/generate-question`, {
-                    context: pdfText,
+                    doc_id: docId,
                     topic: selectedTopic,
                     difficulty: selectedDifficulty,
-                    question_number: currentQuestionNumber + 1
+                    question_number: currentQuestionNumber + 1,
+                    total_questions: 3,
+                    session_id: sessionId
                 });
 
                 setCurrentQuestion(nextRes.data.question);
@@ -193,7 +204,7 @@ const ConversationalDashboard: React.FC = () => {
     // Restart quiz
     const handleRestart = () => {
         setStep(1);
-        setPdfText('');
+        setDocId('');
         setTopics([]);
         setSummary('');
         setSelectedTopic('');
@@ -202,6 +213,7 @@ const ConversationalDashboard: React.FC = () => {
         setCurrentQuestion('');
         setCurrentAnswer('');
         setEvaluations([]);
+        setSessionId(null);
         setError(null);
     };
 
@@ -380,7 +392,7 @@ const ConversationalDashboard: React.FC = () => {
 
             {/* Step 4: Full Dashboard */}
             {step === 4 && (
-                <EvaluationDashboard evaluations={evaluations} onRestart={handleRestart} />
+                <EvaluationDashboard evaluations={evaluations} sessionId={sessionId} onRestart={handleRestart} />
             )}
         </div>
     );
@@ -27,19 +27,23 @@ interface DashboardData {
 
 interface Props {
     evaluations: Evaluation[];
+    sessionId?: string | null;
     onRestart: () => void;
 }
 
-const EvaluationDashboard: React.FC<Props> = ({ evaluations, onRestart }) => {
+const EvaluationDashboard: React.FC<Props> = ({ evaluations, sessionId, onRestart }) => {
     const [dashboardData, setDashboardData] = useState<DashboardData | null>(null);
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
         const fetchDashboard = async () => {
             try {
-                const res = await axios.post(`${API_URL}/generate-dashboard`, {
-                    evaluations: evaluations
-                });
+                // A server-side session already holds the evaluations and their aggregates
+                const res = sessionId
+                    ? await axios.get(`${API_URL}/sessions/${sessionId}/dashboard`)
+                    : await axios.post(`${API_URL}/generate-dashboard`, {
+                        evaluations: evaluations
+                    });
                 setDashboardData(res.data);
             } catch (error) {
                 console.error('Failed to generate dashboard:', error);
@@ -59,7 +63,7 @@ const EvaluationDashboard: React.FC<Props> = ({ evaluations, onRestart }) => {
         };
 
         fetchDashboard();
-    }, [evaluations]);
+    }, [evaluations, sessionId]);
 
     if (loading || !dashboardData) {
         return (